@@ -0,0 +1,279 @@
+##########################################################
+#	File: Analysis.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Looks at the metrics (see Metrics.py) of many runs at once, e.g. every point of a sweep (see Sweep.py)
+#	or every replicate of an ensemble (see Ensemble.py), as one table of
+#	(run, parameters, MCS, value of the plots).
+#
+#	Nothing is loaded when the runs are found, only their headers and the parameters each one was run with
+#	(run.json, saved next to its metrics by Sweep.run_point). The values are read straight from the
+#	metrics files CHUNK_ROWS MCS at a time, so only one chunk of every run is in memory no matter
+#	how many runs or MCS there are.
+#
+#	runs = find_runs('sweep')
+#	for key, group in runs.groups(['CD28_THRESHOLD']).items():
+#		summary = group.aggregate(['TOTAL_TCONV_ACTIVE'])
+#		times = group.time_to('TOTAL_TCONV_ACTIVE', 1)
+#
+#	Usage (from this folder):
+#		python Analysis.py <runs folder> [output folder] [parameters to group by, comma separated]
+#	saves the mean, standard deviation and quantiles of every value over the runs of each group
+#	(same format as the metrics) and prints how long each group took to activate a TCONV.
+#
+##########################################################
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import numpy
+
+import Config
+import Metrics
+
+# Where every run says how it was run (see Sweep.run_point)
+RUN_FILE = 'run.json'
+
+# MCS of every run read at a time
+CHUNK_ROWS = 4096
+
+# Quantiles computed over the runs at every MCS
+QUANTILES = (0.05, 0.5, 0.95)
+
+# Value (and how much of it) that means the run activated, used by time_to
+ACTIVATION_METRIC = 'TOTAL_TCONV_ACTIVE'
+ACTIVATION_THRESHOLD = 1
+
+def hashable(value):
+    # Parameters can be lists (e.g. WEIGHTS_CD80), groups need them as tuples
+    if isinstance(value, list):
+        return tuple(hashable(item) for item in value)
+    return value
+
+def quantile_suffix(quantile):
+    # 0.05 -> _Q5, 0.025 -> _Q2.5
+    percent = round(quantile * 100, 6)
+    return '_Q' + (str(int(percent)) if percent == int(percent) else str(percent))
+
+##########################################################
+#	Run
+#
+#	The metrics of one run, opened the first time they are needed.
+##########################################################
+class Run(object):
+    def __init__(self, name, path, parameters=None, seed=None):
+        self.name = name
+        self.path = path
+        self.parameters = parameters or {}
+        self.seed = seed
+        self.reader = None
+
+    def metrics(self):
+        if self.reader is None:
+            self.reader = Metrics.MetricReader(self.path)
+        return self.reader
+
+    def __len__(self):
+        return len(self.metrics())
+
+    def column(self, name, start=0, stop=None):
+        # Memory-mapped, only the rows [start, stop) are read when used
+        return self.metrics().column(name)[start:stop]
+
+def read_run(folder, name):
+    # The run inside a folder, with its parameters if it says them
+    # Sweeps made before run.json existed still have them inside sweep.json
+    parameters = {}
+    seed = None
+    run_file = os.path.join(folder, RUN_FILE)
+    sweep_file = os.path.join(os.path.dirname(folder), 'sweep.json')
+    point = os.path.basename(folder)
+    if os.path.isfile(run_file):
+        with open(run_file) as description:
+            run = json.load(description)
+        parameters = run.get('parameters', {})
+        seed = run.get('seed')
+    elif point.startswith('point_') and os.path.isfile(sweep_file):
+        with open(sweep_file) as description:
+            points = json.load(description)['points']
+        index = int(point[len('point_'):])
+        if index < len(points):
+            parameters = points[index]
+
+    return Run(name, os.path.join(folder, Config.METRICS_FILE), parameters, seed)
+
+def find_runs(*roots):
+    # Every folder under the roots with metrics inside, in order of name
+    runs = []
+    for root in roots:
+        for folder, folders, files in os.walk(root):
+            folders.sort()
+            if os.path.isfile(os.path.join(folder, Config.METRICS_FILE, 'header.json')):
+                runs.append(read_run(folder, os.path.relpath(folder, root)))
+    return RunTable(runs)
+
+##########################################################
+#	Summary
+#
+#	Values over the runs at every MCS: how many runs got there, mean, standard deviation and quantiles.
+##########################################################
+class Summary(object):
+    def __init__(self, mcs, count, metrics, quantiles):
+        self.mcs = mcs
+        self.count = count
+        self.metrics = list(metrics)
+        self.quantiles = tuple(quantiles)
+        # Metric -> values at every MCS, quantiles have one column per quantile
+        self.mean = {}
+        self.std = {}
+        self.quantile = {}
+
+    def columns(self):
+        return ['MCS', 'RUNS'] + [name + suffix for name in self.metrics
+                                  for suffix in ['_MEAN', '_STD'] + [quantile_suffix(q) for q in self.quantiles]]
+
+    def save(self, path):
+        writer = Metrics.MetricWriter(path, self.columns())
+        values = [self.mcs, self.count]
+        for name in self.metrics:
+            values += [self.mean[name], self.std[name]] + [self.quantile[name][:, index] for index in range(len(self.quantiles))]
+        for row in numpy.column_stack(values):
+            writer.append(row)
+        writer.close()
+
+##########################################################
+#	RunTable
+##########################################################
+class RunTable(object):
+    def __init__(self, runs):
+        self.runs = list(runs)
+
+    def __len__(self):
+        return len(self.runs)
+
+    def parameters(self):
+        # Names of every parameter changed by some run
+        return sorted(set(name for run in self.runs for name in run.parameters))
+
+    def select(self, **values):
+        # The runs with these values of the parameters
+        return RunTable(run for run in self.runs
+                        if all(hashable(run.parameters.get(name)) == hashable(value) for name, value in values.items()))
+
+    def groups(self, names):
+        # Values of the parameters -> runs with those values
+        groups = OrderedDict()
+        for run in self.runs:
+            key = tuple(hashable(run.parameters.get(name)) for name in names)
+            groups.setdefault(key, []).append(run)
+        return OrderedDict((key, RunTable(runs)) for key, runs in groups.items())
+
+    def rows(self):
+        # MCS of the longest run
+        return max(len(run) for run in self.runs) if self.runs else 0
+
+    def mcs(self):
+        if not self.runs:
+            return numpy.zeros(0)
+        return numpy.array(max(self.runs, key=len).column('MCS'))
+
+    def chunks(self, metrics, chunk_rows=None):
+        # (first row, metric -> values of every run in those rows) for every chunk of rows
+        # Runs that stopped earlier than others are NaN after they stopped
+        chunk_rows = chunk_rows or CHUNK_ROWS
+        lengths = [len(run) for run in self.runs]
+        for start in range(0, self.rows(), chunk_rows):
+            stop = min(start + chunk_rows, self.rows())
+            values = {}
+            for name in metrics:
+                block = numpy.full((len(self.runs), stop - start), numpy.nan)
+                for index, run in enumerate(self.runs):
+                    if lengths[index] > start:
+                        part = run.column(name, start, stop)
+                        block[index, :len(part)] = part
+                values[name] = block
+            yield start, values
+
+    def records(self, metrics=None, chunk_rows=None):
+        # The whole table one chunk at a time, one row per run and MCS:
+        # column -> values, with RUN (index of the run), MCS, every parameter and every metric
+        metrics = list(Metrics.COLUMNS[1:] if metrics is None else metrics)
+        chunk_rows = chunk_rows or CHUNK_ROWS
+        parameters = self.parameters()
+        for index, run in enumerate(self.runs):
+            for start in range(0, len(run), chunk_rows):
+                stop = min(start + chunk_rows, len(run))
+                rows = stop - start
+                record = OrderedDict([('RUN', numpy.full(rows, index)), ('MCS', numpy.array(run.column('MCS', start, stop)))])
+                for name in parameters:
+                    record[name] = [run.parameters.get(name)] * rows
+                for name in metrics:
+                    record[name] = numpy.array(run.column(name, start, stop))
+                yield record
+
+    def aggregate(self, metrics=None, quantiles=QUANTILES, chunk_rows=None):
+        # Summary of the runs at every MCS, computed one chunk of rows at a time
+        metrics = list(Metrics.COLUMNS[1:] if metrics is None else metrics)
+        rows = self.rows()
+        summary = Summary(self.mcs(), numpy.zeros(rows), metrics, quantiles)
+        for name in metrics:
+            summary.mean[name] = numpy.zeros(rows)
+            summary.std[name] = numpy.zeros(rows)
+            summary.quantile[name] = numpy.zeros((rows, len(quantiles)))
+
+        # One metric at a time so only runs x chunk_rows values are in memory
+        for name in metrics:
+            for start, values in self.chunks([name], chunk_rows):
+                block = values[name]
+                stop = start + block.shape[1]
+                present = ~numpy.isnan(block)
+                count = present.sum(axis=0)
+                summary.count[start:stop] = count
+                mean = numpy.nanmean(block, axis=0)
+                squares = numpy.nansum((block - mean) ** 2, axis=0)
+                summary.mean[name][start:stop] = mean
+                summary.std[name][start:stop] = numpy.sqrt(squares / numpy.maximum(count - 1, 1))
+                if quantiles:
+                    summary.quantile[name][start:stop] = numpy.nanpercentile(block, [100 * q for q in quantiles], axis=0).T
+        return summary
+
+    def time_to(self, metric=ACTIVATION_METRIC, threshold=ACTIVATION_THRESHOLD, chunk_rows=None):
+        # First MCS every run had at least threshold of the metric (NaN if it never did)
+        # Each run is only read until it gets there
+        chunk_rows = chunk_rows or CHUNK_ROWS
+        times = numpy.full(len(self.runs), numpy.nan)
+        for index, run in enumerate(self.runs):
+            for start in range(0, len(run), chunk_rows):
+                reached = numpy.flatnonzero(run.column(metric, start, start + chunk_rows) >= threshold)
+                if len(reached):
+                    times[index] = run.column('MCS', start + reached[0], start + reached[0] + 1)[0]
+                    break
+        return times
+
+def analyze(root, output_dir='analysis', names=()):
+    # Saves a summary of every group of runs and gives back (group, runs, times to activation) for each
+    runs = find_runs(root)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    results = []
+    for number, (key, group) in enumerate(runs.groups(names).items()):
+        group.aggregate().save(os.path.join(output_dir, 'group_' + str(number)))
+        results.append((dict(zip(names, key)), len(group), group.time_to()))
+
+    with open(os.path.join(output_dir, 'groups.json'), 'w') as groups_file:
+        json.dump([{'group': 'group_' + str(number), 'parameters': parameters, 'runs': count}
+                   for number, (parameters, count, times) in enumerate(results)], groups_file, indent=1)
+    return results
+
+if __name__ == '__main__':
+    root = sys.argv[1]
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'analysis'
+    names = sys.argv[3].split(',') if len(sys.argv) > 3 else []
+
+    for parameters, count, times in analyze(root, output_dir, names):
+        reached = times[~numpy.isnan(times)]
+        when = ('median MCS ' + str(numpy.median(reached))) if len(reached) else 'never'
+        print(str(parameters) + ': ' + str(count) + ' runs, ' + str(len(reached)) + ' activated a TCONV (' + when + ')')
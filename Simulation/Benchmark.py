@@ -0,0 +1,415 @@
+##########################################################
+#	File: Benchmark.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Measures how fast (and with how much memory) the parts of the model run as the number of cells grows.
+#	Each population is built directly inside the CellStore and a lattice like the one of Headless.py,
+#	from the size of the Model.xml default up to millions of cells and with different APC:TREG:TCONV ratios.
+#	The quantities of every cell come from the TCell and APC constructors (see Cell.py).
+#
+#	For every population we time:
+#		contacts_scan		Every TCell-APC contact from the whole lattice (Contacts.index_pairs)
+#		contacts_tracker	Updating and listing the contacts after 10% of the cells moved (Contacts.ContactTracker)
+#		bind_batch			Ligand/receptor binding of every contact (Binding.bind_batch)
+#		leap_batch			Same with tau-leaping (Binding.leap_batch)
+#		aging				Aging every cell (Lifecycle.age)
+#		totals				Computing Data for the plots (Totals.update_data)
+#		spatial_update		Putting the APCs in their buckets after 10% of the cells moved (Spatial.SpatialHash)
+#		apc_queries			The APCs within SEARCH_RADIUS and the NEAREST closest APCs of every TCell
+#		chemokine_solve		Steady TATTRACT field of every APC over the whole lattice (Chemokine.SteadyStateSolver)
+#		metrics_output		Writing rows of metrics (Metrics.MetricWriter)
+#		checkpoint_output	Saving the CellStore to a compressed file (as in Checkpoint.py)
+#
+#	Every benchmark runs a few times and the median is kept. The peak memory is measured in an extra
+#	run with tracemalloc (Python 3 only, numpy arrays included).
+#	The results are saved as JSON so the ones of two versions can be compared:
+#		python Benchmark.py [output file] [sizes] [ratios] [repeats]
+#		python Benchmark.py compare <old results> <new results>
+#	e.g. python Benchmark.py benchmark.json 507,100000 1:1:1,1:2:6 3
+#
+##########################################################
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy
+
+import Binding
+import Chemokine
+import Config
+import Contacts
+import Headless
+import Lifecycle
+import Metrics
+import Spatial
+import Totals
+from Cell import APC
+from Cell import TCell
+from CellStore import STORE
+from CellTypes import State
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+# Increase this if the format of the results changes
+VERSION = 1
+
+# Population sizes and APC:TREG:TCONV ratios used when none are given
+# 507 cells is what the UniformInitializer of Model.xml makes, its types are picked evenly
+SIZES = [507, 10000, 100000, 1000000]
+RATIOS = ['1:1:1', '1:2:6', '1:8:1']
+REPEATS = 3
+
+# Fraction of the lattice blocks with a cell
+DENSITY = 0.2
+# Fraction of the cells that moved for contacts_tracker
+MOVED = 0.1
+# Fraction of the TCells waiting for co-activation before binding
+AWAITING = 0.5
+# Rows written by metrics_output
+METRIC_ROWS = 1000
+# Our blocks are 1 pixel and 1 in 5 has a cell, much closer than in Model.xml (a cell every 7 pixels)
+# so the size of the buckets and the distance looked at by apc_queries are given in blocks
+SPATIAL_CELL_SIZE = 2.0
+SEARCH_RADIUS = 3.0
+# Number of APCs looked for around every TCell by apc_queries
+NEAREST = 4
+
+clock = getattr(time, 'perf_counter', time.time)
+
+# Stand-in for a CC3D cell, our code only sets its type and lambdaVec
+class SyntheticCell(object):
+    def __init__(self, id):
+        self.id = id
+        self.type = 0
+
+##########################################################
+#	Population
+#
+#	A lattice full of cells at random places plus everything a steppable would give our code.
+#	It plays the part of the steppable and of its simulator (see Headless.py).
+##########################################################
+class Population(object):
+    def __init__(self, cells, ratio, density=DENSITY, seed=0, store=STORE):
+        self.cells = cells
+        self.ratio = ratio
+        self.store = store
+        self.rng = numpy.random.RandomState(seed)
+        self.simulator = self
+        # Where the output benchmarks write (see run_benchmarks)
+        self.output_dir = None
+
+        # A lattice of about cells / density blocks, as flat as the one of Model.xml
+        side = int(numpy.ceil((cells / density * 2) ** (1 / 3.0)))
+        self.lattice = Headless.Lattice((side, side, max(1, side // 2)), 1, 10.0)
+        ids = numpy.arange(1, cells + 1)
+        blocks = self.rng.choice(self.lattice.grid.size, cells, replace=False)
+        self.lattice.grid.flat[blocks] = ids
+        self.lattice.position = numpy.zeros((cells + 1, 3), dtype=numpy.int64)
+        self.lattice.position[ids] = numpy.column_stack(numpy.unravel_index(blocks, self.lattice.shape))
+        self.ids = ids
+
+        # Volumes for aging
+        self.attributes = Headless.CellAttributes(cells + 1)
+        self.attributes.volume[ids] = Config.INITIAL_AGE
+        self.attributes.targetVolume[ids] = Config.INITIAL_AGE
+        self.attributes.lambdaVolume[ids] = 1.0
+
+        # Kinds picked with the given ratio
+        weights = numpy.array([float(part) for part in ratio.split(':')])
+        kinds = numpy.array([store.APC, store.TREG, store.TCONV])[self.rng.choice(3, cells, p=weights / weights.sum())]
+        self.fill_store(ids, kinds)
+        self.changed = set()
+
+    def fill_store(self, ids, kinds):
+        # Every cell gets the quantities a new TCell/APC of its kind would have
+        store = self.store
+        store.clear()
+        templates = {
+            store.APC: APC(SyntheticCell(len(ids) + 1)),
+            store.TREG: TCell(SyntheticCell(len(ids) + 2), TCell.TREG),
+            store.TCONV: TCell(SyntheticCell(len(ids) + 3), TCell.TCONV),
+        }
+        rows = dict((kind, dict((name, getattr(store, name)[view.slot]) for name in store.FIELDS))
+                    for kind, view in templates.items())
+        for view in templates.values():
+            store.remove(view.id)
+
+        slots = store.allocate_many(ids)
+        for kind, row in rows.items():
+            of_kind = slots[kinds == kind]
+            for name, value in row.items():
+                if name != 'id':
+                    getattr(store, name)[of_kind] = value
+
+        # Views of the TCells (Binding changes their State through them), all sharing one stand-in cell
+        shared = SyntheticCell(0)
+        for id in ids[kinds != store.APC].tolist():
+            TCell.attach(shared, id)
+
+        self.tcell_slots = slots[kinds != store.APC]
+
+    # The parts of a steppable and of the simulator our code uses
+    def cell_ids(self):
+        return self.ids
+
+    def touching_pairs(self):
+        return self.lattice.touching_pairs()
+
+    def neighbor_pairs(self, ids):
+        return self.lattice.neighbor_pairs(ids)
+
+    def cell_centers(self):
+        return self.ids, (self.lattice.position[self.ids] + 0.5) * self.lattice.width
+
+    def take_changed_cells(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def snapshot(self):
+        # Copy of the store arrays, binding changes them and every run has to start from the same place
+        return dict((name, getattr(self.store, name).copy()) for name in self.store.FIELDS), self.store.events.copy()
+
+    def restore(self, snapshot):
+        arrays, events = snapshot
+        for name, values in arrays.items():
+            getattr(self.store, name)[:] = values
+        self.store.events[:] = events
+        self.store.take_dead()
+
+##########################################################
+#	Benchmarks
+#
+#	Each one is a function (population) -> (run, units, unit name).
+#	Only run is timed, it's called once per repeat.
+##########################################################
+def contacts_scan(population):
+    def run():
+        first_ids, second_ids, areas = population.touching_pairs()
+        Contacts.index_pairs(first_ids, second_ids, areas, population.store)
+    return run, population.cells, 'cells'
+
+def contacts_tracker(population):
+    tracker = Contacts.ContactTracker(store=population.store)
+    population.changed = set(population.ids.tolist())
+    tracker.update(population)
+    moved = population.rng.choice(population.ids, int(population.cells * MOVED), replace=False).tolist()
+
+    def run():
+        population.changed = set(moved)
+        tracker.update(population)
+        tracker.pairs()
+    return run, len(moved), 'moved cells'
+
+def binding(batch):
+    def benchmark(population):
+        pairs = Contacts.contact_pairs(population, population.store)
+        store = population.store
+        waiting = population.tcell_slots[population.rng.random_sample(len(population.tcell_slots)) < AWAITING]
+        store.state[waiting] = State.AWAITING_COACTIVATION
+        snapshot = population.snapshot()
+
+        def run():
+            population.restore(snapshot)
+            batch(pairs.tcell_ids, pairs.apc_ids, rng=population.rng, store=store)
+        return run, max(1, len(pairs)), 'contacts'
+    return benchmark
+
+def aging(population):
+    def run():
+        Lifecycle.age(population, Config.STEP_AGE)
+    return run, population.cells, 'cells'
+
+def totals(population):
+    def run():
+        Totals.update_data(population.store)
+    return run, population.cells, 'cells'
+
+def spatial_update(population):
+    space = Spatial.SpatialHash(SPATIAL_CELL_SIZE, (population.store.APC,), population.store)
+    space.update(population)
+    ids, centers = population.cell_centers()
+    moved = population.rng.random_sample(len(ids)) < MOVED
+    shifted = centers.copy()
+    shifted[moved] += population.lattice.width * (population.rng.randint(0, 2, (int(moved.sum()), 3)) * 2 - 1)
+
+    def run():
+        space.set(ids, shifted)
+        space.sort()
+        space.set(ids, centers)
+        space.sort()
+    return run, 2 * population.cells, 'cells'
+
+def apc_queries(population):
+    space = Spatial.SpatialHash(SPATIAL_CELL_SIZE, (population.store.APC,), population.store)
+    space.update(population)
+    tcell_ids = population.store.id[population.tcell_slots]
+
+    def run():
+        space.around(tcell_ids, SEARCH_RADIUS)
+        space.nearest(space.center[tcell_ids], NEAREST)
+    return run, max(1, len(tcell_ids)), 'TCells'
+
+def chemokine_solve(population):
+    spec = Headless.read_model()
+    solver = Chemokine.SteadyStateSolver(population.lattice.shape, spec.diffusion_constant, spec.decay_constant,
+                                         Config.CHEMOKINE_RESOLUTION)
+    ids, centers = population.cell_centers()
+    apcs = centers[population.store.kind[population.store.slots(ids)] == population.store.APC]
+
+    def run():
+        solver.solve(apcs, spec.secretion.get('APC', 0.0))
+    return run, int(numpy.prod(population.lattice.shape)), 'pixels'
+
+def metrics_output(population):
+    Totals.update_data(population.store)
+
+    def run():
+        writer = Metrics.MetricWriter(os.path.join(population.output_dir, 'metrics'))
+        for mcs in range(METRIC_ROWS):
+            writer.append(Metrics.current_row(mcs))
+        writer.close()
+    return run, METRIC_ROWS, 'rows'
+
+def checkpoint_output(population):
+    def run():
+        with open(os.path.join(population.output_dir, 'store.npz'), 'wb') as store_file:
+            numpy.savez_compressed(store_file, **dict((name, value) for name, value in population.store.checkpoint().items()
+                                                      if isinstance(value, numpy.ndarray)))
+    return run, population.cells, 'cells'
+
+BENCHMARKS = OrderedDict([
+    ('contacts_scan', contacts_scan),
+    ('contacts_tracker', contacts_tracker),
+    ('bind_batch', binding(Binding.bind_batch)),
+    ('leap_batch', binding(Binding.leap_batch)),
+    ('aging', aging),
+    ('totals', totals),
+    ('spatial_update', spatial_update),
+    ('apc_queries', apc_queries),
+    ('chemokine_solve', chemokine_solve),
+    ('metrics_output', metrics_output),
+    ('checkpoint_output', checkpoint_output),
+])
+
+def peak_memory(run):
+    # Most memory (bytes) allocated at once while running, None if we can't tell
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def max_rss():
+    # Most memory the whole process ever used (bytes), None if we can't tell
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def measure(name, population, repeats=REPEATS):
+    run, units, unit = BENCHMARKS[name](population)
+    seconds = []
+    for _ in range(repeats):
+        started = clock()
+        run()
+        seconds.append(clock() - started)
+
+    median = float(numpy.median(seconds))
+    return OrderedDict([
+        ('benchmark', name),
+        ('cells', population.cells),
+        ('ratio', population.ratio),
+        ('units', units),
+        ('unit', unit),
+        ('seconds', median),
+        ('all_seconds', seconds),
+        ('throughput', units / median if median > 0 else float('inf')),
+        ('peak_bytes', peak_memory(run)),
+    ])
+
+def run_benchmarks(sizes=SIZES, ratios=RATIOS, repeats=REPEATS, names=None, report=None):
+    results = []
+    output_dir = tempfile.mkdtemp()
+    try:
+        for cells in sizes:
+            for ratio in ratios:
+                population = Population(cells, ratio)
+                population.output_dir = output_dir
+                for name in names or BENCHMARKS:
+                    result = measure(name, population, repeats)
+                    result['max_rss_bytes'] = max_rss()
+                    results.append(result)
+                    if report is not None:
+                        report(result)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    return OrderedDict([
+        ('version', VERSION),
+        ('created', time.strftime('%Y-%m-%d %H:%M:%S')),
+        ('python', platform.python_version()),
+        ('numpy', numpy.__version__),
+        ('machine', platform.platform()),
+        ('repeats', repeats),
+        ('results', results),
+    ])
+
+def describe(result):
+    peak = result['peak_bytes']
+    return '%-18s %9d cells %-7s %12.6f s %14.1f %s/sec %s' % (
+        result['benchmark'], result['cells'], result['ratio'], result['seconds'], result['throughput'], result['unit'],
+        '' if peak is None else '%10.1f MB peak' % (peak / 1e6))
+
+def compare(old_path, new_path):
+    # How much faster (> 1) or slower (< 1) every benchmark got from the old results to the new ones
+    with open(old_path) as old_file:
+        old = json.load(old_file)
+    with open(new_path) as new_file:
+        new = json.load(new_file)
+
+    key = lambda result: (result['benchmark'], result['cells'], result['ratio'])
+    before = dict((key(result), result) for result in old['results'])
+    lines = []
+    for result in new['results']:
+        previous = before.get(key(result))
+        if previous is None:
+            continue
+        speedup = previous['seconds'] / result['seconds'] if result['seconds'] > 0 else float('inf')
+        line = '%-18s %9d cells %-7s %8.2fx' % (result['benchmark'], result['cells'], result['ratio'], speedup)
+        if previous['peak_bytes'] and result['peak_bytes']:
+            line += ' %8.2fx memory' % (float(result['peak_bytes']) / previous['peak_bytes'])
+        lines.append(line)
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'compare':
+        print(compare(sys.argv[2], sys.argv[3]))
+        sys.exit(0)
+
+    output_file = sys.argv[1] if len(sys.argv) > 1 else 'benchmark.json'
+    sizes = [int(size) for size in sys.argv[2].split(',')] if len(sys.argv) > 2 else SIZES
+    ratios = sys.argv[3].split(',') if len(sys.argv) > 3 else RATIOS
+    repeats = int(sys.argv[4]) if len(sys.argv) > 4 else REPEATS
+
+    def report(result):
+        print(describe(result))
+        sys.stdout.flush()
+
+    summary = run_benchmarks(sizes, ratios, repeats, report=report)
+    with open(output_file, 'w') as results_file:
+        json.dump(summary, results_file, indent=1)
+    print('Results saved in ' + output_file)
@@ -0,0 +1,297 @@
+##########################################################
+#	File: Binding.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Ligand and receptor binding for every TCell-APC contact of an MCS at once.
+#	It does the same thing as TCell.select_interaction and TCell.match_with_apc
+#	but with numpy arrays over the CellStore instead of one contact at a time.
+#
+#	When several TCells touch the same APC they take turns in order of TCell id,
+#	so the second TCell only sees the ligands the first one left behind.
+#	Contacts of different APCs never share a cell, so bind_batch can hand groups of APCs
+#	to other processes (see Interactions.py) and still bind exactly as if it did them all itself.
+#
+#	leap_batch is the rate based alternative (Config.BINDING_MODE = 'tau_leaping').
+#	TCR-Peptide-MHC, CD28-CD80/86 and CTLA-4-CD80/86 bind at a rate proportional to how much
+#	receptor and ligand there is (mass action). Every contact advances Config.BINDING_TAU MCS worth
+#	of binding at once, drawing how many times each pair bound from a Poisson distribution.
+#	The affinities come from Config.WEIGHTS_CD80 and Config.WEIGHTS_CD86 like in bind_batch.
+#	Both only use the weights relative to each other (divided by their sum), same as the dice of Dice.py.
+#	Both throw their dice with DICE (see Dice.py) like the rest of our cells, so they are saved in checkpoints.
+#
+##########################################################
+import numpy
+
+import Config
+import Transitions
+from CellStore import STORE
+from CellStore import Event
+from CellTypes import State
+from Dice import DICE
+
+# Ligands
+NONE = -1
+CD80 = 0
+CD86 = 1
+
+# Receptors
+CTLA4 = 0
+CD28 = 1
+
+# Reactions of leap_batch
+TCR_PEPTIDEMHC = 0
+CTLA4_CD80 = 1
+CTLA4_CD86 = 2
+CD28_CD80 = 3
+CD28_CD86 = 4
+REACTIONS = 5
+
+class BindingResult(object):
+    def __init__(self, tcell_ids, apc_ids, ligand, receptor, activated, anergic):
+        # The contacts in the order they were processed
+        self.tcell_ids = tcell_ids
+        self.apc_ids = apc_ids
+        # Which ligand and receptor each contact used (NONE if it didn't bind)
+        self.ligand = ligand
+        self.receptor = receptor
+        # Ids of the TCells that became active or anergic
+        self.activated = activated
+        self.anergic = anergic
+
+class LeapResult(object):
+    def __init__(self, tcell_ids, apc_ids, events, activated, anergic):
+        # The contacts in the order they were processed
+        self.tcell_ids = tcell_ids
+        self.apc_ids = apc_ids
+        # How many times each reaction happened in each contact (one column per reaction)
+        self.events = events
+        # Ids of the TCells that became active or anergic
+        self.activated = activated
+        self.anergic = anergic
+
+def affinities(weights):
+    # (CTLA-4, CD28) weights divided by their sum, so they don't have to add up to 1
+    total = float(sum(weights))
+    return weights[0] / total, weights[1] / total
+
+def group_contacts(tcell_ids, apc_ids):
+    # Keeps one contact per TCell and orders them by APC and then by TCell id
+    # Gives back the contacts and the position of every contact inside its APC group
+    # (0 for the first TCell, 1 for the second...)
+    tcell_ids = numpy.asarray(tcell_ids, dtype=numpy.int64)
+    apc_ids = numpy.asarray(apc_ids, dtype=numpy.int64)
+
+    # A TCell only binds with one APC per MCS (its "friend"), keep the first contact
+    _, first = numpy.unique(tcell_ids, return_index=True)
+    first.sort()
+    tcell_ids = tcell_ids[first]
+    apc_ids = apc_ids[first]
+
+    # Group the contacts by APC and then by TCell id so competing TCells always go in the same order
+    order = numpy.lexsort((tcell_ids, apc_ids))
+    tcell_ids = tcell_ids[order]
+    apc_ids = apc_ids[order]
+    count = len(tcell_ids)
+
+    if count:
+        starts = numpy.flatnonzero(numpy.r_[True, apc_ids[1:] != apc_ids[:-1]])
+        rank = numpy.arange(count) - numpy.repeat(starts, numpy.diff(numpy.r_[starts, count]))
+    else:
+        rank = numpy.zeros(0, dtype=numpy.int64)
+
+    return tcell_ids, apc_ids, rank
+
+def change_states(activated, anergic, store):
+    # State changes are rare so we let Transitions.py handle them one cell at a time
+    for id in activated:
+        Transitions.change(store.views[id], State.ACTIVE)
+    for id in anergic:
+        Transitions.change(store.views[id], State.ANERGIC)
+
+def bind_rounds(tcell_slots, apc_slots, rank, dice, ctla4_cd80, ctla4_cd86, store):
+    # The ligands and receptors of contacts grouped by APC (see group_contacts), binding them in the store
+    # dice has one column per contact, ctla4_cd80 and ctla4_cd86 are the chances of CTLA-4 when both receptors are available
+    # Gives back the ligand and receptor of every contact and how many CD28 and CTLA-4 were engaged
+    count = len(tcell_slots)
+    ligand = numpy.full(count, NONE, dtype=numpy.int8)
+    receptor = numpy.full(count, NONE, dtype=numpy.int8)
+    engaged_cd28 = 0
+    engaged_ctla4 = 0
+
+    # Every round handles at most one contact per APC, so no APC is modified twice at the same time
+    for turn in range(rank.max() + 1 if count else 0):
+        rows = numpy.flatnonzero(rank == turn)
+        tcells = tcell_slots[rows]
+        apcs = apc_slots[rows]
+
+        # Which ligands does the APC still have?
+        cd80 = store.total_CD80[apcs].astype(numpy.int64)
+        cd86 = store.total_CD86[apcs].astype(numpy.int64)
+        has_cd80 = cd80 > 0
+        has_cd86 = cd86 > 0
+
+        # Pick a random ligand out of the available ones
+        chosen = numpy.where(has_cd80, CD80, CD86)
+        chosen = numpy.where(has_cd80 & has_cd86, numpy.where(dice[0, rows] < 0.5, CD86, CD80), chosen)
+        chosen = numpy.where(has_cd80 | has_cd86, chosen, NONE)
+
+        # Which receptors does the TCell still have?
+        has_ctla4 = store.total_external_CTLA4[tcells] > 0
+        has_cd28 = store.total_CD28[tcells] > 0
+
+        # Pick based on the affinity weights when both are available (CTLA-4 is the first weight)
+        prob_ctla4 = numpy.where(chosen == CD80, ctla4_cd80, ctla4_cd86)
+        picked = numpy.where(has_ctla4, CTLA4, CD28)
+        picked = numpy.where(has_ctla4 & has_cd28, numpy.where(dice[1, rows] < prob_ctla4, CTLA4, CD28), picked)
+        picked = numpy.where((has_ctla4 | has_cd28) & (chosen != NONE), picked, NONE)
+
+        # CD28 uses one ligand, CTLA-4 uses two (based on figures of Kaur14PhD paper)
+        # We never take more ligands than the APC has
+        binding_cd28 = picked == CD28
+        binding_ctla4 = picked == CTLA4
+        used = numpy.where(binding_cd28, 1, 0) + numpy.where(binding_ctla4, 2, 0)
+        used_cd80 = numpy.where(chosen == CD80, numpy.minimum(used, cd80), 0)
+        used_cd86 = numpy.where(chosen == CD86, numpy.minimum(used, cd86), 0)
+
+        store.total_CD80[apcs] -= used_cd80.astype(store.total_CD80.dtype)
+        store.total_CD86[apcs] -= used_cd86.astype(store.total_CD86.dtype)
+        store.total_CD28[tcells[binding_cd28]] -= 1
+        store.bound_CD28[tcells[binding_cd28]] += 1
+        store.total_external_CTLA4[tcells[binding_ctla4]] -= 1
+
+        ligand[rows] = chosen
+        receptor[rows] = picked
+        engaged_cd28 += int(binding_cd28.sum())
+        engaged_ctla4 += int(binding_ctla4.sum())
+
+    return ligand, receptor, engaged_cd28, engaged_ctla4
+
+def bind_batch(tcell_ids, apc_ids, rng=DICE, store=STORE, pool=None):
+    # pool binds big batches on other processes (see Interactions.py), it gives the very same result
+    tcell_ids, apc_ids, rank = group_contacts(tcell_ids, apc_ids)
+    count = len(tcell_ids)
+
+    # Chance of CTLA-4 when both receptors are available
+    ctla4_cd80 = affinities(Config.WEIGHTS_CD80)[0]
+    ctla4_cd86 = affinities(Config.WEIGHTS_CD86)[0]
+
+    # Throw all the dice for this MCS at once
+    # Row 0 chooses the ligand, row 1 chooses the receptor
+    dice = rng.random_sample((2, count))
+
+    tcell_slots = store.slots(tcell_ids)
+    apc_slots = store.slots(apc_ids)
+    state_before = store.state[tcell_slots]
+
+    if pool is not None and pool.takes(count):
+        bind = pool.bind_rounds
+    else:
+        bind = bind_rounds
+    ligand, receptor, engaged_cd28, engaged_ctla4 = bind(tcell_slots, apc_slots, rank, dice, ctla4_cd80, ctla4_cd86, store)
+
+    # Count the engagements for the plots
+    store.events[Event.ENGAGED_CD28] += engaged_cd28
+    store.events[Event.ENGAGED_EXTERNAL_CTLA4] += engaged_ctla4
+
+    awaiting = state_before == State.AWAITING_COACTIVATION
+
+    # Passing the CD28 threshold activates the TCell
+    activated = tcell_ids[(receptor == CD28) & (store.bound_CD28[tcell_slots] > Config.CD28_THRESHOLD) & (store.state[tcell_slots] != State.ACTIVE)]
+    # No ligands left while waiting for co-stimulation makes it anergic
+    anergic = tcell_ids[(ligand == NONE) & awaiting]
+
+    change_states(activated, anergic, store)
+    return BindingResult(tcell_ids, apc_ids, ligand, receptor, activated, anergic)
+
+def leap(rate, available, rng):
+    # How many times a reaction happens during tau, never more than what is available
+    return numpy.minimum(rng.poisson(rate), available)
+
+def leap_batch(tcell_ids, apc_ids, tau=None, rng=DICE, store=STORE):
+    tau = Config.BINDING_TAU if tau is None else tau
+    tcell_ids, apc_ids, rank = group_contacts(tcell_ids, apc_ids)
+    count = len(tcell_ids)
+
+    events = numpy.zeros((count, REACTIONS), dtype=numpy.int64)
+    no_ligands = numpy.zeros(count, dtype=bool)
+    tcell_slots = store.slots(tcell_ids)
+    apc_slots = store.slots(apc_ids)
+
+    # Affinity of each receptor for each ligand (CTLA-4 is the first weight)
+    ctla4_cd80, cd28_cd80 = [Config.BINDING_RATE * affinity * tau for affinity in affinities(Config.WEIGHTS_CD80)]
+    ctla4_cd86, cd28_cd86 = [Config.BINDING_RATE * affinity * tau for affinity in affinities(Config.WEIGHTS_CD86)]
+    tcr_peptidemhc = Config.TCR_BINDING_RATE * tau
+
+    # Every round handles at most one contact per APC, so no APC is modified twice at the same time
+    for turn in range(rank.max() + 1 if count else 0):
+        rows = numpy.flatnonzero(rank == turn)
+        tcells = tcell_slots[rows]
+        apcs = apc_slots[rows]
+
+        # TCR and Peptide-MHC of inactive TCells
+        inactive = store.state[tcells] == State.INACTIVE
+        tcr = store.total_TCR[tcells].astype(numpy.int64)
+        peptidemhc = store.total_PEPTIDEMHC[apcs].astype(numpy.int64)
+        bound = numpy.where(inactive, leap(tcr_peptidemhc * tcr * peptidemhc, numpy.minimum(tcr, peptidemhc), rng), 0)
+        store.total_TCR[tcells] -= bound.astype(store.total_TCR.dtype)
+        store.total_PEPTIDEMHC[apcs] -= bound.astype(store.total_PEPTIDEMHC.dtype)
+        events[rows, TCR_PEPTIDEMHC] = bound
+
+        # Binding TCR means we now need co-activation
+        Transitions.change_many(tcells[bound > 0], State.AWAITING_COACTIVATION, store)
+        awaiting = store.state[tcells] == State.AWAITING_COACTIVATION
+
+        # Co-activation of the TCells waiting for it
+        cd80 = store.total_CD80[apcs].astype(numpy.int64)
+        cd86 = store.total_CD86[apcs].astype(numpy.int64)
+        ctla4 = store.total_external_CTLA4[tcells].astype(numpy.int64)
+        cd28 = store.total_CD28[tcells].astype(numpy.int64)
+        no_ligands[rows] = awaiting & (cd80 == 0) & (cd86 == 0)
+
+        # All rates are computed from the amounts before this leap
+        # CTLA-4 uses two ligands and CD28 one (based on figures of Kaur14PhD paper)
+        # We take the reactions in a fixed order and never use more than what is left
+        rates = [ctla4_cd80 * ctla4 * cd80, ctla4_cd86 * ctla4 * cd86, cd28_cd80 * cd28 * cd80, cd28_cd86 * cd28 * cd86]
+        amounts = rng.poisson(numpy.where(awaiting, rates, 0.0))
+
+        bound = numpy.minimum(amounts[0], numpy.minimum(ctla4, cd80 // 2))
+        ctla4 -= bound
+        cd80 -= 2 * bound
+        events[rows, CTLA4_CD80] = bound
+
+        bound = numpy.minimum(amounts[1], numpy.minimum(ctla4, cd86 // 2))
+        ctla4 -= bound
+        cd86 -= 2 * bound
+        events[rows, CTLA4_CD86] = bound
+
+        bound = numpy.minimum(amounts[2], numpy.minimum(cd28, cd80))
+        cd28 -= bound
+        cd80 -= bound
+        events[rows, CD28_CD80] = bound
+
+        bound = numpy.minimum(amounts[3], numpy.minimum(cd28, cd86))
+        cd28 -= bound
+        cd86 -= bound
+        events[rows, CD28_CD86] = bound
+
+        engaged_cd28 = events[rows, CD28_CD80] + events[rows, CD28_CD86]
+        store.total_CD80[apcs] = cd80
+        store.total_CD86[apcs] = cd86
+        store.total_external_CTLA4[tcells] = ctla4
+        store.total_CD28[tcells] = cd28
+        store.bound_CD28[tcells] += engaged_cd28.astype(store.bound_CD28.dtype)
+
+        # Count the engagements for the plots
+        store.events[Event.ENGAGED_CD28] += int(engaged_cd28.sum())
+        store.events[Event.ENGAGED_EXTERNAL_CTLA4] += int(events[rows, CTLA4_CD80].sum() + events[rows, CTLA4_CD86].sum())
+
+    cd28_bound = (events[:, CD28_CD80] + events[:, CD28_CD86]) > 0
+
+    # Passing the CD28 threshold activates the TCell
+    activated = tcell_ids[cd28_bound & (store.bound_CD28[tcell_slots] > Config.CD28_THRESHOLD) & (store.state[tcell_slots] != State.ACTIVE)]
+    # No ligands left while waiting for co-stimulation makes it anergic
+    anergic = tcell_ids[no_ligands]
+
+    change_states(activated, anergic, store)
+    return LeapResult(tcell_ids, apc_ids, events, activated, anergic)
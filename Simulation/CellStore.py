@@ -0,0 +1,329 @@
+##########################################################
+#	File: CellStore.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	All the receptor, ligand and binding information of our cells lives here.
+#	Instead of every TCell/APC object having its own attributes we keep one numpy array per quantity.
+#	Every cell has a slot in these arrays, slot_of tells us the slot of a CC3D cell id.
+#	TCell and APC (see Cell.py) are just views into these arrays.
+#
+#	This way we can work on every cell at once with numpy and each cell only costs a few dozen bytes.
+#
+#	When a cell dies it is removed and its slot goes into a free list, the next cell born takes it.
+#	Once too many slots are free compact moves every cell to the front and shrinks the arrays,
+#	so memory and the cost of going through the arrays follow the cells that are alive.
+#	Slot 0 is never used, ids without a slot point there so looking them up gives an empty cell.
+#
+#	Things that happen (bindings, lost ligands, apoptosis...) can't be read back from the cells,
+#	so the store also keeps a running count of each kind of Event.
+#	Dead cells are gone from the arrays, the ones we still plot (anergic) are counted as events when they die.
+#
+#	The arrays can also live in files of a folder (share) so other processes can open and change them
+#	in place (see Interactions.py). Every resize makes new files, generation tells them apart.
+#
+##########################################################
+import os
+from collections import OrderedDict
+
+import numpy
+
+# Things we count for the plots
+class Event(object):
+    ENGAGED_CD28 = 0
+    ENGAGED_EXTERNAL_CTLA4 = 1
+    LOST_PEPTIDEMHC = 2
+    LOST_CD80 = 3
+    LOST_CD86 = 4
+    STOCHASTIC_APOPTOSIS = 5
+    STOCHASTIC_DIVISION = 6
+    STOCHASTIC_QUIESCENCE = 7
+    ANERGIC_TREG = 8
+    ANERGIC_TCONV = 9
+    
+    # How many kinds of events there are
+    COUNT = 10
+
+class CellStore(object):
+    # What kind of cell is in each slot
+    NONE = -1
+    TREG = 0
+    TCONV = 1
+    APC = 2
+
+    # One array per quantity and the numpy type used for it
+    FIELDS = OrderedDict([
+        # CC3D id of the cell in this slot (0 if the slot is empty)
+        ('id', numpy.int32),
+        # Kind and State of the cell
+        ('kind', numpy.int8),
+        ('state', numpy.int8),
+        # False once the cell died, until it is removed at the end of the MCS
+        ('alive', numpy.bool_),
+        # True while a TCell is internalizing CTLA-4
+        ('internalizing', numpy.bool_),
+
+        # TCell receptors
+        ('total_TCR', numpy.int16),
+        ('total_CD28', numpy.int16),
+        ('total_external_CTLA4', numpy.int16),
+        ('total_internal_CTLA4', numpy.int16),
+        ('bound_CD28', numpy.int16),
+        # Internalized CTLA-4 not counted yet (see Recycling.py)
+        ('recycling_carry', numpy.float32),
+
+        # APC ligands
+        ('initial_PEPTIDEMHC', numpy.int16),
+        ('initial_CD80', numpy.int16),
+        ('initial_CD86', numpy.int16),
+        ('total_PEPTIDEMHC', numpy.int16),
+        ('total_CD80', numpy.int16),
+        ('total_CD86', numpy.int16),
+
+        # Binding of a TCell to an APC
+        ('bound_to_id', numpy.int32),
+        ('bound_last_mcs', numpy.int32),
+        ('bound_time', numpy.int32),
+        ('unbound_time', numpy.int32),
+    ])
+
+    # Value of empty slots (everything else starts at 0)
+    DEFAULTS = {
+        'kind': NONE,
+        'bound_to_id': -1,
+        'bound_last_mcs': -1,
+    }
+
+    def __init__(self, capacity=1024):
+        # Cell id -> TCell/APC view
+        self.views = {}
+        self.capacity = 0
+        # How many times each Event happened
+        self.events = numpy.zeros(Event.COUNT, dtype=numpy.int64)
+        # Folder of the files the arrays live in when they are shared (see share), None when they are our own
+        self.folder = None
+        # Goes up every time the arrays are made again
+        self.generation = 0
+        for name, dtype in self.FIELDS.items():
+            setattr(self, name, numpy.zeros(0, dtype=dtype))
+        self.ensure(capacity - 1)
+
+        # Cell id -> slot (0 if the cell has none)
+        self.slot_of = numpy.zeros(capacity, dtype=numpy.int32)
+        # Slots below this one have been used, slot 0 never is
+        self.used = 1
+        # Slots below used that are empty again
+        self.free = []
+        # Ids of the cells that died but weren't removed yet (see Lifecycle.bury)
+        self.dead = []
+
+    def ensure(self, slot):
+        # Make sure this slot exists, doubling the arrays when we run out
+        if slot < self.capacity:
+            return
+
+        capacity = max(slot + 1, 2 * self.capacity)
+        self.resize(capacity, numpy.arange(self.capacity))
+
+    def resize(self, capacity, slots):
+        # New arrays with the given slots moved to the front
+        self.generation += 1
+        for name, dtype in self.FIELDS.items():
+            if self.folder is None:
+                resized = numpy.full(capacity, self.DEFAULTS.get(name, 0), dtype=dtype)
+            else:
+                resized = open_field(self.folder, name, self.generation, capacity, 'w+')
+                resized[:] = self.DEFAULTS.get(name, 0)
+            resized[:len(slots)] = getattr(self, name)[slots]
+            setattr(self, name, resized)
+            self.forget(name, self.generation - 1)
+        self.capacity = capacity
+
+    def share(self, folder):
+        # Move the arrays into files of folder, None brings them back into our own memory
+        old = self.folder
+        self.folder = folder
+        self.resize(self.capacity, numpy.arange(self.capacity))
+        if old is not None:
+            for name in self.FIELDS:
+                remove_field(old, name, self.generation - 1)
+
+    def forget(self, name, generation):
+        # The file of an array that was made again, processes that still have it open keep it until they close it
+        if self.folder is not None:
+            remove_field(self.folder, name, generation)
+
+    def allocate(self, id):
+        # A clean slot for a cell id, the one of a removed cell if there is one
+        if id >= len(self.slot_of):
+            grown = numpy.zeros(max(id + 1, 2 * len(self.slot_of)), dtype=numpy.int32)
+            grown[:len(self.slot_of)] = self.slot_of
+            self.slot_of = grown
+
+        slot = int(self.slot_of[id])
+        if slot == 0:
+            if self.free:
+                slot = self.free.pop()
+            else:
+                slot = self.used
+                self.used += 1
+                self.ensure(slot)
+
+        for name in self.FIELDS:
+            getattr(self, name)[slot] = self.DEFAULTS.get(name, 0)
+        self.id[slot] = id
+        self.slot_of[id] = slot
+        return slot
+
+    def allocate_many(self, ids):
+        # Same as allocate for many new cells at once (e.g. a whole population), gives back their slots
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        if len(ids) == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        if ids.max() >= len(self.slot_of):
+            grown = numpy.zeros(max(int(ids.max()) + 1, 2 * len(self.slot_of)), dtype=numpy.int32)
+            grown[:len(self.slot_of)] = self.slot_of
+            self.slot_of = grown
+
+        # Free slots first, then new ones
+        reused = [self.free.pop() for _ in range(min(len(self.free), len(ids)))]
+        new = numpy.arange(self.used, self.used + len(ids) - len(reused))
+        slots = numpy.r_[numpy.array(reused, dtype=numpy.int64), new]
+        self.used += len(new)
+        self.ensure(self.used - 1)
+
+        for name in self.FIELDS:
+            getattr(self, name)[slots] = self.DEFAULTS.get(name, 0)
+        self.id[slots] = ids
+        self.slot_of[ids] = slots
+        return slots
+
+    def add(self, view):
+        # Give a new TCell/APC a clean slot
+        view.slot = self.allocate(view.id)
+        self.alive[view.slot] = True
+        self.views[view.id] = view
+
+    def slot(self, id):
+        # Slot of a cell id (0 if it has none)
+        return int(self.slot_of[id]) if id < len(self.slot_of) else 0
+
+    def slots(self, ids):
+        # Same as slot but for many ids at once
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        slots = numpy.zeros(ids.shape, dtype=numpy.int64)
+        known = ids < len(self.slot_of)
+        slots[known] = self.slot_of[ids[known]]
+        return slots
+
+    def kill(self, id):
+        # The cell died, it stops counting as alive and is removed at the end of the MCS
+        slot = self.slot(id)
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.dead.append(id)
+
+    def take_dead(self):
+        # Ids of the cells that died since the last call
+        dead = self.dead
+        self.dead = []
+        return dead
+
+    def remove(self, id):
+        # The cell left the simulation, its slot is free for the next cell born
+        slot = self.slot(id)
+        self.views.pop(id, None)
+        if slot == 0:
+            return
+
+        for name in self.FIELDS:
+            getattr(self, name)[slot] = self.DEFAULTS.get(name, 0)
+        self.slot_of[id] = 0
+        self.free.append(slot)
+
+    def compact(self, minimum_capacity=1024):
+        # Move every cell to the front of the arrays (same order) and give back the unused memory
+        occupied = numpy.r_[0, numpy.flatnonzero(self.id[:self.used])]
+        self.used = len(occupied)
+        self.free = []
+        self.resize(max(minimum_capacity, 2 * self.used), occupied)
+
+        self.slot_of[self.id[1:self.used]] = numpy.arange(1, self.used)
+        for id, view in self.views.items():
+            view.slot = int(self.slot_of[id])
+
+    def clear(self):
+        # Forget every cell (used when starting a new simulation in the same process)
+        self.views = {}
+        self.events[:] = 0
+        for name in self.FIELDS:
+            getattr(self, name)[:] = self.DEFAULTS.get(name, 0)
+        self.slot_of[:] = 0
+        self.used = 1
+        self.free = []
+        self.dead = []
+
+    def checkpoint(self):
+        # Every array, the free slots and the event counts (see Checkpoint.py)
+        state = dict((name, getattr(self, name)[:self.used].copy()) for name in self.FIELDS)
+        state['events'] = self.events.copy()
+        state['slot_of'] = self.slot_of.copy()
+        state['free'] = list(self.free)
+        state['dead'] = list(self.dead)
+        return state
+
+    def resume(self, state):
+        # Put back the arrays of a checkpoint
+        # The views are attached again by MainSteppable.resume
+        self.views = {}
+        self.events = numpy.array(state['events'], dtype=numpy.int64)
+        self.slot_of = numpy.array(state['slot_of'], dtype=numpy.int32)
+        self.free = list(state['free'])
+        self.dead = list(state['dead'])
+        self.used = len(state['id'])
+        self.capacity = 0
+        self.ensure(self.used - 1)
+        for name in self.FIELDS:
+            getattr(self, name)[:self.used] = state[name]
+
+    def ids(self, kind=None):
+        # Ids of every cell of a kind (or every cell)
+        if kind is None:
+            return self.id[numpy.flatnonzero(self.kind != self.NONE)]
+        return self.id[numpy.flatnonzero(self.kind == kind)]
+
+    def bytes_per_cell(self):
+        return sum(numpy.dtype(dtype).itemsize for dtype in self.FIELDS.values())
+
+def field_path(folder, name, generation):
+    return os.path.join(folder, name + '.' + str(generation))
+
+def open_field(folder, name, generation, capacity, mode='r+'):
+    # One array of a shared store, as a plain numpy array over its file
+    # 'w+' makes the file (filled with zeros), 'r+' opens one made by another process
+    path = field_path(folder, name, generation)
+    return numpy.memmap(path, dtype=CellStore.FIELDS[name], mode=mode, shape=(capacity,)).view(numpy.ndarray)
+
+def remove_field(folder, name, generation):
+    # Some systems don't let us remove a file while it is still open, then it goes with the folder
+    try:
+        os.remove(field_path(folder, name, generation))
+    except OSError:
+        pass
+
+# Attribute of a view that reads and writes its slot of a store array
+# e.g. tcell.total_TCR is really STORE.total_TCR[tcell.slot]
+class StoreField(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, view, owner):
+        if view is None:
+            return self
+        return getattr(view.store, self.name)[view.slot].item()
+
+    def __set__(self, view, value):
+        getattr(view.store, self.name)[view.slot] = value
+
+# The store used by our cells
+STORE = CellStore()
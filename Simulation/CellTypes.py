@@ -0,0 +1,40 @@
+##########################################################
+#	File: CellTypes.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	The constants every module uses to talk about cells: their CC3D types and the State of a TCell.
+#	They live here and not in Cell.py so Transitions.py can use them without importing Cell.py,
+#	which imports Transitions.py itself.
+#
+##########################################################
+# This is just to have a global constant for our dictionaries
+class CC3DKey(object):
+    DATA_KEY = 'DATA'
+
+# This is to be able to change the type of cell that CC3D displays easily from inside our code.
+# This is set-up in the MainSteppable so the values aren't actually -1
+class CC3DType(object):
+    MEDIUM = 0
+    
+    APC = -1
+    
+    TREG_INACTIVE = -1
+    TREG_ACTIVE = -1
+    TREG_ANERGIC = -1
+    
+    TCONV_INACTIVE = -1
+    TCONV_ACTIVE = -1
+    TCONV_ANERGIC = -1
+
+# The state of a TCell
+class State(object):
+    ACTIVE = 0
+    INACTIVE = 1
+    ANERGIC = 2
+    
+    # Used for APC-TCell ligand and receptor binding.
+    # When Peptide-MHC and TCR bind they call others to the binding area
+    # This is part of a process called TCell co-activation.
+    # Please see Kaur14PhD (http://etheses.bham.ac.uk/4903/8/Kaur14PhD.pdf) for more information about co-activation.
+    AWAITING_COACTIVATION = 3
@@ -0,0 +1,137 @@
+##########################################################
+#	File: Checkpoint.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Saves everything needed to continue a simulation later and loads it back.
+#	A run that was stopped (e.g. a batch job that ran out of time) continues from its last
+#	checkpoint instead of MCS 0 and ends up exactly where an uninterrupted run would.
+#
+#	A checkpoint has:
+#		The CellStore (every TCell/APC quantity, bindings, free slots and event counts)
+#		The variables inside Data.py
+#		The state of random, numpy.random, DICE (see Dice.py) and the random generator of the simulator
+#		The simulator itself (lattice and cells, see HeadlessSimulator.checkpoint)
+#		Whatever each steppable gives back from its checkpoint method
+#
+#	Steppables restore themselves with resume(state) instead of start().
+#	Steppables without a resume method just run start() as usual.
+#
+#	The file is a compressed numpy .npz. The header is JSON and every numpy array
+#	is stored next to it as its own entry.
+#
+#	Version 3 saves the blocks of DICE by name and weights (see Dice.get_state). Older checkpoints can't
+#	be loaded, finish them with the model that saved them or run them again from MCS 0.
+#
+##########################################################
+import json
+import os
+import random
+
+import numpy
+
+import Data
+from CellStore import STORE
+from Dice import DICE
+
+# Increase this if the format of the files changes
+VERSION = 3
+
+# Name of the JSON entry inside the .npz
+HEADER = 'header'
+
+# Marks where an array was taken out of the header
+ARRAY_KEY = '__array__'
+
+def pack(value, arrays):
+    # Replace the numpy arrays inside value by references so the rest can be written as JSON
+    if isinstance(value, numpy.ndarray):
+        name = 'array_' + str(len(arrays))
+        arrays[name] = value
+        return {ARRAY_KEY: name}
+    if isinstance(value, dict):
+        return dict((str(key), pack(item, arrays)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [pack(item, arrays) for item in value]
+    if isinstance(value, numpy.generic):
+        return value.item()
+    return value
+
+def unpack(value, arrays):
+    # Opposite of pack
+    if isinstance(value, dict):
+        if ARRAY_KEY in value:
+            return arrays[value[ARRAY_KEY]]
+        return dict((key, unpack(item, arrays)) for key, item in value.items())
+    if isinstance(value, list):
+        return [unpack(item, arrays) for item in value]
+    return value
+
+def data_values():
+    # Every variable inside Data.py
+    return dict((name, getattr(Data, name)) for name in dir(Data) if name.startswith('TOTAL_'))
+
+def save(path, simulator, mcs, store=STORE):
+    # mcs is the first MCS that has to run after loading
+    state = {
+        'version': VERSION,
+        'mcs': mcs,
+        'random': random.getstate(),
+        'numpy_random': numpy.random.get_state(),
+        'dice': DICE.get_state(),
+        'store': store.checkpoint(),
+        'data': data_values(),
+        'simulator': simulator.checkpoint(),
+        'steppables': [steppable.checkpoint() if hasattr(steppable, 'checkpoint') else None
+                       for steppable in simulator.steppables],
+    }
+
+    arrays = {}
+    header = json.dumps(pack(state, arrays))
+    arrays[HEADER] = numpy.array(header)
+
+    # Write next to the old checkpoint and only replace it once everything is on disk
+    # That way stopping the run while saving never leaves us without a checkpoint
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as checkpoint_file:
+        numpy.savez_compressed(checkpoint_file, **arrays)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    getattr(os, 'replace', os.rename)(temporary, path)
+
+def load(path, simulator, store=STORE):
+    # Puts everything back and returns the first MCS that has to run
+    archive = numpy.load(path)
+    try:
+        arrays = dict((name, archive[name]) for name in archive.files)
+    finally:
+        archive.close()
+
+    state = json.loads(str(arrays.pop(HEADER)))
+    if state['version'] != VERSION:
+        raise ValueError('Unsupported checkpoint version ' + str(state['version']) + ' in ' + path)
+    state = unpack(state, arrays)
+
+    if len(state['steppables']) != len(simulator.steppables):
+        raise ValueError('The checkpoint ' + path + ' has ' + str(len(state['steppables'])) +
+                         ' steppables but the simulation has ' + str(len(simulator.steppables)))
+
+    # The cells first, then the steppables (they attach their information to the cells)
+    simulator.resume(state['simulator'])
+    store.resume(state['store'])
+    for steppable, steppable_state in zip(simulator.steppables, state['steppables']):
+        if hasattr(steppable, 'resume'):
+            steppable.resume(steppable_state)
+        else:
+            steppable.start()
+
+    for name, value in state['data'].items():
+        setattr(Data, name, value)
+
+    # Random numbers last so nothing above uses them up
+    version, internal, gauss_next = state['random']
+    random.setstate((version, tuple(internal), gauss_next))
+    numpy.random.set_state(tuple(state['numpy_random']))
+    DICE.set_state(state['dice'])
+
+    return state['mcs']
@@ -0,0 +1,184 @@
+##########################################################
+#	File: Chemokine.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	The TATTRACT field that brings inactive TCells to the APCs (Chemotaxis plugin of Model.xml).
+#	DiffusionSolverFE integrates it every MCS over the whole lattice, but TATTRACT diffuses much faster
+#	than the APCs move so all the TCells really feel is its steady state:
+#		D * laplacian(c) - decay * c = -secretion
+#	With Config.CHEMOKINE_MODE = 'steady' ChemokineSteppable solves that directly instead.
+#
+#	The lattice is cut in cubes of Config.CHEMOKINE_RESOLUTION pixels and every APC secretes into its cube.
+#	The equation is solved in one go with FFTs: mirroring the field along each axis makes
+#	the walls of the lattice no-flux (like DiffusionSolverFE) and turns the 7 point laplacian into a division.
+#	Without decay nothing ever leaves the lattice, so the field keeps rising everywhere at the same rate
+#	and only its shape (what chemotaxis follows) is kept, shifted so its lowest value is 0.
+#
+#	The field is solved again every Config.CHEMOKINE_INTERVAL MCS, or before that once more than
+#	Config.CHEMOKINE_CHANGED_FRACTION of the APCs appeared, died or moved more than
+#	Config.CHEMOKINE_DISPLACEMENT pixels since the last time.
+#
+#	Inside CC3D the values are written into the TATTRACT field of the Chemotaxis plugin.
+#	CC3D only lets Python set one pixel at a time, so after the first time only the cubes that changed
+#	by more than Config.CHEMOKINE_TOLERANCE are written again.
+#	Set the DiffusionConstant of DiffusionSolverFE to 0 and remove the Secretion plugin in Model.xml,
+#	that way the field still exists but only we change it.
+#	Headless.py moves the cells along it itself with the Lambda of their type in Model.xml (see Lattice.potts_step).
+#
+##########################################################
+import numpy
+
+import Config
+
+# The field of Model.xml we replace
+FIELD_NAME = 'TATTRACT'
+
+##########################################################
+#	SteadyStateSolver
+#
+#	Steady state of diffusion with decay and point sources inside a box with no-flux walls.
+##########################################################
+class SteadyStateSolver(object):
+    def __init__(self, dimensions, diffusion, decay=0.0, resolution=1):
+        # Pixels per side of every cube of the field
+        self.resolution = max(1, int(resolution))
+        self.shape = tuple(max(1, -(-int(d) // self.resolution)) for d in dimensions)
+        self.diffusion = float(diffusion)
+        self.decay = float(decay)
+
+        # Eigenvalues of -D * laplacian + decay for every frequency of the mirrored box
+        # The last axis is halved because the field is real (rfftn)
+        spacing = float(self.resolution)
+        eigen = [(2 - 2 * numpy.cos(numpy.pi * numpy.arange(2 * n) / n)) / spacing ** 2 for n in self.shape]
+        eigen[2] = eigen[2][:self.shape[2] + 1]
+        self.denominator = self.diffusion * (eigen[0][:, None, None] + eigen[1][None, :, None] + eigen[2][None, None, :]) + self.decay
+
+        # Without decay the average of the field has no steady state, we leave it out
+        if self.decay <= 0:
+            self.denominator[0, 0, 0] = numpy.inf
+
+    def cubes(self, centers):
+        # Cube of the field of every center (pixels)
+        cubes = numpy.floor(numpy.asarray(centers, dtype=float).reshape(-1, 3) / self.resolution).astype(numpy.int64)
+        return numpy.clip(cubes, 0, numpy.array(self.shape) - 1)
+
+    def solve(self, centers, amounts):
+        # Field of every cube given how much each source (at its center, in pixels) secretes per MCS
+        source = numpy.zeros(self.shape)
+        if len(centers):
+            cubes = self.cubes(centers)
+            amounts = numpy.broadcast_to(numpy.asarray(amounts, dtype=float), (len(cubes),))
+            numpy.add.at(source, tuple(cubes.T), amounts / float(self.resolution) ** 3)
+
+        # Mirror along each axis so the FFT sees a box without walls whose solution has no flux at ours
+        mirrored = source
+        for axis in range(3):
+            mirrored = numpy.concatenate((mirrored, numpy.flip(mirrored, axis)), axis=axis)
+
+        field = numpy.fft.irfftn(numpy.fft.rfftn(mirrored) / self.denominator, mirrored.shape)
+        field = field[:self.shape[0], :self.shape[1], :self.shape[2]]
+        if self.decay <= 0:
+            field -= field.min()
+        return field
+
+    def pixels(self, field):
+        # Same field with one value per pixel
+        for axis in range(3):
+            field = numpy.repeat(field, self.resolution, axis=axis)
+        return field
+
+##########################################################
+#	QuasiSteadyField
+#
+#	Keeps the TATTRACT field of the APCs and decides when it has to be solved again.
+##########################################################
+class QuasiSteadyField(object):
+    def __init__(self, spec, interval=None, displacement=None, changed_fraction=None, resolution=None):
+        self.interval = Config.CHEMOKINE_INTERVAL if interval is None else interval
+        self.displacement = Config.CHEMOKINE_DISPLACEMENT if displacement is None else displacement
+        self.changed_fraction = Config.CHEMOKINE_CHANGED_FRACTION if changed_fraction is None else changed_fraction
+        resolution = Config.CHEMOKINE_RESOLUTION if resolution is None else resolution
+        self.solver = SteadyStateSolver(spec.dimensions, spec.diffusion_constant, spec.decay_constant, resolution)
+
+        # What every APC secretes per MCS, in every pixel of it like the Secretion plugin
+        self.secretion = spec.secretion.get('APC', 0.0) * spec.width ** 3
+
+        # The field, when it was solved and the APCs it was solved for
+        self.field = None
+        self.solved_mcs = None
+        self.ids = numpy.zeros(0, dtype=numpy.int64)
+        self.centers = numpy.zeros((0, 3))
+        # What the CC3D field holds right now (see apply), None until it was written once
+        self.applied = None
+
+    def due(self, mcs, ids, centers):
+        # Whether the APCs changed enough (or enough time went by) to solve the field again
+        if self.field is None or mcs - self.solved_mcs >= self.interval:
+            return True
+
+        # APCs that are still here and where they were (both id lists are sorted)
+        kept = numpy.intersect1d(ids, self.ids)
+        now = centers[numpy.searchsorted(ids, kept)]
+        before = self.centers[numpy.searchsorted(self.ids, kept)]
+        moved = int((numpy.abs(now - before).max(axis=1) > self.displacement).sum()) if len(kept) else 0
+
+        appeared = len(ids) - len(kept)
+        died = len(self.ids) - len(kept)
+        return moved + appeared + died > self.changed_fraction * max(1, len(kept) + appeared + died)
+
+    def update(self, mcs, ids, centers):
+        # Give back True when the field was solved again
+        order = numpy.argsort(ids)
+        ids = numpy.asarray(ids, dtype=numpy.int64)[order]
+        centers = numpy.asarray(centers, dtype=float).reshape(-1, 3)[order]
+        if not self.due(mcs, ids, centers):
+            return False
+
+        self.field = self.solver.solve(centers, self.secretion)
+        self.solved_mcs = mcs
+        self.ids = ids
+        self.centers = centers
+        return True
+
+    def checkpoint(self):
+        return {'field': self.field, 'solved_mcs': self.solved_mcs, 'ids': self.ids, 'centers': self.centers}
+
+    def resume(self, state):
+        self.field = state['field']
+        self.solved_mcs = state['solved_mcs']
+        self.ids = numpy.asarray(state['ids'], dtype=numpy.int64)
+        self.centers = numpy.asarray(state['centers'], dtype=float).reshape(-1, 3)
+
+def changed_cubes(field):
+    # Cubes of the field that differ from what was last written by more than the tolerance (every cube the first time)
+    if field.applied is None:
+        return numpy.ones(field.field.shape, dtype=bool)
+
+    tolerance = Config.CHEMOKINE_TOLERANCE * numpy.abs(field.field).max()
+    return numpy.abs(field.field - field.applied) > tolerance
+
+def apply(steppable, field):
+    # Hand the field to the simulator (see Headless.py) or write the cubes that changed into the CC3D field
+    solver = field.solver
+    set_field = getattr(steppable.simulator, 'set_concentration_field', None)
+    if set_field is not None:
+        set_field(FIELD_NAME, field.field, solver.resolution)
+        return
+
+    import CompuCell
+    cc3d_field = CompuCell.getConcentrationField(steppable.simulator, FIELD_NAME)
+    dimensions = steppable.simulator.getPotts().getCellFieldG().getDim()
+    changed = changed_cubes(field)
+    side = solver.resolution
+    for cube_x, cube_y, cube_z in zip(*numpy.nonzero(changed)):
+        value = float(field.field[cube_x, cube_y, cube_z])
+        for x in range(cube_x * side, min((cube_x + 1) * side, dimensions.x)):
+            for y in range(cube_y * side, min((cube_y + 1) * side, dimensions.y)):
+                for z in range(cube_z * side, min((cube_z + 1) * side, dimensions.z)):
+                    cc3d_field[x, y, z] = value
+
+    if field.applied is None:
+        field.applied = field.field.copy()
+    else:
+        field.applied[changed] = field.field[changed]
@@ -12,9 +12,110 @@
 # How much CD28 is needed to become active
 CD28_THRESHOLD = 2
 
+# How ligands and receptors bind (see Binding.py)
+#	'contact': every TCell-APC contact binds at most one receptor per MCS
+#	'tau_leaping': binding happens at a rate and BINDING_TAU MCS worth of binding is done every MCS
+BINDING_MODE = 'contact'
+# How much binding time (mcs) every MCS covers in 'tau_leaping' mode
+BINDING_TAU = 1.0
+# Binding rate of CD28/CTLA-4 with CD80/CD86 per receptor, per ligand and per MCS in 'tau_leaping' mode
+# It is multiplied by the affinities inside WEIGHTS_CD80 and WEIGHTS_CD86 (each divided by the sum of its weights)
+BINDING_RATE = 0.002
+# Binding rate of TCR with Peptide-MHC per receptor, per ligand and per MCS in 'tau_leaping' mode
+TCR_BINDING_RATE = 0.002
+# Processes that bind the contacts of an MCS together in 'contact' mode, grouped by APC (see Interactions.py)
+# 0 binds them all in the simulation's own process, the result is the same either way
+INTERACTION_WORKERS = 0
+# Smaller batches of contacts are bound in the simulation's own process anyway
+INTERACTION_MIN_CONTACTS = 20000
+
+# How active TCells recycle CTLA-4
+#	'toggle': while touching an APC CTLA-4 moves 1 at a time, switching direction every 10 MCS (the model as it was)
+#	'ode': CTLA-4 moves in and out at the rates below (see Recycling.py)
+RECYCLING_MODE = 'toggle'
+# The rates are not measured, they are placeholders picked so most CTLA-4 ends up inside
+# (2/3 at steady state, approached with a time constant of about 7 MCS) as it is in real TCells. Fit them before trusting 'ode'
+# Fraction of external CTLA-4 internalized per MCS
+CTLA4_ENDOCYTOSIS_RATE = 0.1
+# Fraction of internal CTLA-4 sent back to the surface per MCS
+CTLA4_EXOCYTOSIS_RATE = 0.05
+# Runge-Kutta steps per MCS
+RECYCLING_SUBSTEPS = 2
+
+# lambdaVec of the ExternalPotential given to each kind of cell when it appears (see Transitions.py)
+# The smaller it is the more the cell moves, APCs move faster than TCells
+APC_MOTILITY = 6
+TCELL_MOTILITY = 45
+
 # How much time a cell will wait before resetting (mcs)
 WAIT_TIME = 10
 
+# Size (pixels) of the cubes the space is cut in to find cells near a point (see Spatial.py)
+# About the distance between two cells works best
+SPATIAL_CELL_SIZE = 10.0
+
+# How the TATTRACT field that attracts inactive TCells to APCs is computed
+#	'diffusion': DiffusionSolverFE of Model.xml integrates it every MCS (Headless.py doesn't follow it)
+#	'steady': ChemokineSteppable solves its steady state directly (see Chemokine.py)
+CHEMOKINE_MODE = 'diffusion'
+# Most MCS between two solves of the steady field
+# Inside CC3D every solve is written into the field one pixel at a time from Python, half a million calls
+# for the 100x100x50 lattice of Model.xml (about ten times longer than the solve), so after the first time
+# only the cubes that changed by more than CHEMOKINE_TOLERANCE (a fraction of the highest value of the field)
+# are written. Headless.py takes the whole array at once
+CHEMOKINE_INTERVAL = 50
+CHEMOKINE_TOLERANCE = 0.01
+# The field is solved again before that once more than this fraction of the APCs
+# appeared, died or moved further than CHEMOKINE_DISPLACEMENT (pixels) since the last solve
+CHEMOKINE_CHANGED_FRACTION = 0.25
+CHEMOKINE_DISPLACEMENT = 7.0
+# Pixels per side of every cube of the steady field, bigger is faster but coarser
+CHEMOKINE_RESOLUTION = 2
+
+# How far a cell's center of mass has to move (pixels) before we look at its neighbors again
+# Used by the ContactTracker inside CC3D (see Contacts.py)
+CONTACT_DISPLACEMENT = 0.5
+
+# Folder where PlotSteppable saves the values of every plot while the simulation runs (see Metrics.py)
+METRICS_FILE = 'metrics'
+
+# How often (mcs) the values of the plots are recorded
+PLOT_INTERVAL = 1
+# Use a different interval for some values, e.g. {'TOTAL_AMOUNT_CD80': 10}
+# The names are the variables inside Data.py
+PLOT_INTERVALS = {}
+# Most points kept for each curve of the plots
+# When there are more, neighboring points are merged keeping their minimum and maximum so peaks don't disappear
+PLOT_MAX_POINTS = 1000
+# How often (mcs) the plot windows are redrawn
+PLOT_REFRESH = 10
+
+# How often (mcs) the cell field and every cell are saved to look at the run afterwards (see Snapshots.py), 0 to never save them
+SNAPSHOT_INTERVAL = 0
+# Folder where they are saved
+SNAPSHOT_FILE = 'snapshots'
+# Layers (along x) of the field compressed together, reading part of the field only reads its layers
+SNAPSHOT_CHUNK = 16
+# Every this many snapshots one is saved whole, the others only save what changed since the one before
+SNAPSHOT_KEYFRAME_INTERVAL = 20
+
+# Where the whole simulation is saved to continue it later (see Checkpoint.py)
+# Only used when running without CC3D (see Headless.py)
+CHECKPOINT_FILE = 'checkpoint.npz'
+# How often (mcs) a checkpoint is saved, 0 to never save one
+CHECKPOINT_INTERVAL = 0
+
+# Table with the results of every point of a parameter sweep (see Sweep.py)
+SWEEP_FILE = 'results'
+
+# Mean and confidence band of the plots of an ensemble of replicates (see Ensemble.py)
+ENSEMBLE_FILE = 'ensemble'
+
+# Time every steppable and the phases of MainSteppable (see Profiling.py)
+PROFILE = False
+# Where the timings are saved when the simulation finishes
+PROFILE_FILE = 'profile.json'
+
 # How old the cells are when born (volume)
 INITIAL_AGE = 15.0
 
@@ -29,6 +130,13 @@ PROB_APOPTOSIS = 0.1
 PROB_DIVISION = 0.4
 PROB_QUIESCENCE = 0.5
 
+# Dead cells are removed and their slot of the CellStore is used again by the next cell born
+# Once more than this fraction of the slots are empty the store moves every cell to the front and shrinks
+COMPACT_FRACTION = 0.5
+
+# Dice of every kind drawn at once (see Dice.py)
+DICE_BLOCK = 4096
+
 # Probabilities of which ligand will be lost when losing a ligand
 PROB_LOST_CD80 = 0.5
 PROB_LOST_CD86 = 0.5
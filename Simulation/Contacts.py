@@ -0,0 +1,306 @@
+##########################################################
+#	File: Contacts.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Lists the TCell-APC contacts of an MCS.
+#	Every pair is listed once (TCell id, APC id, common surface area).
+#	APC-APC and TCell-TCell neighbors are left out because they don't interact,
+#	and so are anergic and dead cells.
+#
+#	The simulation uses the ContactTracker: it keeps the contacts from one MCS to the next and only
+#	looks at the neighbors of cells that moved, so its cost follows how much the cells move.
+#
+#	contact_pairs finds every contact again from scratch (walk_neighbors inside CC3D walks the neighbors
+#	of the APCs only, Headless.py can give us every touching pair itself) and index_pairs turns them
+#	into contacts. The simulation doesn't use them, they are the reference the tracker is checked against
+#	(tests/test_contacts.py) and what the contacts_scan benchmark times (see Benchmark.py).
+#
+##########################################################
+import numpy
+
+import Config
+from CellStore import STORE
+from CellTypes import State
+
+class ContactPairs(object):
+    def __init__(self, tcell_ids, apc_ids, areas):
+        self.tcell_ids = tcell_ids
+        self.apc_ids = apc_ids
+        self.areas = areas
+
+    def __len__(self):
+        return len(self.tcell_ids)
+
+    def __iter__(self):
+        # (TCell id, APC id, common surface area)
+        return iter(list(zip(self.tcell_ids.tolist(), self.apc_ids.tolist(), self.areas.tolist())))
+
+def walk_neighbors(steppable):
+    # Look at the neighbors of every APC, that way each pair comes up once
+    first_ids = []
+    second_ids = []
+    areas = []
+
+    for cell in steppable.cellList:
+        if cell.type != steppable.APC or cell.targetVolume <= 0:
+            continue
+
+        for neighbor, commonSurfaceArea in steppable.getCellNeighborDataList(cell):
+            if neighbor and neighbor.type != steppable.APC and neighbor.targetVolume > 0:
+                first_ids.append(cell.id)
+                second_ids.append(neighbor.id)
+                areas.append(commonSurfaceArea)
+
+    return numpy.array(first_ids, dtype=numpy.int64), numpy.array(second_ids, dtype=numpy.int64), numpy.array(areas, dtype=float)
+
+def index_pairs(first_ids, second_ids, areas, store=STORE):
+    # Turn touching pairs (in any order) into TCell-APC contacts
+    first_ids = numpy.asarray(first_ids, dtype=numpy.int64)
+    second_ids = numpy.asarray(second_ids, dtype=numpy.int64)
+    areas = numpy.asarray(areas, dtype=float)
+
+    # Put the TCell first and the APC second
+    first_slots = store.slots(first_ids)
+    second_slots = store.slots(second_ids)
+    first_is_apc = store.kind[first_slots] == store.APC
+    tcell_ids = numpy.where(first_is_apc, second_ids, first_ids)
+    apc_ids = numpy.where(first_is_apc, first_ids, second_ids)
+    tcell_slots = numpy.where(first_is_apc, second_slots, first_slots)
+    apc_slots = numpy.where(first_is_apc, first_slots, second_slots)
+
+    tcell_kind = store.kind[tcell_slots]
+    keep = (store.kind[apc_slots] == store.APC)
+    keep &= (tcell_kind == store.TREG) | (tcell_kind == store.TCONV)
+    keep &= store.state[tcell_slots] != State.ANERGIC
+    keep &= store.alive[tcell_slots] & store.alive[apc_slots]
+
+    tcell_ids = tcell_ids[keep]
+    apc_ids = apc_ids[keep]
+    areas = areas[keep]
+
+    # Each pair only once, ordered by TCell id and then APC id
+    order = numpy.lexsort((apc_ids, tcell_ids))
+    tcell_ids = tcell_ids[order]
+    apc_ids = apc_ids[order]
+    areas = areas[order]
+    if len(tcell_ids):
+        unique = numpy.r_[True, (tcell_ids[1:] != tcell_ids[:-1]) | (apc_ids[1:] != apc_ids[:-1])]
+        tcell_ids = tcell_ids[unique]
+        apc_ids = apc_ids[unique]
+        areas = areas[unique]
+
+    return ContactPairs(tcell_ids, apc_ids, areas)
+
+def pair_keys(tcell_ids, apc_ids):
+    # One number per (TCell id, APC id), ids stay far below 2^31
+    return (numpy.asarray(tcell_ids, dtype=numpy.int64) << 32) | numpy.asarray(apc_ids, dtype=numpy.int64)
+
+def contact_pairs(steppable, store=STORE):
+    # The TCell-APC contacts of this MCS looking at every cell (the reference for ContactTracker.pairs)
+    touching = getattr(getattr(steppable, 'simulator', None), 'touching_pairs', None)
+    if touching is not None:
+        first_ids, second_ids, areas = touching()
+    else:
+        first_ids, second_ids, areas = walk_neighbors(steppable)
+
+    return index_pairs(first_ids, second_ids, areas, store)
+
+##########################################################
+#	ContactTracker
+#
+#	Remembers every TCell-APC contact and only updates the cells that moved.
+#	Headless.py tells us which cells moved during the Potts step.
+#	Inside CC3D we use the center of mass: a cell is looked at again once it moved more than Config.CONTACT_DISPLACEMENT.
+#
+#	The contacts are kept as rows of arrays (TCell id, APC id, common surface area).
+#	Rows of lost contacts are freed and used again by the next contacts added.
+##########################################################
+class ContactTracker(object):
+    def __init__(self, displacement=None, store=STORE):
+        self.displacement = Config.CONTACT_DISPLACEMENT if displacement is None else displacement
+        self.store = store
+
+        # Cell id -> center of mass the last time we looked at its neighbors (CC3D only)
+        self.centers = {}
+        # Cell id -> CC3D cell as of the last update (CC3D only)
+        self.cells = {}
+
+        # Events of the last update as (TCell id, APC id)
+        self.added = []
+        self.removed = []
+
+        self.clear_rows()
+
+    def clear_rows(self):
+        # Free rows, given out from the end
+        self.free = []
+        self.tcell_ids = numpy.zeros(0, dtype=numpy.int64)
+        self.apc_ids = numpy.zeros(0, dtype=numpy.int64)
+        self.areas = numpy.zeros(0, dtype=float)
+        self.used = numpy.zeros(0, dtype=bool)
+        # Used rows in order of TCell id and then APC id, None when contacts were added or removed since
+        self.order = None
+
+    def checkpoint(self):
+        # Our contacts and centers (see Checkpoint.py)
+        rows = self.sorted_rows()
+        centers = [[id, list(center)] for id, center in self.centers.items()]
+        return {'tcell_ids': self.tcell_ids[rows], 'apc_ids': self.apc_ids[rows], 'areas': self.areas[rows],
+                'centers': centers}
+
+    def resume(self, state):
+        self.centers = dict((id, tuple(center)) for id, center in state['centers'])
+        self.clear_rows()
+        self.add_rows(numpy.asarray(state['tcell_ids'], dtype=numpy.int64),
+                      numpy.asarray(state['apc_ids'], dtype=numpy.int64), numpy.asarray(state['areas'], dtype=float))
+
+    def update(self, steppable):
+        # Bring the contacts up to date, returns the contacts that were added and removed
+        simulator = getattr(steppable, 'simulator', None)
+        take_changed_cells = getattr(simulator, 'take_changed_cells', None)
+
+        if take_changed_cells is not None:
+            changed = take_changed_cells()
+            first_ids, second_ids, areas = simulator.neighbor_pairs(list(changed))
+        else:
+            changed = self.moved_cells(steppable)
+            first_ids, second_ids, areas = self.neighbor_partners(changed, steppable)
+
+        self.refresh(changed, *self.oriented(first_ids, second_ids, areas))
+        return self.added, self.removed
+
+    def moved_cells(self, steppable):
+        # Which cells moved far enough since we last looked at them (or appeared, died or disappeared)
+        self.cells = {}
+        changed = []
+
+        for cell in steppable.cellList:
+            self.cells[cell.id] = cell
+            center = (cell.xCOM, cell.yCOM, cell.zCOM)
+            last = self.centers.get(cell.id)
+
+            if last is None or cell.targetVolume <= 0 or \
+               max(abs(center[0] - last[0]), abs(center[1] - last[1]), abs(center[2] - last[2])) > self.displacement:
+                changed.append(cell.id)
+                self.centers[cell.id] = center
+
+        for id in list(self.centers):
+            if id not in self.cells:
+                changed.append(id)
+                del self.centers[id]
+
+        return changed
+
+    def neighbor_partners(self, changed, steppable):
+        # (ids, neighbor ids, areas) from the CC3D neighbor lists of the changed cells
+        first_ids = []
+        second_ids = []
+        areas = []
+        for id in changed:
+            cell = self.cells.get(id)
+            if cell is None or cell.targetVolume <= 0:
+                continue
+
+            for neighbor, commonSurfaceArea in steppable.getCellNeighborDataList(cell):
+                if neighbor and neighbor.targetVolume > 0:
+                    first_ids.append(id)
+                    second_ids.append(neighbor.id)
+                    areas.append(commonSurfaceArea)
+
+        return first_ids, second_ids, areas
+
+    def oriented(self, first_ids, second_ids, areas):
+        # Only the TCell-APC pairs, as (TCell ids, APC ids, areas) with each pair once
+        first_ids = numpy.asarray(first_ids, dtype=numpy.int64)
+        second_ids = numpy.asarray(second_ids, dtype=numpy.int64)
+        areas = numpy.asarray(areas, dtype=float)
+
+        first_kind = self.store.kind[self.store.slots(first_ids)]
+        second_kind = self.store.kind[self.store.slots(second_ids)]
+        first_tcell = (first_kind == self.store.TREG) | (first_kind == self.store.TCONV)
+        second_tcell = (second_kind == self.store.TREG) | (second_kind == self.store.TCONV)
+        first_apc = first_kind == self.store.APC
+        keep = (first_tcell & (second_kind == self.store.APC)) | (second_tcell & first_apc)
+
+        tcell_ids = numpy.where(first_apc, second_ids, first_ids)[keep]
+        apc_ids = numpy.where(first_apc, first_ids, second_ids)[keep]
+        # Both cells of a pair can have moved, so a pair can come up twice
+        _, unique = numpy.unique(pair_keys(tcell_ids, apc_ids), return_index=True)
+        return tcell_ids[unique], apc_ids[unique], areas[keep][unique]
+
+    def refresh(self, changed, tcell_ids, apc_ids, areas):
+        # Replace the contacts of the changed cells with their new ones and record the differences
+        rows = numpy.flatnonzero(self.used)
+        changed = numpy.asarray(list(changed), dtype=numpy.int64)
+        marked = numpy.zeros(max(int(changed.max()) if len(changed) else 0,
+                                 int(self.tcell_ids.max()) if len(self.tcell_ids) else 0,
+                                 int(self.apc_ids.max()) if len(self.apc_ids) else 0) + 1, dtype=bool)
+        marked[changed] = True
+        old = rows[marked[self.tcell_ids[rows]] | marked[self.apc_ids[rows]]]
+
+        # Contacts are matched by key, old_keys is sorted since unique sorts
+        old_keys, order = numpy.unique(pair_keys(self.tcell_ids[old], self.apc_ids[old]), return_index=True)
+        old = old[order]
+        new_keys = pair_keys(tcell_ids, apc_ids)
+        found = numpy.searchsorted(old_keys, new_keys)
+        found[found == len(old_keys)] = 0
+        kept = (old_keys[found] == new_keys) if len(old_keys) else numpy.zeros(len(new_keys), dtype=bool)
+        lost = numpy.ones(len(old), dtype=bool)
+        lost[found[kept]] = False
+
+        self.areas[old[found[kept]]] = areas[kept]
+        gone = old[lost]
+        self.removed = list(zip(self.tcell_ids[gone].tolist(), self.apc_ids[gone].tolist()))
+        self.added = list(zip(tcell_ids[~kept].tolist(), apc_ids[~kept].tolist()))
+
+        self.used[gone] = False
+        self.free.extend(gone.tolist())
+        self.add_rows(tcell_ids[~kept], apc_ids[~kept], areas[~kept])
+        if len(gone):
+            self.order = None
+
+    def add_rows(self, tcell_ids, apc_ids, areas):
+        count = len(tcell_ids)
+        if not count:
+            return
+        while len(self.free) < count:
+            self.grow()
+        rows = self.free[len(self.free) - count:]
+        del self.free[len(self.free) - count:]
+
+        self.tcell_ids[rows] = tcell_ids
+        self.apc_ids[rows] = apc_ids
+        self.areas[rows] = areas
+        self.used[rows] = True
+        self.order = None
+
+    def grow(self):
+        # Twice as many rows, the new ones are free (given out lowest first)
+        size = len(self.used)
+        capacity = max(64, 2 * size)
+        self.tcell_ids = numpy.resize(self.tcell_ids, capacity)
+        self.apc_ids = numpy.resize(self.apc_ids, capacity)
+        self.areas = numpy.resize(self.areas, capacity)
+        self.used = numpy.r_[self.used, numpy.zeros(capacity - size, dtype=bool)]
+        self.free = list(range(capacity - 1, size - 1, -1)) + self.free
+
+    def sorted_rows(self):
+        # Only sorted again when contacts were added or removed
+        if self.order is None:
+            rows = numpy.flatnonzero(self.used)
+            self.order = rows[numpy.lexsort((self.apc_ids[rows], self.tcell_ids[rows]))]
+        return self.order
+
+    def pairs(self):
+        # The current TCell-APC contacts, same as contact_pairs but straight from the rows
+        rows = self.sorted_rows()
+        tcell_ids = self.tcell_ids[rows]
+        apc_ids = self.apc_ids[rows]
+        tcell_slots = self.store.slots(tcell_ids)
+        apc_slots = self.store.slots(apc_ids)
+
+        # Cells become anergic or die without moving
+        keep = self.store.state[tcell_slots] != State.ANERGIC
+        keep &= self.store.alive[tcell_slots] & self.store.alive[apc_slots]
+        return ContactPairs(tcell_ids[keep], apc_ids[keep], self.areas[rows][keep])
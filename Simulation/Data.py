@@ -4,8 +4,8 @@
 #	Version: Model v5
 #
 #	This file is used for the plots of CC3D.
-#	The variables stored here are modified by their
-#		respective mechanisms and plotted in the graphs.
+#	The variables stored here are computed from the cells
+#		by Totals.update_data and plotted in the graphs.
 #	
 ##########################################################
 
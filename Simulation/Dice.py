@@ -0,0 +1,159 @@
+##########################################################
+#	File: Dice.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Every dice our cells throw one at a time (which ligand an APC loses, which ligand and receptor
+#	a TCell binds, the fate of old cells...) comes from DICE instead of random or numpy.random.
+#	Drawing one number from numpy costs about as much as drawing thousands, so every kind of dice
+#	is drawn Config.DICE_BLOCK at a time and handed out one by one until the block runs out.
+#
+#	Weighted choices (e.g. Config.WEIGHTS_CD80) use an alias table: one uniform picks a column
+#	and a second one decides between the column and its alias, so every choice costs the same
+#	no matter how many options there are. Every name has its own table and block for each weights it is thrown with,
+#	so dice of one name thrown with different weights (e.g. fewer options available) don't throw each other's block away.
+#	Picking one of a few options that are all equally likely just uses a uniform (see index).
+#	DICE can also stand in for a numpy generator (random_sample and poisson), that is how Binding.py uses it.
+#
+#	DICE has its own random generator, seeded by Headless.py together with the others
+#	(from the operating system inside CC3D). Its state, including the numbers drawn but not used yet,
+#	is saved in checkpoints (see Checkpoint.py) so a resumed run throws the same dice:
+#		state = DICE.get_state()
+#		DICE.set_state(state)
+#
+##########################################################
+import numpy
+
+import Config
+
+##########################################################
+#	AliasTable
+#
+#	Draws 0..n-1 with the given weights (Vose's alias method).
+##########################################################
+class AliasTable(object):
+    def __init__(self, weights):
+        weights = numpy.asarray(weights, dtype=numpy.float64)
+        count = len(weights)
+        scaled = weights * count / weights.sum()
+
+        # Chance of keeping each column and the column used otherwise
+        self.probability = numpy.ones(count)
+        self.alias = numpy.arange(count)
+
+        small = [column for column in range(count) if scaled[column] < 1.0]
+        large = [column for column in range(count) if scaled[column] >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1 up to rounding and keeps its own column
+
+    def draw(self, rng, count):
+        column = rng.randint(len(self.probability), size=count)
+        return numpy.where(rng.random_sample(count) < self.probability[column], column, self.alias[column])
+
+##########################################################
+#	Stream
+#
+#	A block of draws of one kind and how many of them were handed out.
+##########################################################
+class Stream(object):
+    __slots__ = ('weights', 'table', 'values', 'cursor')
+
+    def __init__(self, weights=None, values=None):
+        # None for uniforms, the weights of the alias table otherwise
+        self.weights = weights
+        self.table = AliasTable(weights) if weights is not None else None
+        self.values = numpy.zeros(0, dtype=numpy.float64 if weights is None else numpy.int64) if values is None else values
+        self.cursor = 0
+
+    def draw(self, rng, count):
+        if self.table is None:
+            return rng.random_sample(count)
+        return self.table.draw(rng, count)
+
+##########################################################
+#	Dice
+##########################################################
+class Dice(object):
+    def __init__(self, block=None, seed=None):
+        self.block = max(1, Config.DICE_BLOCK if block is None else block)
+        self.rng = numpy.random.RandomState(seed)
+        # (name, weights) -> Stream, weights is None for uniforms
+        self.streams = {}
+
+    def seed(self, seed=None):
+        # Start over, the blocks drawn with the old seed are thrown away
+        self.rng = numpy.random.RandomState(seed)
+        self.streams = {}
+
+    def stream(self, name, weights=None):
+        stream = self.streams.get((name, weights))
+        if stream is None:
+            stream = self.streams[(name, weights)] = Stream(weights)
+        return stream
+
+    def take(self, stream, count):
+        # The next count draws of a stream, drawing more blocks when it runs out
+        if stream.cursor + count > len(stream.values):
+            left = stream.values[stream.cursor:]
+            drawn = stream.draw(self.rng, max(self.block, count - len(left)))
+            stream.values = numpy.concatenate((left, drawn)) if len(left) else drawn
+            stream.cursor = 0
+
+        values = stream.values[stream.cursor:stream.cursor + count]
+        stream.cursor += count
+        return values
+
+    def uniform(self):
+        # One number in [0, 1)
+        return float(self.take(self.stream('uniform'), 1)[0])
+
+    def uniforms(self, count):
+        return self.take(self.stream('uniform'), count)
+
+    def random_sample(self, size):
+        # Uniforms in [0, 1) with the shape of size, same as numpy's
+        shape = (size,) if isinstance(size, int) else tuple(size)
+        return self.uniforms(int(numpy.prod(shape))).reshape(shape)
+
+    def poisson(self, lam):
+        # Every count has its own rate so they can't be drawn ahead, they come straight from our generator
+        return self.rng.poisson(lam)
+
+    def index(self, count):
+        # One of 0..count-1, all equally likely
+        if count == 1:
+            return 0
+        return min(int(self.uniform() * count), count - 1)
+
+    def choice(self, name, weights):
+        # Index of one option picked with these weights
+        # Every name has its own block, use the same name for the same kind of dice
+        if len(weights) == 1:
+            return 0
+        return int(self.take(self.stream(name, tuple(weights)), 1)[0])
+
+    def choices(self, name, weights, count):
+        return self.take(self.stream(name, tuple(weights)), count)
+
+    def get_state(self):
+        # The generator and the draws not handed out yet
+        streams = [{'name': name, 'weights': None if weights is None else list(weights),
+                    'values': stream.values[stream.cursor:].copy()}
+                   for (name, weights), stream in self.streams.items()]
+        return {'rng': self.rng.get_state(), 'block': self.block, 'streams': streams}
+
+    def set_state(self, state):
+        self.rng.set_state(tuple(state['rng']))
+        self.block = state['block']
+        self.streams = {}
+        for stream in state['streams']:
+            weights = None if stream['weights'] is None else tuple(stream['weights'])
+            self.streams[(stream['name'], weights)] = Stream(weights, numpy.asarray(stream['values']))
+
+DICE = Dice()
@@ -0,0 +1,352 @@
+##########################################################
+#	File: Domain.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Runs one headless simulation (see Headless.py) on several processes so bigger lattices run faster.
+#	The lattice is cut along x into slabs, one per worker process, each with its own cells, CellStore
+#	and random streams (spawned from one seed like the replicates of Ensemble.py).
+#	Neighboring workers talk every MCS:
+#		Migration: a cell hopping out of its slab is sent with everything it has (attributes, State,
+#		           receptors, ligands, binding) and only leaves if the other slab still has the block free.
+#		Halo:      the cells on the edge of a slab are copied to the next slab as ghosts, so contacts across
+#		           the edge are found. The TCell's slab runs the interaction (ghost TCells don't interact)
+#		           and the ligands it takes from a ghost APC are sent back to the APC's slab.
+#	Every MCS the workers send their totals to the main process, which adds them up and saves the metrics
+#	(see Metrics.py) like PlotSteppable does.
+#
+#	Differences with a single process run:
+#		The random numbers are different, so the results are the same only on average.
+#		A TCell whose APC is in another slab and isn't a ghost there can't reset it.
+#		No checkpoints, plot windows or steady TATTRACT field (Config.CHEMOKINE_MODE must be 'diffusion').
+#
+#	Usage (from this folder):
+#		python Domain.py <workers> [steps] [seed] [output folder] [scale]
+#	scale makes the lattice of Model.xml (and the region filled with cells) that many times wider along x and y.
+#
+##########################################################
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import numpy
+
+import Config
+import Data
+import Ensemble
+import Headless
+import Metrics
+import Totals
+from Cell import APC
+from Cell import TCell
+from CellStore import STORE
+from CellTypes import CC3DKey
+
+# APC quantities that TCells of other slabs change and the most each one can be
+LIGANDS = ('total_PEPTIDEMHC', 'total_CD80', 'total_CD86')
+INITIAL_LIGANDS = ('initial_PEPTIDEMHC', 'initial_CD80', 'initial_CD86')
+
+# Slabs thinner than this (blocks) could have the same cells on both edges
+MIN_SLAB = 2
+
+# How long (seconds) the main process waits on one worker before checking the next one
+POLL_SECONDS = 0.01
+
+def slab_bounds(length, workers):
+    # [first x, last x + 1) of every slab, as even as possible
+    edges = numpy.linspace(0, length, workers + 1).round().astype(int).tolist()
+    bounds = list(zip(edges[:-1], edges[1:]))
+    if any(end - start < MIN_SLAB for start, end in bounds):
+        raise ValueError('A lattice ' + str(length) + ' blocks wide can not be cut in ' + str(workers) + ' slabs')
+    return bounds
+
+def scaled_spec(scale=1, model_file=Headless.MODEL_FILE):
+    # Model.xml with a lattice (and initial region) scale times wider along x and y
+    spec = Headless.read_model(model_file)
+    x, y, z = spec.dimensions
+    spec.dimensions = (x * scale, y * scale, z)
+    spec.box_max = (spec.box_max[0] + (scale - 1) * x, spec.box_max[1] + (scale - 1) * y, spec.box_max[2])
+    return spec
+
+##########################################################
+#	WorkerSimulator
+#
+#	A HeadlessSimulator that only owns the cells of its slab.
+#	Ghosts are on the lattice (and in the store) only between the halo exchange and the end of MainSteppable.
+##########################################################
+class WorkerSimulator(Headless.HeadlessSimulator):
+    def __init__(self, rank, workers, bounds, cells, first_id, links, spec, steps, seed, output_dir):
+        # Our cells as (id, type, block), placed by initialize_cells
+        self.initial_cells = cells
+        Headless.HeadlessSimulator.__init__(self, steps=steps, seed=seed, output_dir=output_dir,
+                                            checkpoint_interval=0, spec=spec)
+
+        self.rank = rank
+        self.lattice.owned = bounds
+        # Cells born here get ids no other worker uses
+        self.next_id = first_id + rank
+        self.id_step = workers
+
+        # Connections to the main process and to the workers of the slabs on each side (None at the ends)
+        self.master, self.left, self.right = links
+
+        # Ghost id -> (cell, side it came from, its LIGANDS when it arrived)
+        self.ghosts = {}
+
+    def initialize_cells(self):
+        for id, type, block in self.initial_cells:
+            cell = Headless.HeadlessCell(id, type, self.spec.width ** 3, self.attributes)
+            self.cells[id] = cell
+            self.lattice.place(cell, block)
+            self.changed.add(id)
+
+    def neighbor_pairs(self, ids):
+        # Ghosts touch our cells too
+        alive = [id for id in ids if id in self.cells or id in self.ghosts]
+        return self.lattice.neighbor_pairs(alive)
+
+    def exchange(self, to_left, to_right):
+        # Send something to both neighbors and get what they sent us
+        # Workers pair up (0-1, 2-3... then 1-2, 3-4...) and the lower one sends first,
+        # so two workers never wait on each other
+        from_left = []
+        from_right = []
+        for phase in (0, 1):
+            if self.rank % 2 == phase:
+                if self.right is not None:
+                    self.right.send(to_right)
+                    from_right = self.right.recv()
+            elif self.left is not None:
+                from_left = self.left.recv()
+                self.left.send(to_left)
+        return from_left, from_right
+
+    def pack(self, id, block=None):
+        # Everything another worker needs to make this cell
+        cell = self.cells[id]
+        slot = STORE.slot(id)
+        row = dict((name, getattr(STORE, name)[slot].item()) for name in STORE.FIELDS)
+        attributes = [getattr(cell, name) for name in Headless.HeadlessCell.ATTRIBUTES]
+        block = self.lattice.position[id].tolist() if block is None else block
+        return id, cell.type, block, attributes, row
+
+    def unpack(self, message):
+        # Make the cell of a message (its block has to be empty)
+        id, type, block, attributes, row = message
+        cell = Headless.HeadlessCell(id, type, 0, self.attributes)
+        for name, value in zip(Headless.HeadlessCell.ATTRIBUTES, attributes):
+            setattr(cell, name, value)
+        self.lattice.place(cell, block)
+        self.changed.add(id)
+
+        slot = STORE.allocate(id)
+        for name, value in row.items():
+            getattr(STORE, name)[slot] = value
+        view = APC if row['kind'] == STORE.APC else TCell
+        cell.dict[CC3DKey.DATA_KEY] = view.attach(cell, id)
+        return cell
+
+    def discard(self, cell):
+        # Take a cell (ours or a ghost) off this worker without it dying
+        self.lattice.remove(cell)
+        self.changed.add(cell.id)
+        cell.dict.clear()
+        STORE.remove(cell.id)
+
+    def migrate(self):
+        # Cells that hopped out of our slab move to the neighbor's if the block is still free there
+        ids, blocks = self.lattice.leaving
+        to_left = []
+        to_right = []
+        for id, block in zip(ids.tolist(), blocks.tolist()):
+            outgoing = to_left if block[0] < self.lattice.owned[0] else to_right
+            outgoing.append(self.pack(id, block))
+
+        arrived = []
+        for messages in self.exchange(to_left, to_right):
+            accepted = []
+            for message in messages:
+                if self.lattice.grid[tuple(message[2])] == 0:
+                    self.cells[message[0]] = self.unpack(message)
+                    accepted.append(message[0])
+            arrived.append(accepted)
+
+        # The cells the neighbors took are theirs now
+        for accepted in self.exchange(arrived[0], arrived[1]):
+            for id in accepted:
+                self.discard(self.cells.pop(id))
+
+    def add_ghosts(self):
+        # Copy the cells on our edges to the neighbors and place theirs
+        ids = self.cell_ids()
+        x = self.lattice.position[ids, 0]
+        first, last = self.lattice.owned
+        to_left = [self.pack(id) for id in ids[x == first].tolist()] if self.left is not None else []
+        to_right = [self.pack(id) for id in ids[x == last - 1].tolist()] if self.right is not None else []
+
+        for side, messages in zip(('left', 'right'), self.exchange(to_left, to_right)):
+            for message in messages:
+                cell = self.unpack(message)
+                slot = STORE.slot(cell.id)
+                # Ghost TCells are interacted with in their own slab only
+                STORE.alive[slot] = STORE.kind[slot] == STORE.APC
+                self.ghosts[cell.id] = (cell, side, [getattr(STORE, name)[slot].item() for name in LIGANDS])
+
+    def remove_ghosts(self):
+        # Send back the ligands our TCells took from ghost APCs and apply what the neighbors took from ours
+        taken = {'left': [], 'right': []}
+        for id, (cell, side, before) in self.ghosts.items():
+            slot = STORE.slot(id)
+            if STORE.kind[slot] == STORE.APC:
+                change = [getattr(STORE, name)[slot].item() - value for name, value in zip(LIGANDS, before)]
+                if any(change):
+                    taken[side].append((id, change))
+            self.discard(cell)
+        self.ghosts = {}
+
+        for changes in self.exchange(taken['left'], taken['right']):
+            for id, change in changes:
+                slot = STORE.slot(id)
+                if slot == 0:
+                    continue
+                for name, initial, amount in zip(LIGANDS, INITIAL_LIGANDS, change):
+                    values = getattr(STORE, name)
+                    values[slot] = min(max(values[slot] + amount, 0), getattr(STORE, initial)[slot])
+
+    def run(self):
+        # Same as HeadlessSimulator.run with the exchanges in between
+        started = time.time()
+        for steppable in self.steppables:
+            steppable.start()
+
+        main = self.steppables[0]
+        for mcs in range(self.steps):
+            self.mcs = mcs
+            moved, _, _ = self.lattice.potts_step(self.cells, self.rng, self.attributes)
+            self.changed.update(moved.tolist())
+            self.relax_volumes()
+
+            self.migrate()
+            self.add_ghosts()
+            main.step(mcs)
+            self.remove_ghosts()
+
+            for steppable in self.steppables[1:]:
+                if mcs % steppable.frequency == 0:
+                    steppable.step(mcs)
+
+            # Our part of the plots
+            Totals.update_data()
+            self.master.send(('row', [getattr(Data, name) for name in Metrics.COLUMNS[1:]]))
+
+        for steppable in self.steppables:
+            steppable.finish()
+
+        elapsed = time.time() - started
+        return self.steps / elapsed if elapsed > 0 else float('inf')
+
+def register_steppables(sim):
+    # Same as Headless.register_steppables without PlotSteppable (the main process saves the metrics)
+    Headless.install_cc3d_modules()
+    from Steppables import MainSteppable, VolumeSteppable, MitosisSteppable
+
+    sim.registerSteppable(MainSteppable(sim, _frequency=1))
+    sim.registerSteppable(VolumeSteppable(sim, _frequency=10))
+    sim.registerSteppable(MitosisSteppable(sim, _frequency=10))
+
+def work(rank, workers, bounds, cells, first_id, links, spec, steps, seed, output_dir):
+    # Runs inside a worker process
+    master = links[0]
+    try:
+        sim = WorkerSimulator(rank, workers, bounds, cells, first_id, links, spec, steps, seed, output_dir)
+        register_steppables(sim)
+        sim.run()
+        master.send(('done', len(sim.cells)))
+    except Exception:
+        master.send(('error', traceback.format_exc()))
+
+def collect(connections, processes):
+    # One message from every worker, stops them all if one failed
+    messages = [None] * len(connections)
+    while any(message is None for message in messages):
+        for rank, connection in enumerate(connections):
+            if messages[rank] is not None or not connection.poll(POLL_SECONDS):
+                if messages[rank] is None and not processes[rank].is_alive() and not connection.poll(0):
+                    raise RuntimeError('Worker ' + str(rank) + ' stopped unexpectedly')
+                continue
+
+            kind, value = connection.recv()
+            if kind == 'error':
+                raise RuntimeError('Worker ' + str(rank) + ' failed:\n' + value)
+            messages[rank] = value
+    return messages
+
+def run_decomposed(workers, steps=None, seed=None, output_dir='.', scale=1):
+    # Gives back how many MCS per second we managed and how many cells there are at the end
+    if Config.CHEMOKINE_MODE != 'diffusion':
+        raise ValueError('Domain.py needs Config.CHEMOKINE_MODE = \'diffusion\'')
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # The first stream places the cells, the others are for the workers
+    seeds = Ensemble.replicate_seeds(seed, workers + 1)
+    spec = scaled_spec(scale)
+    initial = Headless.HeadlessSimulator(steps=steps, seed=seeds[0], output_dir=output_dir, checkpoint_interval=0, spec=spec)
+    steps = initial.steps
+
+    bounds = slab_bounds(initial.lattice.shape[0], workers)
+    cells = [[] for _ in range(workers)]
+    for cell in initial.cells.values():
+        block = initial.lattice.position[cell.id].tolist()
+        rank = [start <= block[0] < end for start, end in bounds].index(True)
+        cells[rank].append((cell.id, cell.type, block))
+
+    # Pipes between neighbors and to the main process
+    lefts = [None] * workers
+    rights = [None] * workers
+    for rank in range(workers - 1):
+        rights[rank], lefts[rank + 1] = multiprocessing.Pipe()
+    connections = []
+    processes = []
+    for rank in range(workers):
+        ours, theirs = multiprocessing.Pipe()
+        links = (theirs, lefts[rank], rights[rank])
+        process = multiprocessing.Process(target=work, args=(rank, workers, bounds[rank], cells[rank], initial.next_id,
+                                                             links, spec, steps, seeds[rank + 1], output_dir))
+        process.daemon = True
+        process.start()
+        connections.append(ours)
+        processes.append(process)
+
+    writer = Metrics.MetricWriter(os.path.join(output_dir, Config.METRICS_FILE))
+    started = time.time()
+    try:
+        for mcs in range(steps):
+            rows = collect(connections, processes)
+            for name, value in zip(Metrics.COLUMNS[1:], numpy.sum(rows, axis=0).tolist()):
+                setattr(Data, name, value)
+            writer.append(Metrics.current_row(mcs))
+        total_cells = sum(collect(connections, processes))
+    except:
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        writer.close()
+        for process in processes:
+            process.join()
+
+    elapsed = time.time() - started
+    return (steps / elapsed if elapsed > 0 else float('inf')), total_cells
+
+if __name__ == '__main__':
+    workers = int(sys.argv[1])
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    output_dir = sys.argv[4] if len(sys.argv) > 4 else '.'
+    scale = int(sys.argv[5]) if len(sys.argv) > 5 else 1
+
+    speed, total_cells = run_decomposed(workers, steps, seed, output_dir, scale)
+    print(str(steps) + ' MCS with ' + str(total_cells) + ' cells on ' + str(workers) + ' workers at ' + str(round(speed, 1)) + ' MCS/sec')
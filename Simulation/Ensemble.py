@@ -0,0 +1,149 @@
+##########################################################
+#	File: Ensemble.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Runs the same model many times (replicates) in parallel and averages the plots.
+#	Every replicate gets its own random streams spawned from one master seed, so:
+#		Running the ensemble again with the same master seed gives the same replicates.
+#		No two replicates share random numbers, even though they run at the same time.
+#
+#	As replicates finish their metrics (see Metrics.py) are added to a running mean and variance in order
+#	of replicate (not of when they finished, so the same master seed always gives the very same numbers).
+#	Config.ENSEMBLE_FILE is saved every SAVE_EVERY replicates and at the end, with the mean and
+#	95% confidence band of the replicates added so far.
+#	Its columns are MCS, REPLICATES and <Data variable>_MEAN, _LOW and _HIGH for every value of the plots.
+#
+#	Usage (from this folder):
+#		python Ensemble.py <replicates> <master seed> [steps] [output folder] [processes]
+#
+##########################################################
+import os
+import shutil
+import sys
+
+import numpy
+
+import Config
+import Metrics
+import Sweep
+
+# How many standard errors the confidence band spans on each side (95%)
+CONFIDENCE_Z = 1.959964
+
+# Suffixes of the columns of every value
+SUFFIXES = ('_MEAN', '_LOW', '_HIGH')
+
+# Replicates added between two saves of the aggregate
+SAVE_EVERY = 10
+
+def replicate_seeds(master_seed, count):
+    # One seed per replicate, each an independent stream
+    try:
+        from numpy.random import SeedSequence
+    except ImportError:
+        # numpy older than 1.17 can't spawn streams, draw different seeds from the master seed instead
+        rng = numpy.random.RandomState(master_seed)
+        seeds = []
+        while len(seeds) < count:
+            seed = int(rng.randint(2 ** 31 - 1))
+            if seed not in seeds:
+                seeds.append(seed)
+        return seeds
+
+    return SeedSequence(master_seed).spawn(count)
+
+##########################################################
+#	Aggregate
+#
+#	Mean and variance of every value at every MCS, updated one replicate at a time (Welford's method)
+##########################################################
+class Aggregate(object):
+    def __init__(self, columns=Metrics.COLUMNS[1:]):
+        self.columns = list(columns)
+        self.count = 0
+        self.mcs = None
+        self.mean = None
+        # Sum of squared differences from the mean
+        self.squares = None
+
+    def add(self, reader):
+        # Add the metrics of one replicate
+        values = numpy.column_stack([reader.column(name) for name in self.columns]).astype(numpy.float64)
+
+        if self.count == 0:
+            self.mcs = numpy.array(reader.column('MCS'))
+            self.mean = numpy.zeros_like(values)
+            self.squares = numpy.zeros_like(values)
+
+        # Replicates that stopped early only count up to where they stopped
+        rows = min(len(values), len(self.mean))
+        self.mcs = self.mcs[:rows]
+        self.mean = self.mean[:rows]
+        self.squares = self.squares[:rows]
+        values = values[:rows]
+
+        self.count += 1
+        difference = values - self.mean
+        self.mean += difference / self.count
+        self.squares += difference * (values - self.mean)
+
+    def band(self):
+        # Mean, lowest and highest value of the confidence band
+        if self.count < 2:
+            return self.mean, self.mean, self.mean
+
+        error = CONFIDENCE_Z * numpy.sqrt(self.squares / (self.count - 1) / self.count)
+        return self.mean, self.mean - error, self.mean + error
+
+    def save(self, path):
+        # Write next to the old aggregate and only swap them once everything is on disk
+        # That way stopping the ensemble while saving always leaves a whole aggregate (path, or path.old during the swap)
+        temporary = path + '.tmp'
+        shutil.rmtree(temporary, ignore_errors=True)
+        columns = ['MCS', 'REPLICATES'] + [name + suffix for name in self.columns for suffix in SUFFIXES]
+        writer = Metrics.MetricWriter(temporary, columns)
+
+        mean, low, high = self.band()
+        # Interleave so every value has its mean, low and high next to each other
+        values = numpy.stack([mean, low, high], axis=2).reshape(len(mean), -1)
+        for mcs, row in zip(self.mcs, values):
+            writer.append(numpy.r_[mcs, self.count, row])
+        writer.close()
+
+        old = path + '.old'
+        if os.path.isdir(path):
+            shutil.rmtree(old, ignore_errors=True)
+            os.rename(path, old)
+        os.rename(temporary, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+def run_ensemble(replicates, master_seed, steps=None, output_dir='ensemble', processes=None, parameters=None):
+    # parameters changes Config for every replicate, same as a point of Sweep.py
+    seeds = replicate_seeds(master_seed, replicates)
+    folders = [os.path.join(output_dir, 'replicate_' + str(index)) for index in range(replicates)]
+    tasks = [(index, parameters or {}, steps, seed, folder) for index, (seed, folder) in enumerate(zip(seeds, folders))]
+
+    # Replicates that finished before the ones in front of them wait their turn
+    aggregate = Aggregate()
+    path = os.path.join(output_dir, Config.ENSEMBLE_FILE)
+    finished = set()
+    for index, speed, values in Sweep.run_pool(tasks, processes):
+        finished.add(index)
+        while aggregate.count in finished:
+            aggregate.add(Metrics.MetricReader(os.path.join(folders[aggregate.count], Config.METRICS_FILE)))
+            if aggregate.count % SAVE_EVERY == 0 and aggregate.count < replicates:
+                aggregate.save(path)
+
+    aggregate.save(path)
+    return aggregate
+
+if __name__ == '__main__':
+    replicates = int(sys.argv[1])
+    master_seed = int(sys.argv[2])
+    steps = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    output_dir = sys.argv[4] if len(sys.argv) > 4 else 'ensemble'
+    processes = int(sys.argv[5]) if len(sys.argv) > 5 else None
+
+    aggregate = run_ensemble(replicates, master_seed, steps, output_dir, processes)
+    print(str(aggregate.count) + ' replicates saved in ' + os.path.join(output_dir, Config.ENSEMBLE_FILE))
@@ -0,0 +1,755 @@
+##########################################################
+#	File: Headless.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	This lets us run the model without CompuCell3D (no Twedit++, no Player).
+#	It reads Model.xml and provides the small part of CC3D that our steppables use:
+#		cellList, cell dictionaries, getCellNeighborDataList, deleteCell, cell type ids,
+#		targetVolume/lambdaVolume/lambdaVec* and plot windows.
+#	MainSteppable, PlotSteppable, VolumeSteppable and MitosisSteppable run on it unchanged.
+#	TATTRACT chemotaxis is only followed when ChemokineSteppable solves the field (Config.CHEMOKINE_MODE = 'steady').
+#
+#	The lattice is simplified: every cell is a single block of Width x Width x Width pixels
+#	(the Width of the UniformInitializer in Model.xml) and moves by hopping one block at a time.
+#	Two cells are neighbors when their blocks share a face.
+#
+#	Usage (from this folder):
+#		python Headless.py [steps] [seed] [checkpoint to resume from]
+#
+#	Every Config.CHECKPOINT_INTERVAL MCS the whole simulation is saved in Config.CHECKPOINT_FILE (see Checkpoint.py).
+#	Resuming from it continues exactly like the run that saved it would have.
+#
+#	The plot windows don't keep their points unless keep_plots is True, so memory doesn't grow with the run.
+#	The values of the plots are saved as they go by PlotSteppable (see Metrics.py).
+#
+##########################################################
+import os
+import random
+import sys
+import time
+import types
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict
+
+import numpy
+
+import Checkpoint
+import Config
+from CellStore import STORE
+from Dice import DICE
+from Profiling import PROFILER
+
+# Where our model lives by default
+MODEL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Model.xml')
+
+# How much of the difference between targetVolume and volume a cell covers every MCS
+VOLUME_RELAXATION = 0.5
+
+# How many 32 bit words seed each random generator when using a SeedSequence
+SEED_WORDS = 8
+
+# The 6 directions a cell can hop in (one block along x, y or z)
+HOP_OFFSETS = numpy.array([[1, 0, 0], [-1, 0, 0],
+                           [0, 1, 0], [0, -1, 0],
+                           [0, 0, 1], [0, 0, -1]], dtype=numpy.int64)
+
+##########################################################
+#	Model.xml
+#
+#	We only read what we need from the CC3D XML.
+##########################################################
+class ModelSpec(object):
+    def __init__(self):
+        # Size of the lattice in pixels
+        self.dimensions = (100, 100, 50)
+        # Total simulation time in MCS
+        self.steps = 0
+        self.temperature = 10.0
+        self.neighbor_order = 1
+        # Maps a type name (e.g. 'APC') to its CC3D type id
+        self.cell_types = OrderedDict()
+        # UniformInitializer region
+        self.box_min = (0, 0, 0)
+        self.box_max = (0, 0, 0)
+        self.gap = 0
+        self.width = 1
+        self.initial_types = []
+        # TATTRACT: diffusion, what each type secretes and how strongly each type follows it (see Chemokine.py)
+        self.diffusion_constant = 0.0
+        self.decay_constant = 0.0
+        self.secretion = {}
+        self.chemotaxis = {}
+
+def read_model(model_file=MODEL_FILE):
+    spec = ModelSpec()
+    root = ElementTree.parse(model_file).getroot()
+
+    potts = root.find('Potts')
+    dims = potts.find('Dimensions')
+    spec.dimensions = tuple(int(dims.get(axis, 1)) for axis in ('x', 'y', 'z'))
+    spec.steps = int(potts.findtext('Steps', '0'))
+    spec.temperature = float(potts.findtext('Temperature', '10.0'))
+    spec.neighbor_order = int(potts.findtext('NeighborOrder', '1'))
+
+    for plugin in root.findall('Plugin'):
+        if plugin.get('Name') == 'CellType':
+            for cell_type in plugin.findall('CellType'):
+                spec.cell_types[cell_type.get('TypeName')] = int(cell_type.get('TypeId'))
+        elif plugin.get('Name') == 'Chemotaxis':
+            for field in plugin.findall('ChemicalField'):
+                if field.get('Name') == 'TATTRACT':
+                    for by_type in field.findall('ChemotaxisByType'):
+                        spec.chemotaxis[by_type.get('Type')] = float(by_type.get('Lambda'))
+        elif plugin.get('Name') == 'Secretion':
+            for field in plugin.findall('Field'):
+                if field.get('Name') == 'TATTRACT':
+                    for secretion in field.findall('Secretion'):
+                        spec.secretion[secretion.get('Type')] = float(secretion.text)
+
+    for steppable in root.findall('Steppable'):
+        if steppable.get('Type') == 'UniformInitializer':
+            region = steppable.find('Region')
+            box_min = region.find('BoxMin')
+            box_max = region.find('BoxMax')
+            spec.box_min = tuple(int(box_min.get(axis)) for axis in ('x', 'y', 'z'))
+            spec.box_max = tuple(int(box_max.get(axis)) for axis in ('x', 'y', 'z'))
+            spec.gap = int(region.findtext('Gap', '0'))
+            spec.width = int(region.findtext('Width', '1'))
+            spec.initial_types = [name.strip() for name in region.findtext('Types', '').split(',') if name.strip()]
+        elif steppable.get('Type') == 'DiffusionSolverFE':
+            for data in steppable.iter('DiffusionData'):
+                if data.findtext('FieldName', '').strip() == 'TATTRACT':
+                    spec.diffusion_constant = float(data.findtext('DiffusionConstant', '0'))
+                    spec.decay_constant = float(data.findtext('DecayConstant', '0'))
+
+    return spec
+
+##########################################################
+#	CellAttributes
+#
+#	The volumes and lambdas of every cell, one array per attribute indexed by cell id.
+#	That way the simulator (and Lifecycle.py) can change them for every cell at once.
+##########################################################
+class CellAttributes(object):
+    NAMES = ('volume', 'targetVolume', 'lambdaVolume', 'lambdaVecX', 'lambdaVecY', 'lambdaVecZ')
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        for name in self.NAMES:
+            setattr(self, name, numpy.zeros(capacity, dtype=numpy.float64))
+
+    def ensure(self, id):
+        # Make sure there is a slot for this id, doubling the arrays when we run out
+        if id < self.capacity:
+            return
+
+        capacity = max(id + 1, 2 * self.capacity)
+        for name in self.NAMES:
+            grown = numpy.zeros(capacity, dtype=numpy.float64)
+            grown[:self.capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+# Attribute of a cell that reads and writes its slot of a CellAttributes array
+class CellAttribute(object):
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, cell, owner):
+        if cell is None:
+            return self
+        return getattr(cell.attributes, self.name)[cell.id].item()
+
+    def __set__(self, cell, value):
+        getattr(cell.attributes, self.name)[cell.id] = value
+
+##########################################################
+#	HeadlessCell
+#
+#	Stand-in for a CC3D cell. It has the same attribute names so our code can't tell the difference.
+##########################################################
+class HeadlessCell(object):
+    # Everything a cell has besides its id, type and dictionary (saved in checkpoints)
+    ATTRIBUTES = ('volume', 'targetVolume', 'lambdaVolume',
+                  'lambdaVecX', 'lambdaVecY', 'lambdaVecZ',
+                  'xCOM', 'yCOM', 'zCOM')
+
+    volume = CellAttribute('volume')
+    targetVolume = CellAttribute('targetVolume')
+    lambdaVolume = CellAttribute('lambdaVolume')
+
+    # ExternalPotential
+    lambdaVecX = CellAttribute('lambdaVecX')
+    lambdaVecY = CellAttribute('lambdaVecY')
+    lambdaVecZ = CellAttribute('lambdaVecZ')
+
+    def __init__(self, id, type, volume, attributes):
+        self.id = id
+        self.type = type
+
+        # Where our volumes and lambdas live
+        self.attributes = attributes
+        attributes.ensure(id)
+        for name in CellAttributes.NAMES:
+            getattr(attributes, name)[id] = 0.0
+        self.volume = float(volume)
+        self.targetVolume = float(volume)
+
+        # CenterOfMass
+        self.xCOM = 0.0
+        self.yCOM = 0.0
+        self.zCOM = 0.0
+
+        # This is what getDictionaryAttribute gives back
+        self.dict = {}
+
+# Iterating over this is like iterating over CC3D's cellList
+# It always shows the cells that are alive right now
+class CellList(object):
+    def __init__(self, cells):
+        self.cells = cells
+
+    def __iter__(self):
+        # Copy so cells can be added or removed while a steppable is looping
+        return iter(list(self.cells.values()))
+
+    def __len__(self):
+        return len(self.cells)
+
+##########################################################
+#	Lattice
+#
+#	A grid of blocks. Every block holds the id of the cell in it (0 is Medium).
+##########################################################
+class Lattice(object):
+    def __init__(self, dimensions, width, temperature):
+        self.width = max(1, int(width))
+        self.temperature = float(temperature)
+        self.shape = tuple(max(1, int(d) // self.width) for d in dimensions)
+        self.grid = numpy.zeros(self.shape, dtype=numpy.int32)
+
+        # Block of every cell, indexed by cell id
+        self.position = numpy.zeros((64, 3), dtype=numpy.int64)
+
+        # Range of x (blocks) whose blocks are ours when the lattice is split between processes (see Domain.py)
+        # Hops out of it aren't made here, potts_step leaves them in leaving as (ids, blocks) instead
+        self.owned = None
+        self.leaving = (numpy.zeros(0, dtype=numpy.int64), numpy.zeros((0, 3), dtype=numpy.int64))
+
+    def place(self, cell, block):
+        if cell.id >= len(self.position):
+            grown = numpy.zeros((max(cell.id + 1, 2 * len(self.position)), 3), dtype=numpy.int64)
+            grown[:len(self.position)] = self.position
+            self.position = grown
+
+        self.grid[tuple(block)] = cell.id
+        self.position[cell.id] = block
+        self.update_center(cell)
+
+    def remove(self, cell):
+        self.grid[tuple(self.position[cell.id])] = 0
+
+    def update_center(self, cell):
+        x, y, z = self.position[cell.id]
+        cell.xCOM = (x + 0.5) * self.width
+        cell.yCOM = (y + 0.5) * self.width
+        cell.zCOM = (z + 0.5) * self.width
+
+    def inside(self, blocks):
+        return numpy.all((blocks >= 0) & (blocks < numpy.array(self.shape)), axis=-1)
+
+    def owns(self, blocks):
+        # Blocks inside the lattice that are ours
+        inside = self.inside(blocks)
+        if self.owned is not None:
+            inside &= (blocks[..., 0] >= self.owned[0]) & (blocks[..., 0] < self.owned[1])
+        return inside
+
+    def free_blocks_around(self, cell):
+        # Empty blocks next to a cell, used to place daughters after division
+        around = self.position[cell.id] + HOP_OFFSETS
+        around = around[self.owns(around)]
+        return [block for block in around if self.grid[tuple(block)] == 0]
+
+    def neighbor_ids(self, id):
+        # (id, commonSurfaceArea) of every cell sharing a face with this one
+        neighbors = []
+        area = self.width * self.width
+
+        around = self.position[id] + HOP_OFFSETS
+        for block in around[self.inside(around)]:
+            neighbor_id = self.grid[tuple(block)]
+            if neighbor_id:
+                neighbors.append((int(neighbor_id), area))
+
+        return neighbors
+
+    def neighbor_pairs(self, ids):
+        # Same as neighbor_ids but for many cells at once
+        # Gives back (ids, neighbor ids, common surface areas) with one row per touching pair
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        around = self.position[ids][:, None, :] + HOP_OFFSETS[None, :, :]
+        inside = self.inside(around)
+
+        clipped = numpy.clip(around, 0, numpy.array(self.shape) - 1)
+        neighbor_ids = self.grid[clipped[..., 0], clipped[..., 1], clipped[..., 2]].astype(numpy.int64)
+        touching = inside & (neighbor_ids != 0)
+
+        first_ids = numpy.repeat(ids, len(HOP_OFFSETS)).reshape(touching.shape)[touching]
+        return first_ids, neighbor_ids[touching], numpy.full(len(first_ids), float(self.width * self.width))
+
+    def neighbor_data(self, cell, cells):
+        # Same idea as CC3D's getCellNeighborDataList
+        # We give back (neighbor, commonSurfaceArea) for every cell sharing a face with this one
+        return [(cells[id], area) for id, area in self.neighbor_ids(cell.id)]
+
+    def touching_pairs(self):
+        # Every pair of cells sharing a face, found by comparing the grid with itself shifted by one block
+        # Gives back (first ids, second ids, common surface areas), each pair once
+        first_ids = []
+        second_ids = []
+
+        for axis in range(3):
+            first = self.grid.take(numpy.arange(0, self.shape[axis] - 1), axis=axis).ravel()
+            second = self.grid.take(numpy.arange(1, self.shape[axis]), axis=axis).ravel()
+            touching = (first != 0) & (second != 0) & (first != second)
+            first_ids.append(first[touching])
+            second_ids.append(second[touching])
+
+        first_ids = numpy.concatenate(first_ids).astype(numpy.int64)
+        second_ids = numpy.concatenate(second_ids).astype(numpy.int64)
+        return first_ids, second_ids, numpy.full(len(first_ids), float(self.width * self.width))
+
+    def concentration(self, field, resolution, blocks):
+        # Value of a field (one value per cube of resolution pixels) at the center of some blocks
+        cubes = numpy.floor((blocks + 0.5) * self.width / float(resolution)).astype(numpy.int64)
+        cubes = numpy.clip(cubes, 0, numpy.array(field.shape) - 1)
+        return field[tuple(cubes.T)]
+
+    def potts_step(self, cells, rng, attributes, chemotaxis=None):
+        # This replaces the Potts flips of CC3D
+        # Every cell tries to hop one block in a random direction
+        # ExternalPotential: the bigger lambdaVec is along that axis the less likely the hop is accepted
+        # (this keeps the "APCs move faster than TCells" idea of MainSteppable)
+        # Chemotaxis (field, resolution, lambda of every type id): hops up the field are more likely
+        # Returns the ids of the cells that moved, where they were and where they are now
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        self.leaving = (empty, numpy.zeros((0, 3), dtype=numpy.int64))
+        if not cells:
+            return empty, numpy.zeros((0, 3), dtype=numpy.int64), numpy.zeros((0, 3), dtype=numpy.int64)
+
+        live = list(cells.values())
+        ids = numpy.fromiter(cells, dtype=numpy.int64, count=len(cells))
+        lambdas = numpy.column_stack((attributes.lambdaVecX[ids], attributes.lambdaVecY[ids], attributes.lambdaVecZ[ids]))
+
+        direction = rng.randint(0, len(HOP_OFFSETS), len(ids))
+        old = self.position[ids]
+        new = old + HOP_OFFSETS[direction]
+
+        # Metropolis acceptance with the lambda along the axis we hop on
+        energy = numpy.abs(lambdas[numpy.arange(len(ids)), direction // 2])
+        if chemotaxis is not None:
+            # Same energy as CC3D's Chemotaxis plugin: -lambda * (c where the cell goes - c where it is)
+            # ChemotactTowards is left out, a block only ever hops into Medium
+            field, resolution, strength = chemotaxis
+            types = numpy.fromiter((cell.type for cell in live), dtype=numpy.int64, count=len(live))
+            clipped = numpy.clip(new, 0, numpy.array(self.shape) - 1)
+            energy -= strength[types] * (self.concentration(field, resolution, clipped) - self.concentration(field, resolution, old))
+        accepted = rng.random_sample(len(ids)) < numpy.exp(-energy / max(self.temperature, 1e-12))
+        accepted &= self.inside(new)
+
+        candidates = numpy.flatnonzero(accepted)
+        candidates = candidates[self.grid[tuple(new[candidates].T)] == 0]
+        if self.owned is not None:
+            # Only one of our cells can reach each block outside, so these never collide
+            leaving = ~self.owns(new[candidates])
+            self.leaving = (ids[candidates[leaving]], new[candidates[leaving]])
+            candidates = candidates[~leaving]
+        if len(candidates) == 0:
+            return empty, numpy.zeros((0, 3), dtype=numpy.int64), numpy.zeros((0, 3), dtype=numpy.int64)
+
+        # If several cells want the same empty block the first one (in random order) gets it
+        candidates = candidates[rng.permutation(len(candidates))]
+        flat = numpy.ravel_multi_index(tuple(new[candidates].T), self.shape)
+        _, first = numpy.unique(flat, return_index=True)
+        movers = candidates[first]
+
+        self.grid[tuple(old[movers].T)] = 0
+        self.grid[tuple(new[movers].T)] = ids[movers]
+        self.position[ids[movers]] = new[movers]
+
+        centers = ((new[movers] + 0.5) * self.width).tolist()
+        for index, (x, y, z) in zip(movers.tolist(), centers):
+            cell = live[index]
+            cell.xCOM, cell.yCOM, cell.zCOM = x, y, z
+
+        return ids[movers], old[movers], new[movers]
+
+##########################################################
+#	PlotWindow
+#
+#	Keeps the data points that CC3D would have drawn.
+#	savePlotAsData works like CC3D's, savePlotAsPNG needs matplotlib.
+#	If keep is False points are thrown away and nothing is saved.
+##########################################################
+class PlotWindow(object):
+    def __init__(self, title, output_dir, keep=True):
+        self.title = title
+        self.output_dir = output_dir
+        self.keep = keep
+        self.plots = OrderedDict()
+
+    def addPlot(self, _plotName, **kwargs):
+        self.plots.setdefault(_plotName, ([], []))
+
+    def eraseAllData(self):
+        for name in self.plots:
+            self.plots[name] = ([], [])
+
+    def addDataPoint(self, _plotName, _x, _y):
+        if not self.keep:
+            return
+        xs, ys = self.plots.setdefault(_plotName, ([], []))
+        xs.append(_x)
+        ys.append(_y)
+
+    def savePlotAsData(self, _fileName):
+        if not self.keep:
+            return
+        with open(os.path.join(self.output_dir, _fileName), 'w') as data_file:
+            for name, (xs, ys) in self.plots.items():
+                data_file.write('# ' + name + '\n')
+                for x, y in zip(xs, ys):
+                    data_file.write(str(x) + ' ' + str(y) + '\n')
+                data_file.write('\n')
+
+    def savePlotAsPNG(self, _fileName, _sizeX=400, _sizeY=400):
+        if not self.keep:
+            return
+        try:
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as pyplot
+        except ImportError:
+            return
+
+        figure = pyplot.figure(figsize=(_sizeX / 100.0, _sizeY / 100.0), dpi=100)
+        for name, (xs, ys) in self.plots.items():
+            pyplot.plot(xs, ys, label=name)
+        pyplot.title(self.title)
+        pyplot.legend()
+        figure.savefig(os.path.join(self.output_dir, _fileName))
+        pyplot.close(figure)
+
+##########################################################
+#	Steppable bases
+#
+#	The parts of PySteppables and PySteppablesExamples our steppables use.
+##########################################################
+class SteppableBasePy(object):
+    def __init__(self, _simulator, _frequency=1):
+        self.simulator = _simulator
+        self.frequency = _frequency
+        self.cellList = _simulator.cellList
+
+        # CC3D gives every steppable the cell type ids as upper case properties (e.g. self.APC)
+        for name, type_id in _simulator.spec.cell_types.items():
+            setattr(self, name.upper(), type_id)
+
+    def start(self):
+        pass
+
+    def step(self, mcs):
+        pass
+
+    def finish(self):
+        pass
+
+    def getDictionaryAttribute(self, _cell):
+        return _cell.dict
+
+    def deleteCell(self, _cell):
+        self.simulator.kill_cell(_cell)
+
+    def getCellNeighborDataList(self, _cell):
+        return self.simulator.lattice.neighbor_data(_cell, self.simulator.cells)
+
+    def addNewPlotWindow(self, _title='', **kwargs):
+        return PlotWindow(_title, self.simulator.output_dir, self.simulator.keep_plots)
+
+class MitosisSteppableBase(SteppableBasePy):
+    def __init__(self, _simulator, _frequency=1):
+        SteppableBasePy.__init__(self, _simulator, _frequency)
+        self.parentCell = None
+        self.childCell = None
+
+    def divideCellRandomOrientation(self, _cell):
+        child = self.simulator.divide_cell(_cell)
+        if child is None:
+            return False
+
+        self.parentCell = _cell
+        self.childCell = child
+        self.updateAttributes()
+        return True
+
+    def updateAttributes(self):
+        # Same default as CC3D, split the volume and copy the type
+        self.parentCell.targetVolume /= 2.0
+        self.childCell.targetVolume = self.parentCell.targetVolume
+        self.childCell.lambdaVolume = self.parentCell.lambdaVolume
+        self.childCell.type = self.parentCell.type
+
+# Make 'from PySteppables import *' and friends work without CompuCell3D
+def install_cc3d_modules():
+    for name in ('PySteppables', 'PySteppablesExamples', 'CompuCell'):
+        if name not in sys.modules:
+            sys.modules[name] = types.ModuleType(name)
+
+    sys.modules['PySteppables'].SteppableBasePy = SteppableBasePy
+    sys.modules['PySteppablesExamples'].MitosisSteppableBase = MitosisSteppableBase
+
+##########################################################
+#	HeadlessSimulator
+#
+#	Plays the part of CompuCellSetup.mainLoop
+##########################################################
+class HeadlessSimulator(object):
+    def __init__(self, model_file=MODEL_FILE, steps=None, seed=None, output_dir='.', keep_plots=False,
+                 checkpoint_interval=None, resume_file=None, spec=None):
+        # spec can replace Model.xml (e.g. a bigger lattice, see Domain.py)
+        self.spec = read_model(model_file) if spec is None else spec
+        self.steps = self.spec.steps if steps is None else int(steps)
+        self.output_dir = output_dir
+        self.keep_plots = keep_plots
+
+        # How often (mcs) we save a checkpoint, 0 never does
+        self.checkpoint_interval = Config.CHECKPOINT_INTERVAL if checkpoint_interval is None else checkpoint_interval
+        self.checkpoint_file = os.path.join(output_dir, Config.CHECKPOINT_FILE)
+        # Checkpoint to continue from instead of starting at MCS 0
+        self.resume_file = resume_file
+
+        # Our cells use the global random, numpy.random and DICE (see Dice.py), so we seed those too
+        # A numpy SeedSequence gives each of the four its own independent stream (see Ensemble.py)
+        if hasattr(seed, 'spawn'):
+            lattice_seed, numpy_seed, random_seed, dice_seed = [child.generate_state(SEED_WORDS) for child in seed.spawn(4)]
+            self.rng = numpy.random.RandomState(lattice_seed)
+            numpy.random.seed(numpy_seed)
+            random.seed(sum(int(word) << (32 * index) for index, word in enumerate(random_seed)))
+            DICE.seed(dice_seed)
+        else:
+            self.rng = numpy.random.RandomState(seed)
+            if seed is not None:
+                random.seed(seed)
+                numpy.random.seed(seed)
+            # Not the same numbers as the lattice even though it's the same seed
+            DICE.seed(None if seed is None else [seed, 1])
+
+        # The store is shared by the whole process, a new simulation starts without the cells of the one before
+        STORE.clear()
+
+        self.lattice = Lattice(self.spec.dimensions, self.spec.width, self.spec.temperature)
+        self.attributes = CellAttributes()
+        self.cells = OrderedDict()
+        self.cellList = CellList(self.cells)
+        self.next_id = 1
+        # How much next_id grows with every new cell (processes sharing a lattice interleave their ids)
+        self.id_step = 1
+
+        self.steppables = []
+        self.mcs = 0
+
+        # Ids of the cells that moved, were born or died since take_changed_cells was last called
+        self.changed = set()
+
+        # TATTRACT when it is solved by ChemokineSteppable (see Chemokine.py), None otherwise
+        self.chemotaxis = None
+
+        self.initialize_cells()
+
+    def new_cell(self, type, block):
+        cell = HeadlessCell(self.next_id, type, self.spec.width ** 3, self.attributes)
+        self.next_id += self.id_step
+        self.cells[cell.id] = cell
+        self.lattice.place(cell, block)
+        self.changed.add(cell.id)
+        return cell
+
+    def kill_cell(self, cell):
+        self.lattice.remove(cell)
+        del self.cells[cell.id]
+        self.changed.add(cell.id)
+        # Let go of whatever our steppables attached to it
+        cell.dict.clear()
+
+    def divide_cell(self, cell):
+        free = self.lattice.free_blocks_around(cell)
+        if not free:
+            return None
+
+        child = self.new_cell(cell.type, free[self.rng.randint(len(free))])
+        child.volume = cell.volume = cell.volume / 2.0
+        return child
+
+    def initialize_cells(self):
+        # Same as the UniformInitializer: cells of random types every Width + Gap pixels inside the box
+        spec = self.spec
+        if not spec.initial_types:
+            return
+
+        type_ids = [spec.cell_types[name] for name in spec.initial_types]
+        pitch = spec.width + spec.gap
+        width = self.lattice.width
+
+        for x in range(spec.box_min[0], spec.box_max[0] - spec.width + 1, pitch):
+            for y in range(spec.box_min[1], spec.box_max[1] - spec.width + 1, pitch):
+                for z in range(spec.box_min[2], spec.box_max[2] - spec.width + 1, pitch):
+                    block = (x // width, y // width, z // width)
+                    if self.lattice.inside(numpy.array(block)) and self.lattice.grid[block] == 0:
+                        self.new_cell(type_ids[self.rng.randint(len(type_ids))], block)
+
+    def touching_pairs(self):
+        # Lets Contacts.py skip walking the neighbors of every cell
+        return self.lattice.touching_pairs()
+
+    def take_changed_cells(self):
+        # Used by Contacts.ContactTracker to only look at cells that moved
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    def neighbor_pairs(self, ids):
+        # Touching pairs of the given cells, dead cells don't touch anything
+        alive = [id for id in ids if id in self.cells]
+        return self.lattice.neighbor_pairs(alive)
+
+    def set_concentration_field(self, name, field, resolution):
+        # Our only field is TATTRACT, every type of Model.xml's Chemotaxis plugin follows it
+        strength = numpy.zeros(max(self.spec.cell_types.values()) + 1)
+        for type_name, value in self.spec.chemotaxis.items():
+            strength[self.spec.cell_types[type_name]] = value
+        self.chemotaxis = (field, resolution, strength)
+
+    def cell_centers(self):
+        # Ids and centers of mass of every cell at once (used by Spatial.SpatialHash)
+        ids = self.cell_ids()
+        return ids, (self.lattice.position[ids] + 0.5) * self.lattice.width
+
+    def cell_field(self):
+        # Id of the cell in every block and how many pixels a block is (used by Snapshots.py)
+        return self.lattice.grid, self.lattice.width
+
+    def checkpoint(self):
+        # The lattice and every cell in order (the order decides who hops first)
+        cells = list(self.cells.values())
+        return {
+            'next_id': self.next_id,
+            'rng': self.rng.get_state(),
+            'grid': self.lattice.grid.copy(),
+            'position': self.lattice.position.copy(),
+            'ids': numpy.array([cell.id for cell in cells], dtype=numpy.int64),
+            'types': numpy.array([cell.type for cell in cells], dtype=numpy.int64),
+            'attributes': numpy.array([[getattr(cell, name) for name in HeadlessCell.ATTRIBUTES] for cell in cells],
+                                      dtype=numpy.float64).reshape(len(cells), len(HeadlessCell.ATTRIBUTES)),
+            'changed': sorted(self.changed),
+        }
+
+    def resume(self, state):
+        # Replace our cells by the ones of a checkpoint
+        self.next_id = state['next_id']
+        self.rng.set_state(tuple(state['rng']))
+        self.lattice.grid = numpy.array(state['grid'], dtype=numpy.int32)
+        self.lattice.position = numpy.array(state['position'], dtype=numpy.int64)
+
+        self.cells.clear()
+        for id, type, attributes in zip(state['ids'].tolist(), state['types'].tolist(), state['attributes'].tolist()):
+            cell = HeadlessCell(id, type, 0, self.attributes)
+            for name, value in zip(HeadlessCell.ATTRIBUTES, attributes):
+                setattr(cell, name, value)
+            self.cells[id] = cell
+
+        self.changed = set(state['changed'])
+
+    def cell_ids(self):
+        # Ids of every cell on the lattice, in the same order as cellList
+        return numpy.fromiter(self.cells, dtype=numpy.int64, count=len(self.cells))
+
+    def registerSteppable(self, steppable):
+        # Timed when profiling is on (see Profiling.py)
+        self.steppables.append(PROFILER.instrument(steppable))
+
+    def relax_volumes(self):
+        # Cells grow or shrink towards their targetVolume
+        # A targetVolume of 0 is how our code kills cells, so those leave the lattice
+        ids = self.cell_ids()
+        volume = self.attributes.volume[ids]
+        target = self.attributes.targetVolume[ids]
+        strength = self.attributes.lambdaVolume[ids]
+
+        volume += numpy.where(strength > 0, (target - volume) * numpy.minimum(1.0, strength) * VOLUME_RELAXATION, 0.0)
+        self.attributes.volume[ids] = volume
+
+        for id in ids[(target <= 0) & ((volume < 1) | (strength <= 0))].tolist():
+            self.kill_cell(self.cells[id])
+
+    def run(self):
+        # Returns how many MCS per second we managed
+        started = time.time()
+
+        if self.resume_file:
+            first_mcs = Checkpoint.load(self.resume_file, self)
+        else:
+            first_mcs = 0
+            for steppable in self.steppables:
+                steppable.start()
+
+        for mcs in range(first_mcs, self.steps):
+            self.mcs = mcs
+            PROFILER.begin_mcs(mcs)
+            with PROFILER.phase('potts'):
+                moved, _, _ = self.lattice.potts_step(self.cells, self.rng, self.attributes, self.chemotaxis)
+                self.changed.update(moved.tolist())
+            with PROFILER.phase('volumes'):
+                self.relax_volumes()
+
+            for steppable in self.steppables:
+                if mcs % steppable.frequency == 0:
+                    steppable.step(mcs)
+
+            if self.checkpoint_interval and (mcs + 1) % self.checkpoint_interval == 0:
+                with PROFILER.phase('checkpoint'):
+                    Checkpoint.save(self.checkpoint_file, self, mcs + 1)
+
+        for steppable in self.steppables:
+            steppable.finish()
+
+        elapsed = time.time() - started
+        return (self.steps - first_mcs) / elapsed if elapsed > 0 else float('inf')
+
+# Same steppables and frequencies as MainProgram.py
+def register_steppables(sim):
+    install_cc3d_modules()
+    from Steppables import MainSteppable, PlotSteppable, VolumeSteppable, MitosisSteppable
+
+    sim.registerSteppable(MainSteppable(sim, _frequency=1))
+    sim.registerSteppable(PlotSteppable(sim, _frequency=1))
+    sim.registerSteppable(VolumeSteppable(sim, _frequency=10))
+    sim.registerSteppable(MitosisSteppable(sim, _frequency=10))
+    if Config.CHEMOKINE_MODE == 'steady':
+        from Steppables import ChemokineSteppable
+        sim.registerSteppable(ChemokineSteppable(sim, _frequency=1))
+    if Config.SNAPSHOT_INTERVAL > 0:
+        from Steppables import SnapshotSteppable
+        sim.registerSteppable(SnapshotSteppable(sim, _frequency=Config.SNAPSHOT_INTERVAL))
+
+if __name__ == '__main__':
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    resume_file = sys.argv[3] if len(sys.argv) > 3 else None
+
+    sim = HeadlessSimulator(steps=steps, seed=seed, resume_file=resume_file)
+    register_steppables(sim)
+    speed = sim.run()
+
+    print(str(sim.steps) + ' MCS with ' + str(len(sim.cells)) + ' cells at ' + str(round(speed, 1)) + ' MCS/sec')
@@ -0,0 +1,124 @@
+##########################################################
+#	File: Interactions.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Binds the ligands and receptors of the TCell-APC contacts of an MCS on several processes at once.
+#	Several TCells can bind the same APC in one MCS and binding changes both of them, so the contacts
+#	are cut in parts that never share an APC (every TCell only binds one APC per MCS, see Binding.group_contacts).
+#	Every part goes to a worker process that binds it straight into the CellStore arrays,
+#	which live in files every process can open (see CellStore.share), in the same turns as Binding.bind_rounds.
+#	All the dice are thrown before (see Binding.bind_batch), so the result is exactly the same as binding
+#	everything here, whatever the number of workers.
+#
+#	Only what Binding.bind_rounds does runs on the workers. Looking at every contact (Cell.interact_with_apc)
+#	needs the CC3D cells and the State changes run the hooks of Transitions.py, those stay here.
+#	Tau-leaping (Binding.leap_batch) stays here too: its counts are drawn round after round from rates
+#	that depend on the round before, so they can't be thrown ahead.
+#
+#	Set Config.INTERACTION_WORKERS to use it. Batches smaller than Config.INTERACTION_MIN_CONTACTS
+#	are still bound here, sending them to the workers would take longer than binding them.
+#	Runs that are already one of many processes (Sweep.py, Ensemble.py) bind everything themselves.
+#
+##########################################################
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+import numpy
+
+import Binding
+import Config
+from CellStore import STORE
+from CellStore import open_field
+
+# The arrays Binding.bind_rounds reads and changes
+FIELDS = ('total_CD80', 'total_CD86', 'total_CD28', 'bound_CD28', 'total_external_CTLA4')
+
+# Where the files of the store go, in memory when the system has it
+SHARED_MEMORY = '/dev/shm'
+
+class SharedStore(object):
+    # The arrays of a store shared by another process, opened inside a worker
+    def __init__(self, folder, generation, capacity):
+        self.key = (folder, generation, capacity)
+        for name in FIELDS:
+            setattr(self, name, open_field(folder, name, generation, capacity))
+
+# Store opened by this worker, kept until the store is resized
+opened = None
+
+def bind_part(task):
+    # Runs inside a worker process
+    global opened
+    key, tcell_slots, apc_slots, rank, dice, ctla4_cd80, ctla4_cd86 = task
+    if opened is None or opened.key != key:
+        opened = SharedStore(*key)
+    return Binding.bind_rounds(tcell_slots, apc_slots, rank, dice, ctla4_cd80, ctla4_cd86, opened)
+
+def partition(apcs, parts):
+    # Where each part of the contacts starts and ends, only cutting between two APCs
+    # The parts have about the same number of contacts
+    count = len(apcs)
+    starts = numpy.flatnonzero(numpy.r_[True, apcs[1:] != apcs[:-1]]) if count else numpy.zeros(0, dtype=numpy.int64)
+    targets = numpy.arange(1, parts) * count // parts
+    cuts = numpy.r_[starts, count][numpy.searchsorted(starts, targets)]
+    return numpy.unique(numpy.r_[0, cuts, count])
+
+##########################################################
+#	InteractionPool
+##########################################################
+class InteractionPool(object):
+    def __init__(self, workers, minimum=None, store=STORE):
+        self.workers = workers
+        self.minimum = Config.INTERACTION_MIN_CONTACTS if minimum is None else minimum
+        self.store = store
+
+        shared_memory = os.path.isdir(SHARED_MEMORY) and os.access(SHARED_MEMORY, os.W_OK)
+        self.folder = tempfile.mkdtemp(prefix='cellstore', dir=SHARED_MEMORY if shared_memory else None)
+        self.store.share(self.folder)
+        self.pool = multiprocessing.Pool(workers)
+
+    def takes(self, count):
+        # Whether a batch of count contacts is worth sending to the workers
+        return self.pool is not None and count >= max(1, self.minimum)
+
+    def bind_rounds(self, tcell_slots, apc_slots, rank, dice, ctla4_cd80, ctla4_cd86, store):
+        # Same as Binding.bind_rounds with every part of the contacts on a worker
+        if store is not self.store:
+            raise ValueError('This pool only binds the store it shares')
+
+        # Contacts are grouped by APC (see Binding.group_contacts), so the APC slots are too
+        bounds = partition(apc_slots, self.workers)
+        key = (store.folder, store.generation, store.capacity)
+        tasks = [(key, tcell_slots[first:last], apc_slots[first:last], rank[first:last], dice[:, first:last], ctla4_cd80, ctla4_cd86)
+                 for first, last in zip(bounds[:-1], bounds[1:])]
+
+        ligand = numpy.full(len(tcell_slots), Binding.NONE, dtype=numpy.int8)
+        receptor = numpy.full(len(tcell_slots), Binding.NONE, dtype=numpy.int8)
+        engaged_cd28 = 0
+        engaged_ctla4 = 0
+        for (first, last), result in zip(zip(bounds[:-1], bounds[1:]), self.pool.map(bind_part, tasks)):
+            ligand[first:last], receptor[first:last], cd28, ctla4 = result
+            engaged_cd28 += cd28
+            engaged_ctla4 += ctla4
+
+        return ligand, receptor, engaged_cd28, engaged_ctla4
+
+    def close(self):
+        # Stop the workers and bring the store back into our own memory
+        if self.pool is None:
+            return
+        self.pool.close()
+        self.pool.join()
+        self.pool = None
+        self.store.share(None)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+def create(workers=None, store=STORE):
+    # A pool for MainSteppable, None when the contacts are bound here (no workers or we are a worker ourselves)
+    workers = Config.INTERACTION_WORKERS if workers is None else workers
+    if workers < 1 or multiprocessing.current_process().daemon:
+        return None
+    return InteractionPool(workers, store=store)
@@ -0,0 +1,141 @@
+##########################################################
+#	File: Lifecycle.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Aging and fate decisions (apoptosis, division or quiescence) of every cell at once.
+#	Used by VolumeSteppable and MitosisSteppable.
+#
+#	The age of a cell is its targetVolume (see Config.INITIAL_AGE).
+#	When the simulator keeps the volumes of every cell in arrays (see Headless.py) we change them all at once,
+#	inside CC3D we have to go through the cells one by one.
+#
+#	Cells past Config.DECISION_AGE draw their fate all together from the Config.PROB_* weights.
+#	Dividing cells really divide, the daughter inherits the kind, state and receptors/ligands
+#	of its mother but starts unbound.
+#
+#	Dead cells (apoptosis or anergy) are removed from the simulation right away, so no steppable
+#	goes through them again, and their slots of the CellStore are freed for the next cells born.
+#
+##########################################################
+import numpy
+
+import Config
+import Transitions
+from Cell import APC
+from Cell import TCell
+from CellStore import STORE
+from CellStore import Event
+from CellTypes import CC3DKey
+from Dice import DICE
+
+# Fates
+APOPTOSIS = 0
+DIVISION = 1
+QUIESCENCE = 2
+
+# What a daughter doesn't inherit from its mother
+UNBOUND = ('bound_to_id', 'bound_last_mcs', 'bound_time', 'unbound_time')
+
+def cell_attributes(steppable):
+    # The arrays with the volumes of every cell, if the simulator has them
+    return getattr(getattr(steppable, 'simulator', None), 'attributes', None)
+
+def age(steppable, amount=None):
+    # Every living cell gets older by amount (Config.STEP_AGE by default)
+    # Dead cells left to shrink away (targetVolume of 0, see remove) stay dead
+    amount = Config.STEP_AGE if amount is None else amount
+    attributes = cell_attributes(steppable)
+
+    if attributes is not None:
+        ids = steppable.simulator.cell_ids()
+        alive = ids[attributes.targetVolume[ids] > 0]
+        attributes.targetVolume[alive] += amount
+        return
+
+    for cell in steppable.cellList:
+        if cell.targetVolume > 0:
+            cell.targetVolume += amount
+
+def old_cells(steppable):
+    # Cells past the decision age
+    attributes = cell_attributes(steppable)
+
+    if attributes is not None:
+        ids = steppable.simulator.cell_ids()
+        old = ids[(attributes.volume[ids] > Config.DECISION_AGE) & (attributes.targetVolume[ids] > 0)]
+        return [steppable.simulator.cells[id] for id in old.tolist()]
+
+    return [cell for cell in steppable.cellList if cell.volume > Config.DECISION_AGE and cell.targetVolume > 0]
+
+def draw_fates(count, dice=DICE):
+    # One draw for every cell with the Config.PROB_* weights (see Dice.py)
+    weights = (Config.PROB_APOPTOSIS, Config.PROB_DIVISION, Config.PROB_QUIESCENCE)
+    return dice.choices('fate', weights, count)
+
+def remove(steppable, cells, store=STORE):
+    # Takes dead cells out of the simulation and frees their slots in the store
+    delete = getattr(steppable, 'deleteCell', None)
+    for cell in cells:
+        if delete is not None:
+            delete(cell)
+        else:
+            # Without deleteCell the cell shrinks away on its own, we just forget it
+            cell.targetVolume = 0
+            cell.lambdaVolume = 1.0
+            steppable.getDictionaryAttribute(cell).pop(CC3DKey.DATA_KEY, None)
+        store.remove(cell.id)
+
+    # Move the living cells together once too many slots are free
+    if len(store.free) > Config.COMPACT_FRACTION * store.used:
+        store.compact()
+
+def bury(steppable, store=STORE):
+    # Removes the cells that died since the last call (see CellStore.kill)
+    dead = store.take_dead()
+    remove(steppable, [store.views[id].cc3d_cell for id in dead if id in store.views], store)
+    return dead
+
+def decide(steppable, dice=DICE, store=STORE):
+    # Fate decisions of every cell past the decision age
+    # steppable has to be a MitosisSteppable (for divideCellRandomOrientation)
+    cells = old_cells(steppable)
+    fates = draw_fates(len(cells), dice)
+    ids = numpy.array([cell.id for cell in cells], dtype=numpy.int64)
+
+    # Apoptosis: the cell is removed, it no longer counts in the plots
+    # Done first so the daughters can use the room and the slots left behind
+    remove(steppable, [cell for cell, fate in zip(cells, fates) if fate == APOPTOSIS], store)
+
+    # Division: one by one since the simulator has to find room for the daughter
+    for cell, fate in zip(cells, fates):
+        if fate == DIVISION:
+            steppable.divideCellRandomOrientation(cell)
+
+    # Quiescence: nothing happens
+    counts = numpy.bincount(fates, minlength=3)
+    store.events[Event.STOCHASTIC_APOPTOSIS] += int(counts[APOPTOSIS])
+    store.events[Event.STOCHASTIC_DIVISION] += int(counts[DIVISION])
+    store.events[Event.STOCHASTIC_QUIESCENCE] += int(counts[QUIESCENCE])
+
+    return ids, fates
+
+def inherit(steppable, mother, daughter, store=STORE):
+    # Called after a division, the daughter gets the information of its mother
+    mother_slot = store.slot(mother.id)
+    if mother_slot == 0:
+        return None
+
+    slot = store.allocate(daughter.id)
+    for name in store.FIELDS:
+        values = getattr(store, name)
+        values[slot] = values[mother_slot]
+    store.id[slot] = daughter.id
+    for name in UNBOUND:
+        getattr(store, name)[slot] = store.DEFAULTS.get(name, 0)
+
+    view_class = APC if store.kind[slot] == store.APC else TCell
+    view = view_class.attach(daughter, daughter.id)
+    steppable.getDictionaryAttribute(daughter)[CC3DKey.DATA_KEY] = view
+    Transitions.enter(view)
+    return view
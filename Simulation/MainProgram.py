@@ -21,17 +21,37 @@ sim, simthread = CompuCellSetup.getCoreSimulationObjects()
 CompuCellSetup.initializeSimulationObjects(sim,simthread)
      
 steppableRegistry = CompuCellSetup.getSteppableRegistry()
+
+# Times every steppable when Config.PROFILE is True (see Profiling.py)
+from Profiling import PROFILER
         
 from Steppables import MainSteppable
 steppableInstance = MainSteppable(sim,_frequency=1)
-steppableRegistry.registerSteppable(steppableInstance)
+steppableRegistry.registerSteppable(PROFILER.instrument(steppableInstance))
 
 from Steppables import PlotSteppable
 steppableInstance = PlotSteppable(sim,_frequency=1)
-steppableRegistry.registerSteppable(steppableInstance)
+steppableRegistry.registerSteppable(PROFILER.instrument(steppableInstance))
 
 from Steppables import VolumeSteppable
 steppableInstance = VolumeSteppable(sim,_frequency=10)
-steppableRegistry.registerSteppable(steppableInstance)  
+steppableRegistry.registerSteppable(PROFILER.instrument(steppableInstance))  
+
+from Steppables import MitosisSteppable
+steppableInstance = MitosisSteppable(sim,_frequency=10)
+steppableRegistry.registerSteppable(PROFILER.instrument(steppableInstance))
+
+# Only when TATTRACT is solved at its steady state instead of by DiffusionSolverFE (see Chemokine.py)
+import Config
+if Config.CHEMOKINE_MODE == 'steady':
+    from Steppables import ChemokineSteppable
+    steppableInstance = ChemokineSteppable(sim,_frequency=1)
+    steppableRegistry.registerSteppable(PROFILER.instrument(steppableInstance))
+
+# Only when the cells are saved for looking at the run afterwards (see Snapshots.py)
+if Config.SNAPSHOT_INTERVAL > 0:
+    from Steppables import SnapshotSteppable
+    steppableInstance = SnapshotSteppable(sim,_frequency=Config.SNAPSHOT_INTERVAL)
+    steppableRegistry.registerSteppable(PROFILER.instrument(steppableInstance))
 
 CompuCellSetup.mainLoop(sim,simthread,steppableRegistry)    
\ No newline at end of file
@@ -0,0 +1,271 @@
+##########################################################
+#	File: Metrics.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Saves the values of our plots (see Data.py) while the simulation runs.
+#	PlotSteppable appends one row per MCS. Rows are kept in memory in small chunks and every
+#	full chunk is appended to disk and synced, so stopping a run only loses the last chunk.
+#
+#	The metrics are a folder with one binary file per column (float64) plus header.json.
+#	Each column file can be opened with numpy.memmap without loading it.
+#	Making the .dat files and pictures of the plots is done afterwards with:
+#		python Metrics.py <metrics folder> [output folder]
+#
+#	The Downsampler keeps long curves small enough to draw (see PlotSteppable).
+#
+##########################################################
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import numpy
+
+import Data
+
+# Increase this if the format of the files changes
+VERSION = 1
+
+# Every value is stored as a little-endian float64
+DTYPE = '<f8'
+
+# The plots of PlotSteppable: file name, title, y axis and (curve name, Data variable, color) for every curve
+PLOTS = [
+    # Ligand Losing
+    ('lost_ligands', 'Amount of Peptide-MHC, CD80, CD86 ligand lost', 'Amount (AU)',
+        [('Peptide-MHC', 'TOTAL_LOST_PEPTIDEMHC', 'red'), ('CD80', 'TOTAL_LOST_CD80', 'green'),
+         ('CD86', 'TOTAL_LOST_CD86', 'purple')]),
+    # Affinity / Receptor Engagement
+    ('affinities', 'External CTLA-4 and CD28 Receptor Engagement', 'Number of times bound to ligand',
+        [('CD28', 'TOTAL_ENGAGED_CD28', 'blue'), ('External CTLA-4', 'TOTAL_ENGAGED_EXTERNAL_CTLA4', 'red')]),
+    # APC Downregulation / Ligands
+    ('apc_ligands', 'Peptide-MHC, CD80, and CD86 Downregulation', 'Amount (AU)',
+        [('Peptide-MHC', 'TOTAL_AMOUNT_PEPTIDEMHC', 'red'), ('CD80', 'TOTAL_AMOUNT_CD80', 'green'),
+         ('CD86', 'TOTAL_AMOUNT_CD86', 'purple')]),
+    # T-Cell Downregulation / Receptors
+    ('tcell_receptors', 'CD28, External CTLA-4, and Internal CTLA-4 Downregulation', 'Amount (AU)',
+        [('TCR', 'TOTAL_AMOUNT_TCR', 'black'), ('CD28', 'TOTAL_AMOUNT_CD28', 'blue'),
+         ('Internal CTLA-4', 'TOTAL_AMOUNT_INTERNAL_CTLA4', 'red'), ('External CTLA-4', 'TOTAL_AMOUNT_EXTERNAL_CTLA4', 'green')]),
+    # Total Cell Counts
+    ('cell_counts', 'Total Cell Counts', 'Number of Cells',
+        [('APC', 'TOTAL_APC', 'green'), ('T-Cells', 'TOTAL_TCELLS', 'purple')]),
+    # TREG Cell Counts
+    ('treg_cells', 'TREG Cells Count', 'Number of Cells',
+        [('Inactive', 'TOTAL_TREG_INACTIVE', 'green'), ('Active', 'TOTAL_TREG_ACTIVE', 'yellow'),
+         ('Anergic', 'TOTAL_TREG_ANERGIC', 'brown')]),
+    # TCONV Cell Counts
+    ('tconv_cells', 'TCONV Cells Count', 'Number of Cells',
+        [('Inactive', 'TOTAL_TCONV_INACTIVE', 'magenta'), ('Active', 'TOTAL_TCONV_ACTIVE', 'darkblue'),
+         ('Anergic', 'TOTAL_TCONV_ANERGIC', 'cyan')]),
+    # Stochastic Occurences
+    ('stochastic', 'Stochastic Processes', 'Number of Occurences',
+        [('Apoptosis', 'TOTAL_STOCHASTIC_APOPTOSIS', 'magenta'), ('Division', 'TOTAL_STOCHASTIC_DIVISION', 'darkblue'),
+         ('Quiescence', 'TOTAL_STOCHASTIC_QUIESCENCE', 'cyan')]),
+]
+
+# The columns of every row: the MCS and then every Data variable in the plots
+COLUMNS = ['MCS'] + [name for _, _, _, curves in PLOTS for _, name, _ in curves]
+
+def current_row(mcs):
+    # The row for this MCS, read from Data
+    return [mcs] + [getattr(Data, name) for name in COLUMNS[1:]]
+
+def output_path(steppable, file_name):
+    # Where a steppable should write its files
+    # Headless.py lets us choose the folder, inside CC3D we use the current one
+    output_dir = getattr(getattr(steppable, 'simulator', None), 'output_dir', None)
+    return os.path.join(output_dir, file_name) if output_dir else file_name
+
+def column_file(path, index):
+    return os.path.join(path, 'column_' + str(index) + '.bin')
+
+##########################################################
+#	Downsampler
+#
+#	Keeps a curve to at most max_points buckets no matter how long the simulation runs.
+#	Every bucket remembers its lowest and highest point. When we run out of buckets
+#	neighbors are merged two by two, so each bucket covers twice as many points as before.
+##########################################################
+class Downsampler(object):
+    def __init__(self, max_points=1000):
+        self.max_points = max(1, max_points)
+        # How many points a full bucket covers
+        self.width = 1
+        # [x of the lowest point, lowest y, x of the highest point, highest y] of every bucket
+        self.buckets = []
+        # How many points are in each bucket
+        self.counts = []
+
+    def add(self, x, y):
+        if self.buckets and self.counts[-1] < self.width:
+            bucket = self.buckets[-1]
+            if y < bucket[1]:
+                bucket[0], bucket[1] = x, y
+            if y > bucket[3]:
+                bucket[2], bucket[3] = x, y
+            self.counts[-1] += 1
+            return
+
+        self.buckets.append([x, y, x, y])
+        self.counts.append(1)
+        if len(self.buckets) > self.max_points:
+            self.merge()
+
+    def merge(self):
+        buckets = []
+        counts = []
+        for index in range(0, len(self.buckets), 2):
+            pair = self.buckets[index:index + 2]
+            lowest = min(pair, key=lambda bucket: bucket[1])
+            highest = max(pair, key=lambda bucket: bucket[3])
+            buckets.append([lowest[0], lowest[1], highest[2], highest[3]])
+            counts.append(sum(self.counts[index:index + 2]))
+
+        self.buckets = buckets
+        self.counts = counts
+        self.width *= 2
+
+    def checkpoint(self):
+        return {'width': self.width, 'buckets': self.buckets, 'counts': self.counts}
+
+    def resume(self, state):
+        self.width = state['width']
+        self.buckets = [list(bucket) for bucket in state['buckets']]
+        self.counts = list(state['counts'])
+
+    def points(self):
+        # The lowest and highest point of every bucket in order of x
+        xs = []
+        ys = []
+        for x_low, y_low, x_high, y_high in self.buckets:
+            for x, y in sorted(set([(x_low, y_low), (x_high, y_high)])):
+                xs.append(x)
+                ys.append(y)
+        return xs, ys
+
+##########################################################
+#	MetricWriter
+#
+#	rows is how many rows to keep from a previous run (when resuming from a checkpoint)
+##########################################################
+class MetricWriter(object):
+    def __init__(self, path, columns=COLUMNS, chunk_rows=256, rows=0):
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_rows = chunk_rows
+
+        # Rows waiting to be written
+        self.chunk = numpy.zeros((chunk_rows, len(self.columns)), dtype=DTYPE)
+        self.buffered = 0
+        # Rows already on disk
+        self.rows = rows
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        header = {'version': VERSION, 'dtype': DTYPE, 'columns': self.columns, 'chunk_rows': chunk_rows}
+        with open(os.path.join(path, 'header.json'), 'w') as header_file:
+            json.dump(header, header_file, indent=1)
+
+        # Start with empty columns, or cut the old ones after the rows we keep
+        # A column the old run didn't have (e.g. added to PLOTS since) starts with zeros in those rows
+        self.files = []
+        for index in range(len(self.columns)):
+            name = column_file(path, index)
+            column = open(name, 'r+b' if rows and os.path.isfile(name) else 'wb')
+            column.truncate(rows * numpy.dtype(DTYPE).itemsize)
+            column.seek(0, os.SEEK_END)
+            self.files.append(column)
+
+    def append(self, row):
+        self.chunk[self.buffered] = row
+        self.buffered += 1
+        if self.buffered == self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        # Write the buffered rows at the end of every column and make sure they reach the disk
+        if not self.buffered:
+            return
+
+        for index, column in enumerate(self.files):
+            column.write(self.chunk[:self.buffered, index].tobytes())
+            column.flush()
+            os.fsync(column.fileno())
+
+        self.rows += self.buffered
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        for column in self.files:
+            column.close()
+        self.files = []
+
+##########################################################
+#	MetricReader
+##########################################################
+class MetricReader(object):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as header_file:
+            header = json.load(header_file)
+
+        if header['version'] != VERSION:
+            raise ValueError('Unsupported metrics version ' + str(header['version']) + ' in ' + path)
+
+        self.columns = header['columns']
+        self.dtype = numpy.dtype(header['dtype'])
+
+        # If the run was stopped while writing a chunk some columns can be longer, so use the shortest
+        sizes = [os.path.getsize(column_file(path, index)) for index in range(len(self.columns))]
+        self.rows = min(sizes) // self.dtype.itemsize if sizes else 0
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        # Memory-mapped, nothing is loaded until it's used
+        if self.rows == 0:
+            return numpy.zeros(0, dtype=self.dtype)
+        return numpy.memmap(column_file(self.path, self.columns.index(name)), dtype=self.dtype, mode='r', shape=(self.rows,))
+
+# Makes the .dat files (and pictures if matplotlib is available) of every plot
+# The .dat files have every point, the pictures are downsampled to max_points
+def render(path, output_dir='.', png=True, max_points=1000):
+    reader = MetricReader(path)
+    mcs = reader.column('MCS')
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as pyplot
+    except ImportError:
+        png = False
+
+    for file_name, title, y_title, curves in PLOTS:
+        with open(os.path.join(output_dir, file_name + '.dat'), 'w') as data_file:
+            for label, name, color in curves:
+                data_file.write('# ' + label + '\n')
+                for x, y in zip(mcs, reader.column(name)):
+                    data_file.write(str(int(x)) + ' ' + repr(float(y)) + '\n')
+                data_file.write('\n')
+
+        if png:
+            figure = pyplot.figure(figsize=(10, 10), dpi=100)
+            for label, name, color in curves:
+                curve = Downsampler(max_points)
+                for x, y in zip(mcs, reader.column(name)):
+                    curve.add(x, y)
+                xs, ys = curve.points()
+                pyplot.plot(xs, ys, label=label)
+            pyplot.title(title)
+            pyplot.xlabel('MonteCarlo Step (MCS)')
+            pyplot.ylabel(y_title)
+            pyplot.legend()
+            figure.savefig(os.path.join(output_dir, file_name + '.png'))
+            pyplot.close(figure)
+
+if __name__ == '__main__':
+    render(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else '.')
@@ -0,0 +1,225 @@
+##########################################################
+#	File: Profiling.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Tells us where the time of a run goes.
+#	Turn it on with Config.PROFILE = True, then PROFILER times:
+#		start/step/finish of every steppable registered with PROFILER.instrument (see MainProgram.py)
+#		The phases inside MainSteppable.step (contacts, interact, binding, recycling, removal)
+#		The Potts step and volumes of Headless.py
+#		Every MCS (MCS/sec)
+#	and counts how many interactions, bindings, activations, anergies and resets happen every MCS.
+#
+#	When the simulation finishes everything is saved in Config.PROFILE_FILE (JSON) with a histogram per
+#	phase and per counter, so slow MCS show up and not just the average. Print it with:
+#		python Profiling.py <profile file>
+#
+#	When it is off steppables aren't touched and phase/count do nothing, so it costs next to nothing.
+#
+##########################################################
+import bisect
+import json
+import sys
+import time
+from collections import OrderedDict
+
+import Config
+import Metrics
+
+# Best clock we have (Python 2 doesn't have perf_counter)
+clock = getattr(time, 'perf_counter', time.time)
+
+# Upper edges of the bins of the timing histograms (seconds), 4 per decade from 1 microsecond to 100 seconds
+TIME_EDGES = [10 ** (exponent / 4.0) for exponent in range(-24, 9)]
+
+# Upper edges of the bins of the counter histograms (how many per MCS)
+COUNT_EDGES = [0] + [2 ** exponent for exponent in range(21)]
+
+##########################################################
+#	Histogram
+#
+#	How many values fell in each bin plus their total and maximum, the memory doesn't grow with the run.
+#	Bin i has the values up to edges[i], the last bin has everything above the last edge.
+##########################################################
+class Histogram(object):
+    def __init__(self, edges):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.calls = 0
+        self.total = 0
+        self.maximum = 0
+
+    def add(self, value, times=1):
+        self.counts[bisect.bisect_left(self.edges, value)] += times
+        self.calls += times
+        self.total += value * times
+        self.maximum = max(self.maximum, value)
+
+    def summary(self):
+        return OrderedDict([
+            ('calls', self.calls),
+            ('total', self.total),
+            ('mean', self.total / float(self.calls) if self.calls else 0.0),
+            ('max', self.maximum),
+            ('edges', self.edges),
+            ('counts', self.counts),
+        ])
+
+# What phase gives back when profiling is off
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class Timer(object):
+    __slots__ = ('profiler', 'name', 'started')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = clock()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, clock() - self.started)
+        return False
+
+##########################################################
+#	Profiler
+##########################################################
+class Profiler(object):
+    def __init__(self, enabled=None):
+        self.enabled = Config.PROFILE if enabled is None else enabled
+        self.reset()
+
+    def reset(self):
+        # Phase -> Histogram of how long it took (seconds)
+        self.timings = OrderedDict()
+        # Counter -> Histogram of how many times it happened every MCS
+        self.counters = OrderedDict()
+        # Counter -> how many times it happened during the current MCS
+        self.counts = {}
+
+        # The MCS being timed and when it started
+        self.mcs = None
+        self.started = None
+
+    def phase(self, name):
+        # with PROFILER.phase('binding'): ...
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, name)
+
+    def record(self, name, seconds):
+        histogram = self.timings.get(name)
+        if histogram is None:
+            histogram = self.timings[name] = Histogram(TIME_EDGES)
+        histogram.add(seconds)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def begin_mcs(self, mcs):
+        # Closes the MCS before this one, steppables call this for us (see instrument)
+        if not self.enabled:
+            return
+
+        now = clock()
+        if self.mcs is not None:
+            self.end_mcs(now)
+        self.mcs = mcs
+        self.started = now
+
+    def end_mcs(self, now=None):
+        if self.mcs is None:
+            return
+
+        self.record('mcs', (clock() if now is None else now) - self.started)
+        done = self.timings['mcs'].calls
+
+        # Every counter gets a value every MCS, even if it was 0
+        for name, amount in self.counts.items():
+            if name not in self.counters:
+                self.counters[name] = Histogram(COUNT_EDGES)
+                self.counters[name].add(0, done - 1)
+        for name, histogram in self.counters.items():
+            histogram.add(self.counts.get(name, 0))
+
+        self.counts = {}
+        self.mcs = None
+
+    def instrument(self, steppable, name=None):
+        # Times start, step and finish of a steppable, gives the same steppable back
+        # When profiling is off the steppable is left as is
+        if not self.enabled:
+            return steppable
+
+        name = name or type(steppable).__name__
+        start, step, finish = steppable.start, steppable.step, steppable.finish
+
+        def timed_start():
+            with self.phase(name + '.start'):
+                start()
+
+        def timed_step(mcs):
+            if mcs != self.mcs:
+                self.begin_mcs(mcs)
+            with self.phase(name + '.step'):
+                step(mcs)
+
+        def timed_finish():
+            self.end_mcs()
+            with self.phase(name + '.finish'):
+                finish()
+            self.save(Metrics.output_path(steppable, Config.PROFILE_FILE))
+
+        steppable.start = timed_start
+        steppable.step = timed_step
+        steppable.finish = timed_finish
+        return steppable
+
+    def summary(self):
+        mcs = self.timings.get('mcs')
+        seconds = mcs.total if mcs else 0.0
+        return OrderedDict([
+            ('mcs', mcs.calls if mcs else 0),
+            ('seconds', seconds),
+            ('mcs_per_sec', mcs.calls / seconds if seconds > 0 else 0.0),
+            ('timings', OrderedDict((name, histogram.summary()) for name, histogram in self.timings.items())),
+            ('counters', OrderedDict((name, histogram.summary()) for name, histogram in self.counters.items())),
+        ])
+
+    def save(self, path):
+        with open(path, 'w') as profile_file:
+            json.dump(self.summary(), profile_file, indent=1)
+
+def report(path):
+    # The phases from slowest to fastest and the counters, as text
+    with open(path) as profile_file:
+        summary = json.load(profile_file)
+
+    lines = [str(summary['mcs']) + ' MCS in ' + str(round(summary['seconds'], 3)) + ' seconds (' +
+             str(round(summary['mcs_per_sec'], 1)) + ' MCS/sec)', '']
+    timings = sorted(summary['timings'].items(), key=lambda item: -item[1]['total'])
+    for name, timing in timings:
+        share = 100.0 * timing['total'] / summary['seconds'] if summary['seconds'] else 0.0
+        lines.append('%-28s %8.3f s %6.1f %% %10d calls %10.6f s mean %10.6f s max' %
+                     (name, timing['total'], share, timing['calls'], timing['mean'], timing['max']))
+    lines.append('')
+    for name, counter in summary['counters'].items():
+        lines.append('%-28s %10d total %10.1f per MCS %10d max' % (name, counter['total'], counter['mean'], counter['max']))
+    return '\n'.join(lines)
+
+# The profiler used by our steppables
+PROFILER = Profiler()
+
+if __name__ == '__main__':
+    print(report(sys.argv[1]))
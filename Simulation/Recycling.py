@@ -0,0 +1,66 @@
+##########################################################
+#	File: Recycling.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	CTLA-4 recycling of every active TCell at once.
+#	CTLA-4 moves between the surface (external) and the inside of the cell (internal):
+#		d(external)/dt = EXOCYTOSIS * internal - ENDOCYTOSIS * external
+#		d(internal)/dt = ENDOCYTOSIS * external - EXOCYTOSIS * internal
+#	Instead of one SBML solver per cell (see the commented code of MainSteppable) we integrate
+#	this for all the active TCells together with numpy, using Runge-Kutta 4 with a fixed step.
+#
+#	Our amounts are whole numbers, so the part of a molecule that moved but isn't counted yet
+#	is kept in the store (recycling_carry) for the next MCS. The total never changes.
+#
+##########################################################
+import numpy
+
+import Config
+from CellStore import STORE
+from CellTypes import State
+
+def derivative(external, internal):
+    # How fast CTLA-4 goes from the surface to the inside
+    return Config.CTLA4_ENDOCYTOSIS_RATE * external - Config.CTLA4_EXOCYTOSIS_RATE * internal
+
+def integrate(external, internal, time=1.0, steps=None):
+    # Runge-Kutta 4, gives back the new external and internal amounts after time (mcs)
+    steps = Config.RECYCLING_SUBSTEPS if steps is None else steps
+    dt = float(time) / steps
+
+    for _ in range(steps):
+        k1 = derivative(external, internal)
+        k2 = derivative(external - 0.5 * dt * k1, internal + 0.5 * dt * k1)
+        k3 = derivative(external - 0.5 * dt * k2, internal + 0.5 * dt * k2)
+        k4 = derivative(external - dt * k3, internal + dt * k3)
+        moved = dt * (k1 + 2 * k2 + 2 * k3 + k4) / 6.0
+
+        external = external - moved
+        internal = internal + moved
+
+    return external, internal
+
+def recycle(store=STORE, time=1.0):
+    # One MCS of recycling for every active TCell
+    used = slice(0, store.used)
+    kind = store.kind[used]
+    slots = numpy.flatnonzero(store.alive[used] & ((kind == store.TREG) | (kind == store.TCONV)) & (store.state[used] == State.ACTIVE))
+    if len(slots) == 0:
+        return slots
+
+    external = store.total_external_CTLA4[slots].astype(numpy.float64)
+    internal = store.total_internal_CTLA4[slots].astype(numpy.float64)
+    total = external + internal
+
+    # Include what already moved during the last MCS but wasn't counted yet
+    carry = store.recycling_carry[slots].astype(numpy.float64)
+    external, internal = integrate(external - carry, internal + carry, time)
+
+    # Back to whole numbers keeping the total the same
+    counted = numpy.clip(numpy.rint(internal), 0, total)
+    store.recycling_carry[slots] = internal - counted
+    store.total_internal_CTLA4[slots] = counted
+    store.total_external_CTLA4[slots] = total - counted
+
+    return store.id[slots]
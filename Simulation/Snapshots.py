@@ -0,0 +1,308 @@
+##########################################################
+#	File: Snapshots.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Saves where every cell is so a run can be looked at afterwards without the CC3D Player
+#	(e.g. runs on machines without a screen). Set Config.SNAPSHOT_INTERVAL and SnapshotSteppable
+#	saves a frame every that many MCS:
+#		The cell field: id of the cell in every pixel (every block in Headless.py), 0 is Medium
+#		Every cell: id, center of mass, CC3D type, kind and State (see CellStore.py)
+#
+#	The snapshots are a folder with header.json, data.bin and index.bin:
+#		The field is cut along x in chunks of Config.SNAPSHOT_CHUNK layers, each compressed on its own
+#		so looking at part of the lattice only reads that part.
+#		Cells hardly move between frames, so most frames only save the field minus the one of the frame
+#		before (almost all zeros, which compresses to almost nothing). Every Config.SNAPSHOT_KEYFRAME_INTERVAL
+#		frames one is saved whole, so reading any frame never goes back further than that.
+#		index.bin has one fixed size record per frame saying where everything is inside data.bin,
+#		it is opened with numpy.memmap so nothing is read until a frame is asked for.
+#	Like the metrics (see Metrics.py) frames are synced to disk every few frames, stopping a run only loses those.
+#
+#	Reading them:
+#		snapshots = SnapshotReader(folder)
+#		for frame in range(len(snapshots)):
+#			field = snapshots.field(frame)
+#			cells = snapshots.cells(frame)
+#	Going forward frame by frame only applies one difference per frame.
+#	For a summary run: python Snapshots.py <snapshots folder> [frame]
+#
+##########################################################
+import json
+import os
+import sys
+import zlib
+
+import numpy
+
+import Config
+from CellStore import STORE
+
+# Increase this if the format of the files changes
+VERSION = 1
+
+# Types of the field and of every column of the cells (all little-endian)
+FIELD_DTYPE = '<i4'
+CELL_COLUMNS = [('id', '<i4', 1), ('center', '<f4', 3), ('type', '<i2', 1), ('kind', '<i1', 1), ('state', '<i1', 1)]
+
+# zlib level, the differences are mostly zeros so a fast level is almost as small
+COMPRESSION = 1
+
+# Frames kept in memory before they are synced to disk
+SYNC_FRAMES = 16
+
+def index_dtype(chunks):
+    # One record per frame: its MCS, whether it's saved whole, how many cells it has
+    # and where its cells and each chunk of its field are inside data.bin
+    return numpy.dtype([('mcs', '<i8'), ('keyframe', 'u1'), ('cells', '<i8'),
+                        ('cells_offset', '<i8'), ('cells_length', '<i8'),
+                        ('offsets', '<i8', (chunks,)), ('lengths', '<i8', (chunks,))])
+
+def chunk_bounds(length, chunk):
+    # [first x, last x + 1) of every chunk
+    return [(start, min(start + chunk, length)) for start in range(0, length, chunk)]
+
+def encode_cells(ids, centers, types, kinds, states):
+    columns = [ids, centers, types, kinds, states]
+    return b''.join(numpy.ascontiguousarray(column, dtype=dtype).tobytes()
+                    for column, (_, dtype, _) in zip(columns, CELL_COLUMNS))
+
+def decode_cells(data, count):
+    cells = {}
+    offset = 0
+    for name, dtype, width in CELL_COLUMNS:
+        size = numpy.dtype(dtype).itemsize * width * count
+        column = numpy.frombuffer(data[offset:offset + size], dtype=dtype)
+        cells[name] = column.reshape(count, width) if width > 1 else column
+        offset += size
+    return cells
+
+def capture(steppable, store=STORE):
+    # (field, pixels per field value, ids, centers, types, kinds, states) right now
+    # The simulator can give the field and centers at once (see Headless.py), inside CC3D we read them cell by cell
+    simulator = steppable.simulator
+    cell_field = getattr(simulator, 'cell_field', None)
+    cell_centers = getattr(simulator, 'cell_centers', None)
+    if cell_field is not None and cell_centers is not None:
+        field, width = cell_field()
+        ids, centers = cell_centers()
+        types = numpy.array([simulator.cells[id].type for id in ids.tolist()], dtype=numpy.int64)
+    else:
+        dim = steppable.dim
+        field = numpy.zeros((dim.x, dim.y, dim.z), dtype=FIELD_DTYPE)
+        for x in range(dim.x):
+            for y in range(dim.y):
+                for z in range(dim.z):
+                    cell = steppable.cellField[x, y, z]
+                    if cell:
+                        field[x, y, z] = cell.id
+        width = 1
+
+        cells = list(steppable.cellList)
+        ids = numpy.array([cell.id for cell in cells], dtype=numpy.int64)
+        centers = numpy.array([(cell.xCOM, cell.yCOM, cell.zCOM) for cell in cells], dtype=float).reshape(-1, 3)
+        types = numpy.array([cell.type for cell in cells], dtype=numpy.int64)
+
+    slots = store.slots(ids)
+    return field, width, ids, centers, types, store.kind[slots], store.state[slots]
+
+##########################################################
+#	SnapshotWriter
+#
+#	frames is how many frames to keep from a previous run (when resuming from a checkpoint)
+##########################################################
+class SnapshotWriter(object):
+    def __init__(self, path, shape, width=1, chunk=None, keyframe_interval=None, frames=0):
+        self.path = path
+        self.shape = tuple(int(length) for length in shape)
+        self.chunk = max(1, Config.SNAPSHOT_CHUNK if chunk is None else chunk)
+        self.keyframe_interval = max(1, Config.SNAPSHOT_KEYFRAME_INTERVAL if keyframe_interval is None else keyframe_interval)
+        self.bounds = chunk_bounds(self.shape[0], self.chunk)
+        self.dtype = index_dtype(len(self.bounds))
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        header = {'version': VERSION, 'shape': self.shape, 'width': width, 'chunk': self.chunk,
+                  'keyframe_interval': self.keyframe_interval, 'field_dtype': FIELD_DTYPE,
+                  'cell_columns': CELL_COLUMNS}
+        with open(os.path.join(path, 'header.json'), 'w') as header_file:
+            json.dump(header, header_file, indent=1)
+
+        # Keep the frames before the checkpoint and whatever they point to inside data.bin
+        self.index = open(os.path.join(path, 'index.bin'), 'r+b' if frames else 'wb')
+        self.data = open(os.path.join(path, 'data.bin'), 'r+b' if frames else 'wb')
+        end = 0
+        if frames:
+            kept = numpy.frombuffer(self.index.read(frames * self.dtype.itemsize), dtype=self.dtype)
+            end = max(int((kept['cells_offset'] + kept['cells_length']).max()), int((kept['offsets'] + kept['lengths']).max()))
+        self.index.truncate(frames * self.dtype.itemsize)
+        self.index.seek(0, os.SEEK_END)
+        self.data.truncate(end)
+        self.data.seek(0, os.SEEK_END)
+        self.offset = end
+
+        # Frames on disk, records waiting to be synced and the field of the last frame
+        self.frames = frames
+        self.records = []
+        self.previous = None
+
+    def write(self, data):
+        # Where a compressed blob went inside data.bin
+        blob = zlib.compress(data, COMPRESSION)
+        self.data.write(blob)
+        offset = self.offset
+        self.offset += len(blob)
+        return offset, len(blob)
+
+    def append(self, mcs, field, ids, centers, types, kinds, states):
+        field = numpy.asarray(field, dtype=FIELD_DTYPE)
+        frame = self.frames + len(self.records)
+        # The first frame after resuming has no frame before it in memory
+        keyframe = self.previous is None or frame % self.keyframe_interval == 0
+
+        record = numpy.zeros((), dtype=self.dtype)
+        record['mcs'] = mcs
+        record['keyframe'] = keyframe
+        record['cells'] = len(ids)
+        record['cells_offset'], record['cells_length'] = self.write(encode_cells(ids, centers, types, kinds, states))
+
+        saved = field if keyframe else field - self.previous
+        for index, (start, end) in enumerate(self.bounds):
+            record['offsets'][index], record['lengths'][index] = self.write(numpy.ascontiguousarray(saved[start:end]).tobytes())
+
+        self.previous = field.copy()
+        self.records.append(record)
+        if len(self.records) >= SYNC_FRAMES:
+            self.flush()
+
+    def flush(self):
+        # The data goes first, so index.bin never points to something that isn't on disk
+        if not self.records:
+            return
+
+        self.data.flush()
+        os.fsync(self.data.fileno())
+        self.index.write(numpy.array(self.records, dtype=self.dtype).tobytes())
+        self.index.flush()
+        os.fsync(self.index.fileno())
+
+        self.frames += len(self.records)
+        self.records = []
+
+    def close(self):
+        self.flush()
+        self.index.close()
+        self.data.close()
+
+##########################################################
+#	SnapshotReader
+##########################################################
+class SnapshotReader(object):
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as header_file:
+            header = json.load(header_file)
+
+        if header['version'] != VERSION:
+            raise ValueError('Unsupported snapshots version ' + str(header['version']) + ' in ' + path)
+
+        self.shape = tuple(header['shape'])
+        self.width = header['width']
+        self.bounds = chunk_bounds(self.shape[0], header['chunk'])
+        self.dtype = index_dtype(len(self.bounds))
+
+        size = os.path.getsize(os.path.join(path, 'index.bin'))
+        self.frames = size // self.dtype.itemsize
+        if self.frames:
+            self.index = numpy.memmap(os.path.join(path, 'index.bin'), dtype=self.dtype, mode='r', shape=(self.frames,))
+        else:
+            self.index = numpy.zeros(0, dtype=self.dtype)
+        self.data = open(os.path.join(path, 'data.bin'), 'rb')
+
+        # The keyframe at or before every frame
+        keyframes = numpy.flatnonzero(numpy.asarray(self.index['keyframe']))
+        self.keyframe_of = keyframes[numpy.searchsorted(keyframes, numpy.arange(self.frames), side='right') - 1] if self.frames else keyframes
+
+        # Chunk index -> (frame, its decoded values), so going forward only applies the next differences
+        self.decoded = {}
+
+    def __len__(self):
+        return self.frames
+
+    def mcs(self):
+        return numpy.asarray(self.index['mcs'])
+
+    def read(self, offset, length):
+        self.data.seek(offset)
+        return zlib.decompress(self.data.read(length))
+
+    def chunk(self, frame, index):
+        # Values of one chunk of the field at a frame
+        start, end = self.bounds[index]
+        shape = (end - start,) + self.shape[1:]
+        keyframe = int(self.keyframe_of[frame])
+
+        # Start from what we decoded last if it's on the way, otherwise from the keyframe
+        cached = self.decoded.get(index)
+        if cached is not None and keyframe <= cached[0] <= frame:
+            first, values = cached[0] + 1, cached[1].copy()
+        else:
+            first, values = keyframe + 1, None
+
+        if values is None:
+            record = self.index[keyframe]
+            values = numpy.frombuffer(self.read(record['offsets'][index], record['lengths'][index]), dtype=FIELD_DTYPE).reshape(shape).copy()
+        for step in range(first, frame + 1):
+            record = self.index[step]
+            values += numpy.frombuffer(self.read(record['offsets'][index], record['lengths'][index]), dtype=FIELD_DTYPE).reshape(shape)
+
+        self.decoded[index] = (frame, values)
+        return values
+
+    def field(self, frame, start=0, end=None):
+        # Cell id of every value of the field with x inside [start, end), only the chunks needed are read
+        end = self.shape[0] if end is None else end
+        needed = [index for index, (first, last) in enumerate(self.bounds) if first < end and last > start]
+        if not needed:
+            return numpy.zeros((0,) + self.shape[1:], dtype=FIELD_DTYPE)
+        values = numpy.concatenate([self.chunk(frame, index) for index in needed], axis=0)
+        offset = self.bounds[needed[0]][0]
+        return values[start - offset:end - offset]
+
+    def cells(self, frame):
+        # Columns of every cell of the frame (see CELL_COLUMNS)
+        record = self.index[frame]
+        return decode_cells(self.read(record['cells_offset'], record['cells_length']), int(record['cells']))
+
+    def types(self, frame, start=0, end=None):
+        # CC3D type of every value of the field (0 is Medium)
+        field = self.field(frame, start, end)
+        cells = self.cells(frame)
+        lookup = numpy.zeros(max(int(field.max()) if field.size else 0, int(cells['id'].max()) if len(cells['id']) else 0) + 1, dtype=numpy.int64)
+        lookup[cells['id']] = cells['type']
+        return lookup[field]
+
+    def close(self):
+        self.data.close()
+
+def summary(path, frame=None):
+    # How many frames there are and how much space they take
+    snapshots = SnapshotReader(path)
+    mcs = snapshots.mcs()
+    stored = sum(os.path.getsize(os.path.join(path, name)) for name in ('header.json', 'index.bin', 'data.bin'))
+    raw = len(snapshots) * int(numpy.prod(snapshots.shape)) * numpy.dtype(FIELD_DTYPE).itemsize
+    lines = [str(len(snapshots)) + ' frames' + (' from MCS ' + str(mcs[0]) + ' to ' + str(mcs[-1]) if len(mcs) else ''),
+             'Field ' + ' x '.join(str(length) for length in snapshots.shape) + ' (' + str(snapshots.width) + ' pixels per value)',
+             str(stored) + ' bytes saved, ' + str(raw) + ' bytes for the fields alone without compression']
+
+    if frame is not None:
+        cells = snapshots.cells(frame)
+        field = snapshots.field(frame)
+        lines.append('Frame ' + str(frame) + ' (MCS ' + str(mcs[frame]) + '): ' + str(len(cells['id'])) + ' cells, ' +
+                     str(int((field > 0).sum())) + ' values with a cell')
+    snapshots.close()
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    print(summary(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None))
@@ -0,0 +1,289 @@
+##########################################################
+#	File: Spatial.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Answers "which cells are near this point" without looking at every cell.
+#	The NeighborTracker only tells us who is touching, this also works for cells further away
+#	(e.g. the APCs a TCell could be searching for or ligands that act at a distance).
+#
+#	The space is cut in cubes of Config.SPATIAL_CELL_SIZE pixels (buckets) and every cell is put
+#	in the bucket of its center of mass. A query only looks at the buckets around the point,
+#	so each one costs about the same no matter how many cells there are.
+#
+#	ChemokineSteppable keeps one with the APCs (see Chemokine.py) and updates it when it needs them.
+#	Only cells that changed bucket since the last query make the buckets be sorted again.
+#	Cells spread far apart for the size of the buckets would need a huge box of buckets,
+#	so the buckets are made bigger until there are at most BUCKETS_PER_CELL for every cell.
+#	It can also be built straight from ids and centers for analysis:
+#		space = SpatialHash()
+#		space.set(ids, centers)
+#		point_index, ids, distances = space.within(points, radius)
+#		ids, distances = space.nearest(points, k)
+#
+##########################################################
+import numpy
+
+import Config
+from CellStore import STORE
+
+# Bucket coordinates are packed in one integer, 21 bits each
+KEY_BITS = 21
+KEY_OFFSET = 2 ** (KEY_BITS - 1)
+
+# Points looked up together, so the candidates of a big batch don't all have to fit in memory at once
+QUERY_CHUNK = 65536
+# Most buckets of the box for every cell in it (never fewer than MIN_BUCKETS)
+BUCKETS_PER_CELL = 64
+MIN_BUCKETS = 65536
+
+# Most candidates looked at together when a query reaches every bucket and every cell is a candidate
+QUERY_CANDIDATES = 2 ** 22
+
+def expand(starts, counts):
+    # Every index of the ranges [start, start + count) one after the other
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    before = numpy.cumsum(counts) - counts
+    return numpy.repeat(numpy.asarray(starts, dtype=numpy.int64) - before, counts) + numpy.arange(total)
+
+def flatten(coordinates, shape):
+    # Index of buckets (x, y, z) inside a box of this shape
+    return (coordinates[:, 0] * shape[1] + coordinates[:, 1]) * shape[2] + coordinates[:, 2]
+
+class SpatialHash(object):
+    def __init__(self, cell_size=None, kinds=None, store=STORE):
+        self.cell_size = float(Config.SPATIAL_CELL_SIZE if cell_size is None else cell_size)
+        # Size of the buckets right now, bigger than cell_size when the cells are far apart (see sort)
+        self.size = self.cell_size
+        # Only cells of these kinds are put in buckets (every cell when None)
+        self.kinds = kinds
+        self.store = store
+
+        # Center of mass and bucket key of every cell, indexed by cell id (-1 when not in a bucket)
+        self.center = numpy.zeros((64, 3), dtype=float)
+        self.bucket = numpy.full(64, -1, dtype=numpy.int64)
+        # Ids in buckets right now
+        self.members = numpy.zeros(0, dtype=numpy.int64)
+
+        # The ids sorted by bucket and how many are in each bucket
+        # Buckets are a box from lower covering every cell, so finding one is just indexing
+        self.order = numpy.zeros(0, dtype=numpy.int64)
+        self.lower = numpy.zeros(3, dtype=numpy.int64)
+        self.counts = numpy.zeros((0, 0, 0), dtype=numpy.int64)
+        # How far (in buckets) a query reaches -> (shape of the padded box, where each of its buckets starts)
+        self.padded = {}
+        # True when a cell changed bucket since the buckets were last sorted
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.members)
+
+    def ensure(self, id):
+        # Make sure this cell id fits, doubling when we run out
+        if id < len(self.bucket):
+            return
+
+        capacity = max(id + 1, 2 * len(self.bucket))
+        center = numpy.zeros((capacity, 3), dtype=float)
+        center[:len(self.center)] = self.center
+        bucket = numpy.full(capacity, -1, dtype=numpy.int64)
+        bucket[:len(self.bucket)] = self.bucket
+        self.center = center
+        self.bucket = bucket
+
+    def coordinates(self, points):
+        # Bucket of every point as integer (x, y, z)
+        return numpy.floor(numpy.asarray(points, dtype=float).reshape(-1, 3) / self.size).astype(numpy.int64)
+
+    def pack(self, coordinates):
+        # One integer per bucket
+        shifted = coordinates + KEY_OFFSET
+        return (shifted[..., 0] << (2 * KEY_BITS)) | (shifted[..., 1] << KEY_BITS) | shifted[..., 2]
+
+    def update(self, steppable):
+        # Take the centers of every cell of the simulation
+        # The simulator can give them all at once (see Headless.py), inside CC3D we use CenterOfMass
+        cell_centers = getattr(getattr(steppable, 'simulator', None), 'cell_centers', None)
+        if cell_centers is not None:
+            ids, centers = cell_centers()
+        else:
+            cells = [cell for cell in steppable.cellList if cell.targetVolume > 0]
+            ids = numpy.array([cell.id for cell in cells], dtype=numpy.int64)
+            centers = numpy.array([(cell.xCOM, cell.yCOM, cell.zCOM) for cell in cells], dtype=float).reshape(-1, 3)
+
+        self.set(ids, centers)
+
+    def set(self, ids, centers):
+        # These are all the cells now, the ones missing are taken out of their buckets
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        centers = numpy.asarray(centers, dtype=float).reshape(-1, 3)
+        if len(ids):
+            self.ensure(int(ids.max()))
+        self.center[ids] = centers
+
+        if self.kinds is not None:
+            keep = numpy.isin(self.store.kind[self.store.slots(ids)], self.kinds)
+            ids = ids[keep]
+            centers = centers[keep]
+
+        keys = self.pack(self.coordinates(centers))
+        gone = numpy.setdiff1d(self.members, ids)
+        if len(gone) or not numpy.array_equal(self.bucket[ids], keys):
+            self.bucket[gone] = -1
+            self.bucket[ids] = keys
+            self.dirty = True
+        self.members = ids
+
+    def sort(self):
+        # Group the ids by bucket (only when some cell changed bucket)
+        if not self.dirty:
+            return
+
+        members = numpy.sort(self.members)
+        self.size = self.cell_size
+        if len(members):
+            centers = self.center[members]
+            low = centers.min(axis=0)
+            high = centers.max(axis=0)
+            buckets = max(BUCKETS_PER_CELL * len(members), MIN_BUCKETS)
+            while numpy.prod(numpy.floor(high / self.size) - numpy.floor(low / self.size) + 1) > buckets:
+                self.size *= 2
+        coordinates = self.coordinates(self.center[members])
+        if len(members):
+            self.lower = coordinates.min(axis=0)
+            shape = coordinates.max(axis=0) - self.lower + 1
+        else:
+            self.lower = numpy.zeros(3, dtype=numpy.int64)
+            shape = numpy.zeros(3, dtype=numpy.int64)
+
+        flat = flatten(coordinates - self.lower, shape)
+        self.order = members[numpy.argsort(flat, kind='mergesort')]
+        self.counts = numpy.bincount(flat, minlength=int(numpy.prod(shape))).reshape(shape)
+        self.padded = {}
+        self.dirty = False
+
+    def padded_starts(self, reach):
+        # The box grown by 2 * reach buckets on every side, so a point up to reach buckets outside
+        # the box plus any offset up to reach still lands inside it (no need to check every lookup)
+        if reach not in self.padded:
+            counts = numpy.pad(self.counts, 2 * reach, mode='constant')
+            self.padded[reach] = (numpy.array(counts.shape), numpy.r_[0, numpy.cumsum(counts.ravel())])
+        return self.padded[reach]
+
+    def reach(self, radius):
+        # How far (in buckets) a sphere of this radius around a point can reach
+        return int(numpy.ceil(radius / self.size))
+
+    def everywhere(self, radius):
+        # True when there are fewer buckets than buckets a query would look at, every cell is a candidate then
+        # Checked before making the offsets, a big radius would need far too many of them
+        return (2 * self.reach(radius) + 1) ** 3 >= self.counts.size
+
+    def offsets(self, radius):
+        # Buckets (relative to the one of a point) that a sphere of this radius around the point can reach
+        reach = self.reach(radius)
+        span = numpy.arange(-reach, reach + 1)
+        offsets = numpy.stack(numpy.meshgrid(span, span, span, indexing='ij'), axis=-1).reshape(-1, 3)
+        gap = numpy.maximum(numpy.abs(offsets) - 1, 0) * self.size
+        return offsets[(gap ** 2).sum(axis=1) <= radius * radius]
+
+    def candidates(self, points, radius):
+        # (point index, id) of every cell in the buckets that a sphere around each point touches
+        if self.everywhere(radius):
+            point_index = numpy.repeat(numpy.arange(len(points)), len(self.order))
+            return point_index, numpy.tile(self.order, len(points))
+        offsets = self.offsets(radius)
+
+        # Points further than reach buckets from the box can't have anything near
+        reach = int(numpy.abs(offsets).max())
+        shape, starts = self.padded_starts(reach)
+        coordinates = self.coordinates(points) - self.lower + 2 * reach
+        found = numpy.flatnonzero(numpy.all((coordinates >= reach) & (coordinates < shape - reach), axis=1))
+        base = flatten(coordinates[found], shape)
+
+        point_indices = []
+        ids = []
+        for step in flatten(offsets, shape).tolist():
+            first = starts[base + step]
+            counts = starts[base + step + 1] - first
+            point_indices.append(numpy.repeat(found, counts))
+            ids.append(self.order[expand(first, counts)])
+
+        return numpy.concatenate(point_indices), numpy.concatenate(ids)
+
+    def within(self, points, radius):
+        # Every cell whose center is at most radius away from each point
+        # Gives back (point index, id, distance), ordered by point and then by distance
+        points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+        self.sort()
+        if len(points) == 0 or len(self.order) == 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=float)
+
+        # Every point has every cell as a candidate when the radius covers every bucket, so take fewer points at once
+        size = QUERY_CHUNK
+        if self.everywhere(radius):
+            size = max(1, min(QUERY_CHUNK, QUERY_CANDIDATES // len(self.order)))
+
+        point_indices = []
+        nearby = []
+        for first in range(0, len(points), size):
+            chunk = points[first:first + size]
+            point_index, ids = self.candidates(chunk, radius)
+            close = ((self.center[ids] - chunk[point_index]) ** 2).sum(axis=1) <= radius * radius
+            point_indices.append(point_index[close] + first)
+            nearby.append(ids[close])
+
+        point_index = numpy.concatenate(point_indices)
+        ids = numpy.concatenate(nearby)
+        distances = numpy.sqrt(((self.center[ids] - points[point_index]) ** 2).sum(axis=1))
+        order = numpy.lexsort((ids, distances, point_index))
+        return point_index[order], ids[order], distances[order]
+
+    def around(self, ids, radius):
+        # Same as within using the centers of some cells, a cell isn't near itself
+        # Gives back (id, nearby id, distance)
+        ids = numpy.asarray(ids, dtype=numpy.int64)
+        self.sort()
+        point_index, nearby, distances = self.within(self.center[ids], radius)
+        other = nearby != ids[point_index]
+        return ids[point_index[other]], nearby[other], distances[other]
+
+    def nearest(self, points, k, exclude=None):
+        # The k closest cells of each point, as ids (-1 when there aren't enough cells) and distances
+        # exclude can give one id per point that is skipped (e.g. the cell the point is the center of)
+        points = numpy.asarray(points, dtype=float).reshape(-1, 3)
+        nearest_ids = numpy.full((len(points), k), -1, dtype=numpy.int64)
+        nearest_distances = numpy.full((len(points), k), numpy.inf)
+        self.sort()
+        if len(points) == 0 or k == 0 or len(self.order) == 0:
+            return nearest_ids, nearest_distances
+
+        # Look further and further away until each point has k cells inside the radius
+        # Past the diagonal of the whole space there is nothing more to find
+        everything = numpy.r_[self.center[self.order], points]
+        extent = numpy.sqrt(((everything.max(axis=0) - everything.min(axis=0)) ** 2).sum())
+        pending = numpy.arange(len(points))
+        radius = self.size
+        while len(pending):
+            point_index, ids, distances = self.within(points[pending], radius)
+            if exclude is not None:
+                keep = ids != numpy.asarray(exclude)[pending[point_index]]
+                point_index, ids, distances = point_index[keep], ids[keep], distances[keep]
+
+            counts = numpy.bincount(point_index, minlength=len(pending))
+            last = radius > extent
+            done = (counts >= k) | last
+
+            # Results are ordered by point and distance, so the first k of each point are its closest
+            rank = numpy.arange(len(point_index)) - (numpy.cumsum(counts) - counts)[point_index]
+            take = done[point_index] & (rank < k)
+            nearest_ids[pending[point_index[take]], rank[take]] = ids[take]
+            nearest_distances[pending[point_index[take]], rank[take]] = distances[take]
+
+            pending = pending[~done]
+            radius *= 2
+
+        return nearest_ids, nearest_distances
@@ -14,9 +14,22 @@ import sys
 import random
 
 # --== Project imports ==--
-from Cell import CC3DKey
-from Cell import Data
+from CellTypes import CC3DKey
+import Binding
+import Chemokine
 import Config
+import Contacts
+import Data
+import Interactions
+import Lifecycle
+import Metrics
+import Recycling
+import Snapshots
+import Spatial
+import Totals
+from CellStore import STORE
+from CellStore import Event
+from Profiling import PROFILER
 
 ##########################################################
 #	MainSteppable
@@ -28,17 +41,17 @@ import Config
 ##########################################################
 class MainSteppable(SteppableBasePy):   
 
-	### Constructor of our MainSteppable
-	###	More info about constructors can be found in the Python documentation
+    ### Constructor of our MainSteppable
+    ###	More info about constructors can be found in the Python documentation
     def __init__(self, _simulator, _frequency = 1):
-		# Call our parent's constructor
+        # Call our parent's constructor
         SteppableBasePy.__init__(self, _simulator, _frequency)
-		
-		# Our code doesn't have access to the properties inside this class
-		# However we want to be able to change cell types in our code
-		# This is sort of a hack that allows that
+        
+        # Our code doesn't have access to the properties inside this class
+        # However we want to be able to change cell types in our code
+        # This is sort of a hack that allows that
         # Set-up constants to match CC3D's internal constants
-        from Cell import CC3DType
+        from CellTypes import CC3DType
         
         CC3DType.APC = self.APC
         
@@ -57,235 +70,235 @@ class MainSteppable(SteppableBasePy):
         
         from Cell import APC
         from Cell import TCell
-        from Cell import State
+        from CellTypes import State
+        
+        # Keeps the TCell-APC contacts up to date from one MCS to the next
+        self.contacts = Contacts.ContactTracker()
+        
+        # Processes that bind big batches of contacts with us, None without Config.INTERACTION_WORKERS (see Interactions.py)
+        self.pool = Interactions.create()
         
-		
-		# Set-up each cell by attaching our own interactions to each one.
-		# We use the internal cell dictionary to store information such as concentrations, etc.
+        # Set-up each cell by attaching our own interactions to each one.
+        # We use the internal cell dictionary to store information such as concentrations, etc.
         for cell in self.cellList:
-			# Get the dictionary of the cell.
-			# For more info about the cell dictionary see the CC3D documentation.
-			# It's basically map. We always use the same key [CC3DKey.DATA_KEY] to get our information.
+            # Get the dictionary of the cell.
+            # For more info about the cell dictionary see the CC3D documentation.
+            # It's basically map. We always use the same key [CC3DKey.DATA_KEY] to get our information.
             cellDict = self.getDictionaryAttribute(cell)
             
-			# Set-up inactive TREGs
+            # Set-up inactive TREGs
             if cell.type == self.TREG_INACTIVE:  
                 cellDict[CC3DKey.DATA_KEY] = TCell(cell, TCell.TREG)
 
-			# Set-up active TREGs
+            # Set-up active TREGs
             if cell.type == self.TREG_ACTIVE:  
                 cellDict[CC3DKey.DATA_KEY] = TCell(cell, TCell.TREG, state=State.ACTIVE)              
             
-			# Set-up inactive TCONVs
+            # Set-up inactive TCONVs
             elif cell.type == self.TCONV_INACTIVE:
                 cellDict[CC3DKey.DATA_KEY] = TCell(cell, TCell.TCONV)
-				
-				# Attach the recycling SBML file
+                
+                # Attach the recycling SBML file
                 #modelFile = 'Simulation/recycling.xml'
-				
-				# Set-up the initial concentrations
+                
+                # Set-up the initial concentrations
                 #initialConditions = {}
                 #initialConditions['S1'] = 100
                 #initialConditions['S2'] = 1000
                 
-				# Attach the SBML to the cell
-				# The step-size determines how many SBML steps will equal 1 MCS
-				# StepSize 1 -> 1 MCS equal to 1 SBML step
-				
+                # Attach the SBML to the cell
+                # The step-size determines how many SBML steps will equal 1 MCS
+                # StepSize 1 -> 1 MCS equal to 1 SBML step
+                
                 #self.addSBMLToCell(_modelFile=modelFile,_modelName='recycling',_cell=cell, _stepSize=1, _initialConditions=initialConditions)
             
-			# Set-up active TCONVs
+            # Set-up active TCONVs
             elif cell.type == self.TCONV_ACTIVE:
                 cellDict[CC3DKey.DATA_KEY] = TCell(cell, TCell.TCONV, state=State.ACTIVE)                  
             
-			# Set-up APCs
+            # Set-up APCs
             elif cell.type == self.APC:
                 cellDict[CC3DKey.DATA_KEY] = APC(cell)
-                
+    
+    def checkpoint(self):
+        # What we need to continue from a checkpoint (see Checkpoint.py)
+        return {'contacts': self.contacts.checkpoint()}
+    
+    def resume(self, state):
+        # Same as start but our cells already have their quantities inside the store
+        from Cell import APC
+        from Cell import TCell
+        
+        self.contacts = Contacts.ContactTracker()
+        self.contacts.resume(state['contacts'])
+        self.pool = Interactions.create()
+        
+        # Attach the information of each cell to its dictionary again
+        for cell in self.cellList:
+            kind = STORE.kind[STORE.slot(cell.id)]
+            if kind == STORE.APC:
+                self.getDictionaryAttribute(cell)[CC3DKey.DATA_KEY] = APC.attach(cell, cell.id)
+            elif kind != STORE.NONE:
+                self.getDictionaryAttribute(cell)[CC3DKey.DATA_KEY] = TCell.attach(cell, cell.id)
      
     def step(self,mcs):
-		# Run the SBML biochemical reaction network. 
+        # Run the SBML biochemical reaction network. 
         #self.timestepSBML()
         
-		for cell in self.cellList:
-			############# SBML things are commented out. They require an SBML model named recycling.xml
-			############# For more information about implementing BioNetGen and CC3D look at the samples provided by
-			############# CC3D that deal with SBMLs in order to simulate CTLA-4 recycling using a biochemical network
-			############# I'm currently fixing this part as it isn't as reliable as I wanted it to be.
+        ############# SBML things are commented out. They require an SBML model named recycling.xml
+        ############# For more information about implementing BioNetGen and CC3D look at the samples provided by
+        ############# CC3D that deal with SBMLs in order to simulate CTLA-4 recycling using a biochemical network
+        ############# I'm currently fixing this part as it isn't as reliable as I wanted it to be.
+        #for cell in self.cellList:
             #try:
-				# Get the current state of the SBML in this cell
+                # Get the current state of the SBML in this cell
                 # state = self.getSBMLState(_modelName='recycling',_cell=cell)
-				
+                
             #except RuntimeError:
                 #pass
-            
-			# APCs move faster than TCells
-			# We try to simulate that here using external potential
-            if cell.type == self.APC:
-                cell.lambdaVecX = 6
-                cell.lambdaVecY = 6
-                cell.lambdaVecZ = 6
-            else:
-                cell.lambdaVecX = 45
-                cell.lambdaVecY = 45
-                cell.lambdaVecZ = 45
-                
-            # Otherwise do our usual TCell and APC interaction if they are neighbors (that means they are next to each other)
-            for neighbor, commonSurfaceArea in self.getCellNeighborDataList(cell):                
-                if neighbor:
-                    self.interact(cell, neighbor, mcs)
-        
-    def interact(self, cell, neighbor, mcs):
-		# Get the cell dictionary
-        cellDict = self.getDictionaryAttribute(cell)
-		# Get the information from that dictionary
-        cellInfo = cellDict[CC3DKey.DATA_KEY]
-        
-		# Get the neighboring cell dictionary
-        neighborDict = self.getDictionaryAttribute(neighbor)
-		# Get the information from that dictionary
-        neighborCellInfo = neighborDict[CC3DKey.DATA_KEY]
-        
-		# Call our interaction methods depending on the types of cells that are interacting
-        if neighbor.type == self.APC:
-            cellInfo.interact_with_apc(neighborCellInfo, mcs)
-        else:
-            cellInfo.interact_with_tcell(neighborCellInfo, mcs)
+        
+        # APCs move faster than TCells, each cell gets its lambdaVec once when it appears (see Transitions.py)
+        
+        # TCell-APC contacts that are ready to bind ligands and receptors this MCS
+        # They are all bound at once after looking at every contact (see Binding.py)
+        self.pending = []
+        
+        # Otherwise do our usual TCell and APC interaction if they are neighbors (that means they are next to each other)
+        # Only TCell-APC pairs can interact so we only look at those, once per pair (see Contacts.py)
+        # Only the cells that moved since the last MCS have their neighbors looked at again
+        # Every part is timed when profiling is on (see Profiling.py)
+        with PROFILER.phase('contacts'):
+            self.contacts.update(self)
+            pairs = self.contacts.pairs()
+        
+        with PROFILER.phase('interact'):
+            for tcell_id, apc_id, commonSurfaceArea in pairs:
+                self.interact(tcell_id, apc_id, mcs)
+        PROFILER.count('interactions', len(pairs))
+        
+        if self.pending:
+            tcell_ids, apc_ids = zip(*self.pending)
+            with PROFILER.phase('binding'):
+                if Config.BINDING_MODE == 'tau_leaping':
+                    result = Binding.leap_batch(tcell_ids, apc_ids)
+                else:
+                    result = Binding.bind_batch(tcell_ids, apc_ids, pool=self.pool)
+            PROFILER.count('bindings', len(result.tcell_ids))
+            PROFILER.count('activated', len(result.activated))
+            PROFILER.count('anergic', len(result.anergic))
+        
+        # CTLA-4 recycling of every active TCell (replaces the SBML above)
+        if Config.RECYCLING_MODE == 'ode':
+            with PROFILER.phase('recycling'):
+                Recycling.recycle()
+        
+        # Cells that became anergic this MCS leave the simulation (see Lifecycle.py)
+        with PROFILER.phase('removal'):
+            Lifecycle.bury(self)
+        
+    def finish(self):
+        # Stop the processes binding with us
+        if self.pool is not None:
+            self.pool.close()
+        
+    def interact(self, tcell_id, apc_id, mcs):
+        # Get the information of both cells
+        # It's the same object we stored in the cell dictionaries, looked up by id
+        tcellInfo = STORE.views[tcell_id]
+        apcInfo = STORE.views[apc_id]
+        
+        # Call our interaction method
+        tcellInfo.interact_with_apc(apcInfo, mcs, self.pending)
 
 ##########################################################
 #	PlotSteppable
 #
 #	This steppable controls all of the plots displayed in CC3D.
 #	When the simulation finishes all plots are saved as pictures in the current working CC3D directory.
+#	The plots themselves (titles, curves and colors) are listed in Metrics.PLOTS.
+#
+#	Every value is recorded every Config.PLOT_INTERVAL MCS (Config.PLOT_INTERVALS can change that for a single value).
+#	Each curve keeps at most Config.PLOT_MAX_POINTS buckets with their minimum and maximum,
+#	so long simulations don't slow the plots down and peaks are still visible.
+#	The windows are redrawn every Config.PLOT_REFRESH MCS.
 #
 #	IMPORTANT NOTE:
 #		You must let the simulation finish to have the plots be saved.
 #		If you STOP the simulation the plots won't be saved.
 #		They will only be saved IF the simulation finishes.
+#		The values are also saved while the simulation runs in Config.METRICS_FILE,
+#		use Metrics.py to make the plots from there if the simulation was stopped.
 ##########################################################
 class PlotSteppable(SteppableBasePy):
     def __init__(self,_simulator,_frequency=1):
         SteppableBasePy.__init__(self,_simulator,_frequency)    
        
     def start(self):
-        # Ligand Losing
-        self.pW_lost_ligand = self.addNewPlotWindow(_title='Amount of Peptide-MHC, CD80, CD86 ligand lost',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Amount (AU)', _xScaleType='linear',_yScaleType='linear')
-        self.pW_lost_ligand.addPlot('Peptide-MHC',_style='Lines',_color='red',_size=2)
-        self.pW_lost_ligand.addPlot('CD80',_style='Lines',_color='green',_size=2)
-        self.pW_lost_ligand.addPlot('CD86',_style='Lines',_color='purple',_size=2)
-        
-        # Affinity / Receptor Engagement
-        self.pW_affinity = self.addNewPlotWindow(_title='External CTLA-4 and CD28 Receptor Engagement',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Number of times bound to ligand', _xScaleType='linear',_yScaleType='linear')
-        self.pW_affinity.addPlot('CD28',_style='Lines',_color='blue',_size=2)
-        self.pW_affinity.addPlot('External CTLA-4',_style='Lines',_color='red',_size=2)  
-        
-        # APC Downregulation / Ligands
-        self.pW_apc_amount = self.addNewPlotWindow(_title='Peptide-MHC, CD80, and CD86 Downregulation',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Amount (AU)', _xScaleType='linear',_yScaleType='linear')
-        self.pW_apc_amount.addPlot('Peptide-MHC',_style='Lines',_color='red',_size=2)        
-        self.pW_apc_amount.addPlot('CD80',_style='Lines',_color='green',_size=2)
-        self.pW_apc_amount.addPlot('CD86',_style='Lines',_color='purple',_size=2)   
-
-        # T-Cell Downregulation / Receptors
-        self.pW_tcell_amount = self.addNewPlotWindow(_title='CD28, External CTLA-4, and Internal CTLA-4 Downregulation',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Amount (AU)', _xScaleType='linear',_yScaleType='linear')
-        self.pW_tcell_amount.addPlot('CD28',_style='Lines',_color='blue',_size=2)
-        self.pW_tcell_amount.addPlot('Internal CTLA-4',_style='Lines',_color='red',_size=2)   
-        self.pW_tcell_amount.addPlot('External CTLA-4',_style='Lines',_color='green',_size=2) 
-
-        # Total Cell Counts
-        self.pW_cell_count = self.addNewPlotWindow(_title='Total Cell Counts',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Number of Cells', _xScaleType='linear',_yScaleType='linear')
-        self.pW_cell_count.addPlot('APC',_style='Lines',_color='green',_size=2)
-        self.pW_cell_count.addPlot('T-Cells',_style='Lines',_color='purple',_size=2)
-
-        # TREG Cell Counts
-        self.pW_treg_count = self.addNewPlotWindow(_title='TREG Cells Count',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Number of Cells', _xScaleType='linear',_yScaleType='linear')
-        self.pW_treg_count.addPlot('Inactive',_style='Lines',_color='green',_size=2)
-        self.pW_treg_count.addPlot('Active',_style='Lines',_color='yellow',_size=2)   
-        self.pW_treg_count.addPlot('Anergic',_style='Lines',_color='brown',_size=2)
-
-        # TCONV Cell Counts
-        self.pW_tconv_count = self.addNewPlotWindow(_title='TCONV Cells Count',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Number of Cells', _xScaleType='linear',_yScaleType='linear')
-        self.pW_tconv_count.addPlot('Inactive',_style='Lines',_color='magenta',_size=2)
-        self.pW_tconv_count.addPlot('Active',_style='Lines',_color='darkblue',_size=2)   
-        self.pW_tconv_count.addPlot('Anergic',_style='Lines',_color='cyan',_size=2)
-
-        # Stochastic Occurences
-        self.pW_stochastic = self.addNewPlotWindow(_title='Stochastic Processes',_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle='Number of Occurences', _xScaleType='linear',_yScaleType='linear')
-        self.pW_stochastic.addPlot('Apoptosis',_style='Lines',_color='magenta',_size=2)
-        self.pW_stochastic.addPlot('Division',_style='Lines',_color='darkblue',_size=2)   
-        self.pW_stochastic.addPlot('Quiescence',_style='Lines',_color='cyan',_size=2)
-                       
-    def step(self, mcs):
-        # Ligand Losing
-        self.pW_lost_ligand.addDataPoint('Peptide-MHC', mcs, Data.TOTAL_LOST_PEPTIDEMHC)        
-        self.pW_lost_ligand.addDataPoint('CD80', mcs, Data.TOTAL_LOST_CD80)
-        self.pW_lost_ligand.addDataPoint('CD86', mcs, Data.TOTAL_LOST_CD86)
-        
-        # Affinity / Receptor Engagement
-        self.pW_affinity.addDataPoint('CD28', mcs, Data.TOTAL_ENGAGED_CD28)
-        self.pW_affinity.addDataPoint('External CTLA-4', mcs, Data.TOTAL_ENGAGED_EXTERNAL_CTLA4)
-        
-        # APC Downregulation / Ligands
-        self.pW_apc_amount.addDataPoint('Peptide-MHC', mcs, Data.TOTAL_AMOUNT_PEPTIDEMHC)
-        self.pW_apc_amount.addDataPoint('CD80', mcs, Data.TOTAL_AMOUNT_CD80)
-        self.pW_apc_amount.addDataPoint('CD86', mcs, Data.TOTAL_AMOUNT_CD86)
-        
-        # T-Cell Downregulation / Receptors
-        self.pW_tcell_amount.addDataPoint('TCR', mcs, Data.TOTAL_AMOUNT_TCR)
-        self.pW_tcell_amount.addDataPoint('CD28', mcs, Data.TOTAL_AMOUNT_CD28)
-        self.pW_tcell_amount.addDataPoint('External CTLA-4', mcs, Data.TOTAL_AMOUNT_EXTERNAL_CTLA4)
-        self.pW_tcell_amount.addDataPoint('Internal CTLA-4', mcs, Data.TOTAL_AMOUNT_INTERNAL_CTLA4) 
-        
-        # Total Cell Counts
-        self.pW_cell_count.addDataPoint('APC', mcs, Data.TOTAL_APC)
-        self.pW_cell_count.addDataPoint('T-Cells', mcs, Data.TOTAL_TCELLS)
-        
-        # TREG Cell Counts
-        self.pW_treg_count.addDataPoint('Inactive', mcs, Data.TOTAL_TREG_INACTIVE)
-        self.pW_treg_count.addDataPoint('Active', mcs, Data.TOTAL_TREG_ACTIVE)
-        self.pW_treg_count.addDataPoint('Anergic', mcs, Data.TOTAL_TREG_ANERGIC)
-        
-        # TCONV Cell Counts
-        self.pW_tconv_count.addDataPoint('Inactive', mcs, Data.TOTAL_TCONV_INACTIVE)
-        self.pW_tconv_count.addDataPoint('Active', mcs, Data.TOTAL_TCONV_ACTIVE)
-        self.pW_tconv_count.addDataPoint('Anergic', mcs, Data.TOTAL_TCONV_ANERGIC)
-        
-        # Stochastic Occurences
-        self.pW_stochastic.addDataPoint('Apoptosis', mcs, Data.TOTAL_STOCHASTIC_APOPTOSIS)
-        self.pW_stochastic.addDataPoint('Division', mcs, Data.TOTAL_STOCHASTIC_DIVISION)
-        self.pW_stochastic.addDataPoint('Quiescence', mcs, Data.TOTAL_STOCHASTIC_QUIESCENCE)
-            
-    def finish(self):
-        # Ligand Losing
-        self.pW_lost_ligand.savePlotAsData('lost_ligands.dat') 
-        self.pW_lost_ligand.savePlotAsPNG('lost_ligands.png', 1000, 1000)
-        
-        # Affinity / Receptor Engagement
-        self.pW_affinity.savePlotAsData('affinities.dat') 
-        self.pW_affinity.savePlotAsPNG('affinities.png',1000,1000)
+        # Saves every row of values as we go (see Metrics.py)
+        self.open(Metrics.MetricWriter(Metrics.output_path(self, Config.METRICS_FILE)))
+    
+    def checkpoint(self):
+        # Everything written so far has to be on disk for the checkpoint to be valid
+        self.metrics.flush()
+        curves = dict((name, curve.checkpoint()) for name, curve in self.curves.items())
+        return {'rows': self.metrics.rows, 'curves': curves}
+    
+    def resume(self, state):
+        # Keep the rows saved before the checkpoint and continue after them
+        self.open(Metrics.MetricWriter(Metrics.output_path(self, Config.METRICS_FILE), rows=state['rows']))
+        for name, curve in state['curves'].items():
+            self.curves[name].resume(curve)
+        self.redraw()
+    
+    def open(self, metrics):
+        self.metrics = metrics
         
-        # APC Downregulation / Ligands
-        self.pW_apc_amount.savePlotAsData('apc_ligands.dat') 
-        self.pW_apc_amount.savePlotAsPNG('apc_ligands.png',1000,1000)
+        # File name -> plot window
+        self.windows = {}
+        # Data variable -> points of its curve
+        self.curves = {}
         
-        # T-Cell Downregulation / Receptors
-        self.pW_tcell_amount.savePlotAsData('tcell_receptors.dat') 
-        self.pW_tcell_amount.savePlotAsPNG('tcell_receptors.png',1000,1000)
+        for file_name, title, y_title, curves in Metrics.PLOTS:
+            window = self.addNewPlotWindow(_title=title,_xAxisTitle='MonteCarlo Step (MCS)',_yAxisTitle=y_title, _xScaleType='linear',_yScaleType='linear')
+            for label, name, color in curves:
+                window.addPlot(label,_style='Lines',_color=color,_size=2)
+                self.curves[name] = Metrics.Downsampler(Config.PLOT_MAX_POINTS)
+            self.windows[file_name] = window
+                       
+    def step(self, mcs):
+        # Compute everything inside Data from the cells (see Totals.py)
+        Totals.update_data()
         
-        # Total Cell Counts
-        self.pW_cell_count.savePlotAsData('cell_counts.dat') 
-        self.pW_cell_count.savePlotAsPNG('cell_counts.png',1000,1000)
+        # Record the values that are due this MCS
+        for name, curve in self.curves.items():
+            if mcs % Config.PLOT_INTERVALS.get(name, Config.PLOT_INTERVAL) == 0:
+                curve.add(mcs, getattr(Data, name))
         
-        # TREG Cell Counts
-        self.pW_treg_count.savePlotAsData('treg_cells.dat') 
-        self.pW_treg_count.savePlotAsPNG('treg_cells.png',1000,1000)
+        if mcs % Config.PLOT_REFRESH == 0:
+            self.redraw()
         
-        # TCONV Cell Counts
-        self.pW_tconv_count.savePlotAsData('tconv_cells.dat') 
-        self.pW_tconv_count.savePlotAsPNG('tconv_cells.png',1000,1000)
+        # Save this MCS
+        self.metrics.append(Metrics.current_row(mcs))
+    
+    def redraw(self):
+        # Replace the points of every window with the downsampled ones
+        for file_name, title, y_title, curves in Metrics.PLOTS:
+            window = self.windows[file_name]
+            window.eraseAllData()
+            for label, name, color in curves:
+                xs, ys = self.curves[name].points()
+                for x, y in zip(xs, ys):
+                    window.addDataPoint(label, x, y)
+            
+    def finish(self):
+        # Write whatever is left of our values
+        self.metrics.close()
         
-        # Stochastic Occurences
-        self.pW_stochastic.savePlotAsData('stochastic.dat')
-        self.pW_stochastic.savePlotAsPNG('stochastic.png',1000,1000)
+        # Save every plot as data and as a picture
+        self.redraw()
+        for file_name, title, y_title, curves in Metrics.PLOTS:
+            self.windows[file_name].savePlotAsData(file_name + '.dat')
+            self.windows[file_name].savePlotAsPNG(file_name + '.png', 1000, 1000)
 
 ##########################################################
 #	VolumeSteppable
@@ -300,14 +313,18 @@ class VolumeSteppable(SteppableBasePy):
         
     def start(self):
         for cell in self.cellList:
-			# Set our initial age
+            # Set our initial age
             cell.targetVolume = Config.INITIAL_AGE
             cell.lambdaVolume = 1.0
+    
+    def resume(self, state):
+        # The ages are saved with the cells (see Checkpoint.py)
+        pass
             
     def step(self, mcs):
-        for cell in self.cellList:
-			# Increase our age by the age inside the configuration
-            cell.targetVolume += Config.STEP_AGE
+        # Increase the age of every living cell by the age inside the configuration
+        # All at once when the simulator allows it (see Lifecycle.py)
+        Lifecycle.age(self, Config.STEP_AGE)
             
     def finish(self):
         pass            
@@ -324,52 +341,102 @@ class MitosisSteppable(MitosisSteppableBase):
     def __init__(self, _simulator, _frequency=1):
         MitosisSteppableBase.__init__(self, _simulator, _frequency)
         
-    def step(self, mcs):     
-        for cell in self.cellList:
-			# Check if the cell has passed our age threshold
-            if cell.volume > Config.DECISION_AGE:
-				# These are the possible actions the cell might undergo.
-                actions_available = ['Apoptosis', 'Division', 'Quiescence']
-				# Each action has a corresponding weight or possibility associated with it.
-                weights = [Config.PROB_APOPTOSIS, Config.PROB_DIVISION, Config.PROB_QUIESCENCE]
-                
-				# The numpy library contains a function called choice
-				# It allows us to select a choice randomly with a given amount of weights
-                from numpy.random import choice
-                action = choice(actions_available, p=weights)
-                #print 'Stochastically chose ' + str(action) + ' in a cell of type ' + str(cell.type)
-                
-				# Apoptosis (Cell Death)
-                if action == 'Apoptosis':
-					# Kill the cell inside CC3D by setting its volume to 0
-					# Maybe there's a better way to delete cells.
-					# I used one of the CC3D samples for this.
-                    cell.targetVolume = 0
-					
-					# Update our plots
-                    Data.TOTAL_STOCHASTIC_APOPTOSIS += 1
-                    
-					# Decrease the counts depending on what kind of cell it is
-                    Data.TOTAL_APC -= 1 if cell.type == self.APC else 0
-                    Data.TOTAL_TCELLS -= 1 if cell.type != self.APC else 0
-                    
-                    Data.TOTAL_TREG_INACTIVE -= 1 if cell.type == self.TREG_INACTIVE else 0
-                    Data.TOTAL_TREG_ACTIVE -= 1 if cell.type == self.TREG_ACTIVE else 0
-                    Data.TOTAL_TREG_ANERGIC -= 1 if cell.type == self.TREG_ANERGIC else 0
-                    
-                    Data.TOTAL_TCONV_INACTIVE -= 1 if cell.type == self.TCONV_INACTIVE else 0
-                    Data.TOTAL_TCONV_ACTIVE -= 1 if cell.type == self.TCONV_ACTIVE else 0
-                    Data.TOTAL_TCONV_ANERGIC -= 1 if cell.type == self.TCONV_ANERGIC else 0
-                    
-				# Division
-				# Not actually implemented
-				# Here you would do mitosis as stated in the CC3D mitosis samples
-				# We record how many times cells would have divided in a plot
-                elif action == 'Division':
-                    Data.TOTAL_STOCHASTIC_DIVISION += 1
-				
-				# Quiescence
-				# We don't do anything
-				# All we do is increase the count for the plot
-                else:
-                    Data.TOTAL_STOCHASTIC_QUIESCENCE += 1
\ No newline at end of file
+    def step(self, mcs):
+        # Every cell that passed our age threshold chooses between apoptosis, division and quiescence
+        # Each action has a corresponding weight or possibility associated with it (see Config)
+        # All the choices are made at once, the cells that chose apoptosis are removed
+        # and then the cells that chose division divide (see Lifecycle.py)
+        Lifecycle.decide(self)
+    
+    def updateAttributes(self):
+        # Split the age between the mother and the daughter, the daughter is of the same type
+        self.parentCell.targetVolume /= 2.0
+        self.childCell.targetVolume = self.parentCell.targetVolume
+        self.childCell.lambdaVolume = self.parentCell.lambdaVolume
+        self.childCell.type = self.parentCell.type
+        
+        # The daughter also gets the information of its mother
+        Lifecycle.inherit(self, self.parentCell, self.childCell)
+
+##########################################################
+#	ChemokineSteppable
+#
+#	Only used with Config.CHEMOKINE_MODE = 'steady'.
+#	Keeps the TATTRACT field at the steady state of the APCs secreting it instead of
+#	letting DiffusionSolverFE integrate it every MCS (see Chemokine.py).
+#	It is solved again every Config.CHEMOKINE_INTERVAL MCS or when the APCs moved enough.
+##########################################################
+class ChemokineSteppable(SteppableBasePy):
+    def __init__(self, _simulator, _frequency=1):
+        SteppableBasePy.__init__(self, _simulator, _frequency)
+    
+    def start(self):
+        # Diffusion and secretion of TATTRACT come from Model.xml
+        import Headless
+        
+        # Where the APCs are (see Spatial.py)
+        self.apcs = Spatial.SpatialHash(kinds=(STORE.APC,))
+        self.field = Chemokine.QuasiSteadyField(Headless.read_model())
+        
+        # The TCells follow it from the first MCS
+        self.step(0)
+    
+    def checkpoint(self):
+        return self.field.checkpoint()
+    
+    def resume(self, state):
+        import Headless
+        
+        self.apcs = Spatial.SpatialHash(kinds=(STORE.APC,))
+        self.field = Chemokine.QuasiSteadyField(Headless.read_model())
+        self.field.resume(state)
+        if self.field.field is not None:
+            Chemokine.apply(self, self.field)
+    
+    def step(self, mcs):
+        self.apcs.update(self)
+        ids = self.apcs.members
+        if self.field.update(mcs, ids, self.apcs.center[ids]):
+            Chemokine.apply(self, self.field)
+    
+    def finish(self):
+        pass
+
+##########################################################
+#	SnapshotSteppable
+#
+#	Only used when Config.SNAPSHOT_INTERVAL is more than 0, it runs every that many MCS.
+#	Saves the cell field and every cell in Config.SNAPSHOT_FILE (see Snapshots.py)
+#	so the run can be looked at afterwards without the CC3D Player.
+##########################################################
+class SnapshotSteppable(SteppableBasePy):
+    def __init__(self,_simulator,_frequency=1):
+        SteppableBasePy.__init__(self,_simulator,_frequency)
+    
+    def start(self):
+        self.snapshots = None
+        self.frames = 0
+    
+    def checkpoint(self):
+        # Every frame saved so far has to be on disk for the checkpoint to be valid
+        if self.snapshots is not None:
+            self.snapshots.flush()
+            self.frames = self.snapshots.frames
+        return {'frames': self.frames}
+    
+    def resume(self, state):
+        # Keep the frames saved before the checkpoint and continue after them
+        self.snapshots = None
+        self.frames = state['frames']
+    
+    def step(self, mcs):
+        field, width, ids, centers, types, kinds, states = Snapshots.capture(self)
+        # The size of the field is only known once we see it
+        if self.snapshots is None:
+            path = Metrics.output_path(self, Config.SNAPSHOT_FILE)
+            self.snapshots = Snapshots.SnapshotWriter(path, field.shape, width, frames=self.frames)
+        self.snapshots.append(mcs, field, ids, centers, types, kinds, states)
+    
+    def finish(self):
+        if self.snapshots is not None:
+            self.snapshots.close()
@@ -0,0 +1,199 @@
+##########################################################
+#	File: Sweep.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Runs the model (see Headless.py) for many values of the parameters inside Config.py.
+#	Every point of the sweep runs in its own process, so each one has its own Config and CellStore,
+#	and as many points run at the same time as there are cores.
+#
+#	The sweep is described by a JSON file, either a grid (every combination of the values):
+#		{"steps": 500, "seed": 1, "grid": {"CD28_THRESHOLD": [1, 2, 3], "WAIT_TIME": [5, 10]}}
+#	or a Latin hypercube (samples points spread evenly inside each range):
+#		{"steps": 500, "seed": 1, "samples": 20, "latin_hypercube": {"PROB_CTLA4_BIND_CD80": [0.5, 1.0]}}
+#	Items of lists can be changed too, e.g. "NAME[0]". WEIGHTS_CD80 and WEIGHTS_CD86 are made from the
+#	PROB_*_BIND_* parameters, sweep those instead: the weights are made again from them and divided by their sum
+#	so they still add up to 1 (changing one item of the weights alone would change the other one too, silently).
+#	Every point uses the same seed so differences come from the parameters only.
+#
+#	Usage (from this folder):
+#		python Sweep.py <sweep file> [output folder] [processes]
+#
+#	The output folder has one folder per point (its metrics), sweep.json (the points) and Config.SWEEP_FILE,
+#	a table with one row per point: its index, seed, speed, parameters and the final values of Data.
+#	It uses the same format as the metrics (see Metrics.py), read it with Sweep.results.
+#
+##########################################################
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import sys
+
+import numpy
+
+import Config
+import Data
+import Metrics
+
+# NAME or NAME[index]
+PARAMETER = re.compile(r'^([A-Z_0-9]+)(?:\[(\d+)\])?$')
+
+# Config values computed from others, recomputed when one of those is swept
+DERIVED = {
+    'WEIGHTS_CD80': ('PROB_CTLA4_BIND_CD80', 'PROB_CD28_BIND_CD80'),
+    'WEIGHTS_CD86': ('PROB_CTLA4_BIND_CD86', 'PROB_CD28_BIND_CD86'),
+}
+
+# Columns of the result table before the parameters and after them
+INDEX_COLUMNS = ['POINT', 'SEED', 'MCS_PER_SEC']
+DATA_COLUMNS = Metrics.COLUMNS[1:]
+
+def get_parameter(name):
+    match = PARAMETER.match(name)
+    if match is None or not hasattr(Config, match.group(1)):
+        raise ValueError('Unknown Config parameter ' + name)
+
+    value = getattr(Config, match.group(1))
+    if match.group(2) is not None:
+        value = value[int(match.group(2))]
+    return value
+
+def parameter_value(name, value):
+    # The value with the same type as in Config (so integers stay integers)
+    match = PARAMETER.match(name)
+    if match is not None and match.group(1) in DERIVED:
+        raise ValueError(match.group(1) + ' is made from ' + ', '.join(DERIVED[match.group(1)]) + ', sweep those instead')
+    if isinstance(get_parameter(name), int):
+        return int(round(value))
+    return float(value)
+
+def set_parameter(name, value):
+    match = PARAMETER.match(name)
+    value = parameter_value(name, value)
+
+    if match.group(2) is None:
+        setattr(Config, name, value)
+    else:
+        values = list(getattr(Config, match.group(1)))
+        values[int(match.group(2))] = value
+        setattr(Config, match.group(1), values)
+
+def apply_parameters(parameters):
+    for name, value in parameters.items():
+        set_parameter(name, value)
+
+    for derived, sources in DERIVED.items():
+        if any(source in parameters for source in sources):
+            values = [getattr(Config, source) for source in sources]
+            setattr(Config, derived, [value / float(sum(values)) for value in values])
+
+def grid_points(grid):
+    # Every combination of the values, the last parameter changes fastest
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[name] for name in names])]
+
+def latin_hypercube_points(ranges, samples, seed=None):
+    # Each range is cut in samples slices and every slice is used exactly once per parameter
+    rng = numpy.random.RandomState(seed)
+    names = sorted(ranges)
+    columns = []
+    for name in names:
+        low, high = ranges[name]
+        slices = (rng.permutation(samples) + rng.random_sample(samples)) / float(samples)
+        columns.append(low + slices * (high - low))
+
+    return [dict((name, column[index].item()) for name, column in zip(names, columns)) for index in range(samples)]
+
+def sweep_points(spec):
+    if 'grid' in spec:
+        points = grid_points(spec['grid'])
+    elif 'latin_hypercube' in spec:
+        points = latin_hypercube_points(spec['latin_hypercube'], int(spec['samples']), spec.get('seed'))
+    else:
+        raise ValueError('A sweep needs a "grid" or a "latin_hypercube"')
+
+    # Check the names before starting any process and use the values the points will really have
+    return [dict((name, parameter_value(name, value)) for name, value in point.items()) for point in points]
+
+def describe_seed(seed):
+    # Plain seeds are saved as they are, spawned ones (see Ensemble.replicate_seeds) as what makes them
+    if seed is None or isinstance(seed, int):
+        return seed
+    if hasattr(seed, 'spawn_key'):
+        return {'entropy': int(seed.entropy), 'spawn_key': [int(key) for key in seed.spawn_key]}
+    return int(seed)
+
+def run_point(task):
+    # Runs inside a worker process, so changing Config here doesn't affect the other points
+    # Also used for the replicates of Ensemble.py
+    index, parameters, steps, seed, point_dir = task
+    import Headless
+    import Totals
+
+    apply_parameters(parameters)
+
+    if not os.path.isdir(point_dir):
+        os.makedirs(point_dir)
+    # How this run was made, so Analysis.py can tell the runs apart
+    with open(os.path.join(point_dir, 'run.json'), 'w') as run_file:
+        json.dump({'parameters': parameters, 'seed': describe_seed(seed), 'steps': steps}, run_file, indent=1)
+
+    sim = Headless.HeadlessSimulator(steps=steps, seed=seed, output_dir=point_dir, checkpoint_interval=0)
+    Headless.register_steppables(sim)
+    speed = sim.run()
+
+    Totals.update_data()
+    return index, speed, [getattr(Data, name) for name in DATA_COLUMNS]
+
+def run_pool(tasks, processes=None):
+    # Gives back the result of every task as they finish (not in order)
+    # A new process for every task so nothing is left over from the previous one
+    pool = multiprocessing.Pool(processes or multiprocessing.cpu_count(), maxtasksperchild=1)
+    try:
+        for result in pool.imap_unordered(run_point, tasks):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+def run_sweep(spec, output_dir='.', processes=None):
+    points = sweep_points(spec)
+    names = sorted(points[0]) if points else []
+    steps = spec.get('steps')
+    seed = spec.get('seed')
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with open(os.path.join(output_dir, 'sweep.json'), 'w') as spec_file:
+        json.dump({'spec': spec, 'points': points}, spec_file, indent=1)
+
+    table = Metrics.MetricWriter(os.path.join(output_dir, Config.SWEEP_FILE), INDEX_COLUMNS + names + DATA_COLUMNS, chunk_rows=1)
+    tasks = [(index, point, steps, seed, os.path.join(output_dir, 'point_' + str(index))) for index, point in enumerate(points)]
+
+    try:
+        # Rows are written as points finish, the POINT column tells them apart
+        for index, speed, values in run_pool(tasks, processes):
+            table.append([index, -1 if seed is None else seed, speed] + [points[index][name] for name in names] + values)
+    finally:
+        table.close()
+
+    return len(points)
+
+def results(path):
+    # Column name -> values of every point, in order of point
+    reader = Metrics.MetricReader(path)
+    order = numpy.argsort(reader.column('POINT'), kind='mergesort')
+    return dict((name, numpy.asarray(reader.column(name))[order]) for name in reader.columns)
+
+if __name__ == '__main__':
+    with open(sys.argv[1]) as sweep_file:
+        spec = json.load(sweep_file)
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'sweep'
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    print(str(run_sweep(spec, output_dir, processes)) + ' points saved in ' + os.path.join(output_dir, Config.SWEEP_FILE))
@@ -0,0 +1,72 @@
+##########################################################
+#	File: Totals.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Computes every variable inside Data.py from the cells themselves.
+#	Our cells don't update Data while they interact, instead we add up the CellStore arrays
+#	once per MCS (or however often the plots are updated), so the totals are always exact.
+#
+##########################################################
+import numpy
+
+import Data
+from CellStore import STORE
+from CellStore import Event
+from CellTypes import State
+
+def update_data(store=STORE):
+    # Only the slots that were used can have cells
+    used = slice(0, store.used)
+    kind = store.kind[used]
+    state = store.state[used]
+    alive = store.alive[used]
+
+    apcs = alive & (kind == store.APC)
+    tregs = alive & (kind == store.TREG)
+    tconvs = alive & (kind == store.TCONV)
+    tcells = tregs | tconvs
+
+    # Cells waiting for co-activation are still inactive in the plots
+    inactive = (state == State.INACTIVE) | (state == State.AWAITING_COACTIVATION)
+    active = state == State.ACTIVE
+
+    # Ligand Losing
+    Data.TOTAL_LOST_PEPTIDEMHC = int(store.events[Event.LOST_PEPTIDEMHC])
+    Data.TOTAL_LOST_CD80 = int(store.events[Event.LOST_CD80])
+    Data.TOTAL_LOST_CD86 = int(store.events[Event.LOST_CD86])
+
+    # Affinity / Receptor Engagement
+    Data.TOTAL_ENGAGED_CD28 = int(store.events[Event.ENGAGED_CD28])
+    Data.TOTAL_ENGAGED_EXTERNAL_CTLA4 = int(store.events[Event.ENGAGED_EXTERNAL_CTLA4])
+
+    # APC Downregulation / Ligands
+    Data.TOTAL_AMOUNT_PEPTIDEMHC = int(store.total_PEPTIDEMHC[used][apcs].sum())
+    Data.TOTAL_AMOUNT_CD80 = int(store.total_CD80[used][apcs].sum())
+    Data.TOTAL_AMOUNT_CD86 = int(store.total_CD86[used][apcs].sum())
+
+    # T-Cell Downregulation / Receptors
+    Data.TOTAL_AMOUNT_TCR = int(store.total_TCR[used][tcells].sum())
+    Data.TOTAL_AMOUNT_CD28 = int(store.total_CD28[used][tcells].sum())
+    Data.TOTAL_AMOUNT_EXTERNAL_CTLA4 = int(store.total_external_CTLA4[used][tcells].sum())
+    Data.TOTAL_AMOUNT_INTERNAL_CTLA4 = int(store.total_internal_CTLA4[used][tcells].sum())
+
+    # Total Cell Counts
+    Data.TOTAL_APC = int(numpy.count_nonzero(apcs))
+    Data.TOTAL_TCELLS = int(numpy.count_nonzero(tcells))
+
+    # TREG Cell Counts
+    Data.TOTAL_TREG_INACTIVE = int(numpy.count_nonzero(tregs & inactive))
+    Data.TOTAL_TREG_ACTIVE = int(numpy.count_nonzero(tregs & active))
+    # Anergic cells are dead but we keep counting them (counted once when they died)
+    Data.TOTAL_TREG_ANERGIC = int(store.events[Event.ANERGIC_TREG])
+
+    # TCONV Cell Counts
+    Data.TOTAL_TCONV_INACTIVE = int(numpy.count_nonzero(tconvs & inactive))
+    Data.TOTAL_TCONV_ACTIVE = int(numpy.count_nonzero(tconvs & active))
+    Data.TOTAL_TCONV_ANERGIC = int(store.events[Event.ANERGIC_TCONV])
+
+    # Stochastic Occurences
+    Data.TOTAL_STOCHASTIC_APOPTOSIS = int(store.events[Event.STOCHASTIC_APOPTOSIS])
+    Data.TOTAL_STOCHASTIC_DIVISION = int(store.events[Event.STOCHASTIC_DIVISION])
+    Data.TOTAL_STOCHASTIC_QUIESCENCE = int(store.events[Event.STOCHASTIC_QUIESCENCE])
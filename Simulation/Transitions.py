@@ -0,0 +1,139 @@
+##########################################################
+#	File: Transitions.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Everything that has to happen when a cell appears or a TCell changes State happens here.
+#	A TCell goes through these States:
+#		INACTIVE -> AWAITING_COACTIVATION -> ACTIVE
+#		                                  -> ANERGIC
+#	Cell.py and Binding.py only ask for the change, the hooks registered for the State
+#	being entered then run once for that cell (not every MCS):
+#		The CC3D type (which is also what decides chemotaxis, see Model.xml)
+#		The CTLA-4 a TCONV gets when it becomes active
+#		Counting and killing anergic cells
+#	When a cell appears (created or born) its motility (lambdaVec of the ExternalPotential) is set once,
+#	it only depends on the kind of cell.
+#
+#	Add your own with on(state, hook) or on_enter(hook).
+#
+##########################################################
+import Config
+from CellStore import STORE
+from CellStore import CellStore
+from CellStore import Event
+from CellTypes import CC3DType
+from CellTypes import State
+
+# The changes a TCell can go through
+ALLOWED = {
+    State.INACTIVE: (State.AWAITING_COACTIVATION,),
+    State.AWAITING_COACTIVATION: (State.ACTIVE, State.ANERGIC),
+    State.ACTIVE: (),
+    State.ANERGIC: (),
+}
+
+# State entered -> functions called as hook(view, old state)
+HOOKS = dict((state, []) for state in ALLOWED)
+
+# Functions called as hook(view) when a cell appears
+ENTER_HOOKS = []
+
+# CC3D type of every kind of TCell in every State (waiting for co-activation still looks inactive)
+TYPES = {
+    (CellStore.TREG, State.INACTIVE): 'TREG_INACTIVE',
+    (CellStore.TREG, State.AWAITING_COACTIVATION): 'TREG_INACTIVE',
+    (CellStore.TREG, State.ACTIVE): 'TREG_ACTIVE',
+    (CellStore.TREG, State.ANERGIC): 'TREG_ANERGIC',
+    (CellStore.TCONV, State.INACTIVE): 'TCONV_INACTIVE',
+    (CellStore.TCONV, State.AWAITING_COACTIVATION): 'TCONV_INACTIVE',
+    (CellStore.TCONV, State.ACTIVE): 'TCONV_ACTIVE',
+    (CellStore.TCONV, State.ANERGIC): 'TCONV_ANERGIC',
+}
+
+def on(state, hook):
+    HOOKS[state].append(hook)
+
+def on_enter(hook):
+    ENTER_HOOKS.append(hook)
+
+def check(old, state):
+    if state not in ALLOWED[old]:
+        raise ValueError('A TCell can not go from State ' + str(old) + ' to State ' + str(state))
+
+def change(view, state):
+    # Move a TCell to a new State and run its hooks
+    old = view.state
+    if old == state:
+        return
+    check(old, state)
+
+    view.state = state
+    for hook in HOOKS[state]:
+        hook(view, old)
+
+def change_many(slots, state, store=STORE):
+    # Same as change for many TCells at once (slots of the store)
+    # The State is written with numpy, the hooks (if any) still run one cell at a time
+    slots = slots[store.state[slots] != state]
+    old = store.state[slots]
+    for old_state in set(old.tolist()):
+        check(old_state, state)
+
+    store.state[slots] = state
+    if HOOKS[state]:
+        for slot, old_state in zip(slots.tolist(), old.tolist()):
+            view = store.views[int(store.id[slot])]
+            for hook in HOOKS[state]:
+                hook(view, old_state)
+
+def enter(view):
+    # A cell appeared (created in MainSteppable.start or born from a division)
+    for hook in ENTER_HOOKS:
+        hook(view)
+
+##########################################################
+#	Hooks
+##########################################################
+def set_type(view, old):
+    # What CC3D shows (and what the Chemotaxis plugin looks at)
+    cell_type = getattr(CC3DType, TYPES[(view.type, view.state)])
+    if view.cc3d_cell.type != cell_type:
+        view.cc3d_cell.type = cell_type
+
+def set_motility(view):
+    # APCs move faster than TCells
+    # We try to simulate that here using external potential
+    if view.store.kind[view.slot] == CellStore.APC:
+        motility = Config.APC_MOTILITY
+    else:
+        motility = Config.TCELL_MOTILITY
+
+    cell = view.cc3d_cell
+    cell.lambdaVecX = motility
+    cell.lambdaVecY = motility
+    cell.lambdaVecZ = motility
+
+def add_ctla4(view, old):
+    # Add CTLA-4 to TCONV once it becomes active
+    if view.type == CellStore.TCONV:
+        view.total_external_CTLA4 += 1
+        view.total_internal_CTLA4 += 1
+
+def count_anergic(view, old):
+    # Count it for the plots, it won't be in the store anymore once it's removed
+    view.store.events[Event.ANERGIC_TREG if view.type == CellStore.TREG else Event.ANERGIC_TCONV] += 1
+
+def kill(view, old):
+    # The cell is removed at the end of the MCS (see Lifecycle.bury)
+    view.store.kill(view.id)
+
+on_enter(set_motility)
+
+# Waiting for co-activation looks and moves like inactive, so nothing has to happen then
+for state in (State.ACTIVE, State.ANERGIC):
+    on(state, set_type)
+
+on(State.ACTIVE, add_ctla4)
+on(State.ANERGIC, count_anergic)
+on(State.ANERGIC, kill)
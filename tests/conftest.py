@@ -0,0 +1,15 @@
+##########################################################
+#	File: conftest.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	The modules of the model import each other by name from inside Simulation,
+#	so the tests import them the same way. Run from the top folder with: python -m pytest tests
+#
+##########################################################
+import os
+import sys
+
+SIMULATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Simulation')
+if SIMULATION not in sys.path:
+    sys.path.insert(0, SIMULATION)
@@ -0,0 +1,55 @@
+##########################################################
+#	File: test_checkpoint.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	A run resumed from a checkpoint must end exactly where the same run without stopping ends:
+#	same CellStore, same dice left (see Dice.py) and same metrics.
+#
+##########################################################
+import os
+
+import numpy
+
+import Config
+import Headless
+import Metrics
+from CellStore import STORE
+from Dice import DICE
+
+STEPS = 300
+CHECKPOINT_AT = 200
+
+def run(output_dir, steps, seed, checkpoint_interval=0, resume_file=None):
+    sim = Headless.HeadlessSimulator(steps=steps, seed=seed, output_dir=output_dir,
+                                     checkpoint_interval=checkpoint_interval, resume_file=resume_file)
+    Headless.register_steppables(sim)
+    sim.run()
+
+    store = STORE.checkpoint()
+    metrics = Metrics.MetricReader(os.path.join(output_dir, Config.METRICS_FILE))
+    columns = dict((name, numpy.array(metrics.column(name))) for name in Metrics.COLUMNS)
+    return store, DICE.get_state(), columns
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    whole = str(tmp_path / 'whole')
+    parts = str(tmp_path / 'parts')
+    os.makedirs(whole)
+    os.makedirs(parts)
+
+    store, dice, metrics = run(whole, STEPS, 3)
+
+    # Stop a while after the checkpoint, then continue from it with another seed (it must be ignored)
+    run(parts, CHECKPOINT_AT + 40, 3, checkpoint_interval=CHECKPOINT_AT)
+    resumed_store, resumed_dice, resumed_metrics = run(parts, STEPS, 99,
+                                                       resume_file=os.path.join(parts, Config.CHECKPOINT_FILE))
+
+    for name in Metrics.COLUMNS:
+        assert numpy.array_equal(metrics[name], resumed_metrics[name]), name
+    for name, values in store.items():
+        assert numpy.array_equal(numpy.asarray(values), numpy.asarray(resumed_store[name])), name
+
+    assert [stream['name'] for stream in dice['streams']] == [stream['name'] for stream in resumed_dice['streams']]
+    for stream, resumed in zip(dice['streams'], resumed_dice['streams']):
+        assert numpy.array_equal(stream['values'], resumed['values'])
+    assert all(numpy.array_equal(numpy.asarray(a), numpy.asarray(b)) for a, b in zip(dice['rng'], resumed_dice['rng']))
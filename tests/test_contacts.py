@@ -0,0 +1,63 @@
+##########################################################
+#	File: test_contacts.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	The contacts kept by ContactTracker (only updated from the cells that moved)
+#	must be the same as finding every contact again from scratch (Contacts.contact_pairs).
+#
+##########################################################
+import numpy
+
+import Contacts
+import Headless
+
+class TrackerCheck(object):
+    # Runs before MainSteppable every MCS: brings its tracker up to date and compares it with a full scan
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.frequency = 1
+        self.main = None
+        self.checked = 0
+
+    def start(self):
+        pass
+
+    def step(self, mcs):
+        tracker = self.main.contacts
+        tracker.update(self)
+        tracked = tracker.pairs()
+        scanned = Contacts.contact_pairs(self)
+
+        assert numpy.array_equal(tracked.tcell_ids, scanned.tcell_ids)
+        assert numpy.array_equal(tracked.apc_ids, scanned.apc_ids)
+        assert numpy.array_equal(tracked.areas, scanned.areas)
+        self.checked += len(scanned)
+
+    def finish(self):
+        pass
+
+def test_tracker_matches_full_scan(tmp_path):
+    sim = Headless.HeadlessSimulator(steps=150, seed=5, output_dir=str(tmp_path), checkpoint_interval=0)
+    check = TrackerCheck(sim)
+    sim.registerSteppable(check)
+    Headless.register_steppables(sim)
+    check.main = sim.steppables[1]
+
+    sim.run()
+    assert check.checked > 0
+
+def test_tracker_survives_resume():
+    # The rows made again from a checkpoint list the same contacts
+    tracker = Contacts.ContactTracker()
+    tracker.add_rows(numpy.array([5, 3, 3]), numpy.array([1, 2, 1]), numpy.array([1.0, 2.0, 3.0]))
+    again = Contacts.ContactTracker()
+    again.resume(tracker.checkpoint())
+
+    rows = tracker.sorted_rows()
+    again_rows = again.sorted_rows()
+    assert numpy.array_equal(tracker.tcell_ids[rows], again.tcell_ids[again_rows])
+    assert numpy.array_equal(tracker.apc_ids[rows], again.apc_ids[again_rows])
+    assert numpy.array_equal(tracker.areas[rows], again.areas[again_rows])
+    assert tracker.tcell_ids[rows].tolist() == [3, 3, 5]
+    assert tracker.apc_ids[rows].tolist() == [1, 2, 1]
@@ -0,0 +1,50 @@
+##########################################################
+#	File: test_dice.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	The alias tables of Dice.py must pick every option as often as its weight divided by the sum of the weights.
+#
+##########################################################
+import numpy
+import pytest
+
+import Config
+from Dice import AliasTable
+from Dice import Dice
+
+DRAWS = 200000
+
+WEIGHTS = [
+    [Config.PROB_CTLA4_BIND_CD80, Config.PROB_CD28_BIND_CD80],
+    [Config.PROB_CTLA4_BIND_CD86, Config.PROB_CD28_BIND_CD86],
+    [1, 2, 3, 4],
+    # Don't have to add up to 1
+    [5.0, 0.5, 2.0, 0.0, 7.5],
+]
+
+def assert_frequencies(drawn, weights):
+    expected = numpy.asarray(weights, dtype=float) / sum(weights)
+    frequencies = numpy.bincount(drawn, minlength=len(weights)) / float(len(drawn))
+    # 5 standard deviations of a binomial frequency
+    tolerance = 5 * numpy.sqrt(expected * (1 - expected) / len(drawn))
+    assert numpy.all(numpy.abs(frequencies - expected) <= tolerance + 1e-12)
+
+@pytest.mark.parametrize('weights', WEIGHTS)
+def test_alias_table_frequencies(weights):
+    table = AliasTable(weights)
+    assert_frequencies(table.draw(numpy.random.RandomState(11), DRAWS), weights)
+
+@pytest.mark.parametrize('weights', WEIGHTS)
+def test_dice_choices_frequencies(weights):
+    # Many blocks, drawn a few at a time like the cells do
+    dice = Dice(block=1000, seed=12)
+    drawn = numpy.concatenate([dice.choices('test', weights, 7) for _ in range(DRAWS // 7)])
+    assert_frequencies(drawn, weights)
+
+def test_random_sample_uses_the_uniforms():
+    dice = Dice(block=16, seed=13)
+    other = Dice(block=16, seed=13)
+    sample = dice.random_sample((2, 5))
+    assert sample.shape == (2, 5)
+    assert numpy.array_equal(sample.ravel(), other.uniforms(10))
@@ -0,0 +1,58 @@
+##########################################################
+#	File: test_ensemble.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	The running mean and variance of Ensemble.Aggregate must match numpy over all the replicates at once,
+#	also when some replicates stopped early.
+#
+##########################################################
+import os
+
+import numpy
+
+import Ensemble
+import Metrics
+
+COLUMNS = ['TOTAL_AMOUNT_CD80', 'TOTAL_AMOUNT_CD86']
+
+def write_replicate(path, values):
+    writer = Metrics.MetricWriter(path, ['MCS'] + COLUMNS)
+    for mcs, row in enumerate(values):
+        writer.append(numpy.r_[mcs, row])
+    writer.close()
+    return Metrics.MetricReader(path)
+
+def test_aggregate_matches_numpy(tmp_path):
+    rng = numpy.random.RandomState(5)
+    replicates = [rng.poisson(1000, size=(50, len(COLUMNS))) * rng.random_sample() for index in range(7)]
+    # The last one stopped early, everything is cut where it stopped
+    replicates[-1] = replicates[-1][:40]
+
+    aggregate = Ensemble.Aggregate(COLUMNS)
+    for index, values in enumerate(replicates):
+        aggregate.add(write_replicate(str(tmp_path / ('replicate_' + str(index))), values))
+
+    values = numpy.stack([replicate[:40] for replicate in replicates])
+    assert aggregate.count == len(replicates)
+    assert numpy.array_equal(aggregate.mcs, numpy.arange(40))
+    assert numpy.allclose(aggregate.mean, values.mean(axis=0), rtol=1e-12)
+    assert numpy.allclose(aggregate.squares / (aggregate.count - 1), values.var(axis=0, ddof=1), rtol=1e-9)
+
+def test_saved_band(tmp_path):
+    aggregate = Ensemble.Aggregate(COLUMNS)
+    for index in range(3):
+        values = numpy.full((10, len(COLUMNS)), float(index))
+        aggregate.add(write_replicate(str(tmp_path / ('replicate_' + str(index))), values))
+
+    path = str(tmp_path / 'ensemble')
+    aggregate.save(path)
+    # Saving again swaps the folders
+    aggregate.save(path)
+    assert not os.path.exists(path + '.old') and not os.path.exists(path + '.tmp')
+
+    reader = Metrics.MetricReader(path)
+    assert numpy.allclose(reader.column('REPLICATES'), 3)
+    assert numpy.allclose(reader.column('TOTAL_AMOUNT_CD80_MEAN'), 1.0)
+    error = Ensemble.CONFIDENCE_Z * numpy.sqrt(1.0 / 3)
+    assert numpy.allclose(reader.column('TOTAL_AMOUNT_CD86_HIGH'), 1.0 + error)
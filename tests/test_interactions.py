@@ -0,0 +1,102 @@
+##########################################################
+#	File: test_interactions.py
+#	Author: Jose Perez <josegperez@mail.com>
+#	Version: Model v5
+#
+#	Binding the contacts on worker processes (see Interactions.py) must give exactly what binding them
+#	in one process gives: same CellStore, same dice left and same metrics.
+#
+##########################################################
+import os
+
+import numpy
+
+import Binding
+import Config
+import Headless
+import Interactions
+import Metrics
+from CellStore import CellStore
+from CellStore import STORE
+from CellTypes import State
+from Dice import DICE
+
+STEPS = 150
+
+def run(output_dir, workers, monkeypatch):
+    monkeypatch.setattr(Config, 'INTERACTION_WORKERS', workers)
+    # Every batch goes to the workers, however small
+    monkeypatch.setattr(Config, 'INTERACTION_MIN_CONTACTS', 1)
+    sim = Headless.HeadlessSimulator(steps=STEPS, seed=8, output_dir=output_dir, checkpoint_interval=0)
+    Headless.register_steppables(sim)
+    sim.run()
+
+    metrics = Metrics.MetricReader(os.path.join(output_dir, Config.METRICS_FILE))
+    columns = dict((name, numpy.array(metrics.column(name))) for name in Metrics.COLUMNS)
+    return STORE.checkpoint(), DICE.get_state(), columns
+
+def test_parallel_run_matches_serial_run(tmp_path, monkeypatch):
+    store, dice, metrics = run(str(tmp_path / 'serial'), 0, monkeypatch)
+    parallel_store, parallel_dice, parallel_metrics = run(str(tmp_path / 'parallel'), 3, monkeypatch)
+    # The store is back in our own memory once the run finished
+    assert STORE.folder is None
+
+    for name in Metrics.COLUMNS:
+        assert numpy.array_equal(metrics[name], parallel_metrics[name]), name
+    for name, values in store.items():
+        assert numpy.array_equal(numpy.asarray(values), numpy.asarray(parallel_store[name])), name
+
+    assert [stream['name'] for stream in dice['streams']] == [stream['name'] for stream in parallel_dice['streams']]
+    for stream, parallel in zip(dice['streams'], parallel_dice['streams']):
+        assert numpy.array_equal(stream['values'], parallel['values'])
+    assert all(numpy.array_equal(numpy.asarray(a), numpy.asarray(b)) for a, b in zip(dice['rng'], parallel_dice['rng']))
+
+def crowded_store(rng):
+    # Few APCs with many TCells each, waiting for co-activation
+    store = CellStore()
+    apc_ids = numpy.arange(1, 41)
+    tcell_ids = numpy.arange(100, 3100)
+    store.allocate_many(apc_ids)
+    slots = store.allocate_many(tcell_ids)
+    apcs = store.slots(apc_ids)
+    store.kind[apcs] = CellStore.APC
+    store.total_CD80[apcs] = rng.randint(0, 60, len(apcs))
+    store.total_CD86[apcs] = rng.randint(0, 60, len(apcs))
+    store.kind[slots] = CellStore.TCONV
+    store.state[slots] = State.AWAITING_COACTIVATION
+    store.total_CD28[slots] = rng.randint(0, 3, len(slots))
+    store.total_external_CTLA4[slots] = rng.randint(0, 3, len(slots))
+    return store, tcell_ids, rng.choice(apc_ids, len(tcell_ids))
+
+def test_parts_never_share_an_apc():
+    apcs = numpy.repeat(numpy.arange(10), numpy.arange(1, 11))
+    for parts in range(1, 15):
+        bounds = Interactions.partition(apcs, parts)
+        assert bounds[0] == 0 and bounds[-1] == len(apcs)
+        assert len(bounds) - 1 <= parts
+        assert all(apcs[cut - 1] != apcs[cut] for cut in bounds[1:-1])
+
+def test_kernel_matches_serial():
+    store, tcell_ids, apc_ids = crowded_store(numpy.random.RandomState(4))
+    tcell_ids, apc_ids, rank = Binding.group_contacts(tcell_ids, apc_ids)
+    tcell_slots = store.slots(tcell_ids)
+    apc_slots = store.slots(apc_ids)
+    dice = numpy.random.RandomState(5).random_sample((2, len(tcell_ids)))
+
+    before = store.checkpoint()
+    serial = Binding.bind_rounds(tcell_slots, apc_slots, rank, dice, 0.9, 0.8, store)
+    after_serial = store.checkpoint()
+
+    store.resume(before)
+    pool = Interactions.InteractionPool(4, minimum=1, store=store)
+    try:
+        parallel = pool.bind_rounds(tcell_slots, apc_slots, rank, dice, 0.9, 0.8, store)
+        after_parallel = store.checkpoint()
+    finally:
+        pool.close()
+
+    assert numpy.array_equal(serial[0], parallel[0])
+    assert numpy.array_equal(serial[1], parallel[1])
+    assert serial[2:] == parallel[2:]
+    for name in CellStore.FIELDS:
+        assert numpy.array_equal(after_serial[name], after_parallel[name]), name